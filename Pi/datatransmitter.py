@@ -7,6 +7,10 @@ Steps:
 3. Sign the data.
 4. Send a request to the API.
 
+If more than one file is stored (e.g. after a connectivity loss), the files are sent in batches of
+`batch_size` measurements with one signature per batch to `/insert_batch/`. APIs without this
+endpoint receive the files one by one.
+
 Configuration:
 The script reads configuration settings from a `config.json` file located in predefined paths.
 
@@ -19,7 +23,7 @@ Dependencies:
 - `json`, `os`, `glob`, `datetime`: Standard libraries for file handling and processing.
 """
 
-from psk_sign import sign_meas_data
+from psk_sign import sign_meas_data, sign_meas_batch
 from WmPiUtils import read_pi_config_from_json
 from datetime import datetime
 import os
@@ -72,7 +76,7 @@ def build_payload(meas_file):
     :rtype: dict
     """
 
-    data = read_json(meas)
+    data = read_json(meas_file)
     data['meas_point'] = config['name']
 
     pl = sign_meas_data(f"{os.path.abspath(config['psk_path'])}/private_key.pem", data)
@@ -98,16 +102,86 @@ def send_payload(pl):
     return r
 
 
+def build_batch_payload(meas_files):
+    """
+    Build one payload for several measurement files, signed with one signature.
+
+    :param meas_files: Paths to the measurement JSON files.
+    :type meas_files: list[str]
+    :return: Signed payload containing the list of measurement data.
+    :rtype: dict
+    """
+
+    data_list = []
+    for meas_file in meas_files:
+        data = read_json(meas_file)
+        data['meas_point'] = config['name']
+        data_list.append(data)
+
+    return sign_meas_batch(f"{os.path.abspath(config['psk_path'])}/private_key.pem", data_list, config['name'])
+
+
+def send_batch_payload(pl):
+    """
+    Send a signed batch payload to the API.
+
+    :param pl: The signed batch payload (see `build_batch_payload`).
+    :type pl: dict
+    :return: Response object from the HTTP POST request.
+    :rtype: requests.Response
+    """
+
+    headers = {
+        "Authorization": f"Bearer {config['token']}"
+    }
+    r = post(f"{config['api_url']}/insert_batch/", json=pl, headers=headers)
+    return r
+
+
+def send_batches(meas_files):
+    """
+    Send the measurement files in batches and remove the inserted files.
+
+    :param meas_files: Paths to the measurement JSON files.
+    :type meas_files: list[str]
+    :return: `False`, if the API does not provide `/insert_batch/`, otherwise `True`.
+    :rtype: bool
+    """
+
+    batch_size = config.get('batch_size', 100)
+    for i in range(0, len(meas_files), batch_size):
+        batch = meas_files[i:i + batch_size]
+        print(f"Send batch of {len(batch)} measurements to API...")
+        r = send_batch_payload(build_batch_payload(batch))
+        if r.status_code in (404, 405):
+            return False
+        if r.status_code != 200:
+            print (f"\tERROR: Data not send\n\t\tStatus code: {r.status_code} {r.text}")
+            continue
+        result = r.json()
+        print (f"\tstatus code: {r.status_code}, {result['inserted']} inserted, {result['rejected']} rejected")
+        for meas, item in zip(batch, result['items']):
+            if item['status'] == 'inserted':
+                os.remove(meas)
+            else:
+                print (f"\tERROR: {meas} not inserted: {item}")
+    return True
+
+
 if __name__ == '__main__':
     """
     Main execution flow:
     - List all measurement files in temporary storage.
-    - Build and sign a payload for each file.
-    - Send the payload to the API.
+    - Send several files in batches, if the API supports it.
+    - Otherwise build and sign a payload for each file and send the payload to the API.
     - If successful, remove the processed file; otherwise, log an error.
     """
 
-    for meas in list_files_from_storage():
+    meas_files = sorted(list_files_from_storage())
+    if len(meas_files) > 1:
+        meas_files = [] if send_batches(meas_files) else sorted(list_files_from_storage())
+
+    for meas in meas_files:
         payload = build_payload(meas)
         print(f"Send data from '{payload['data']['sensor_name']}' at {datetime.fromisoformat(payload['data']['datetime']).strftime('%Y-%m-%d %H:%M:%S')} to API...")
         r = send_payload(payload)
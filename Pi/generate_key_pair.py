@@ -5,7 +5,8 @@ Key Management Script
 This script provides functionality for managing public and private key pairs. It includes:
 1. Reading configuration data from a JSON file.
 2. Creating a directory for storing pre-shared keys (PSK) if it does not exist.
-3. Generating RSA key pairs and saving them to the specified PSK directory.
+3. Generating Ed25519 or RSA key pairs and saving them to the specified PSK directory.
+   The type is set by `key_type` (`ed25519` or `rsa`) in the configuration file.
 4. Converting the public key to SSH format for usage in authorized keys files.
 
 Dependencies:
@@ -16,7 +17,7 @@ Dependencies:
 """
 
 
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import load_pem_public_key
 import json
@@ -34,17 +35,18 @@ def read_config_json():
     """
     Read configuration data from the JSON file.
 
-    This function reads the PSK path and name from the configuration file.
+    This function reads the PSK path, the name and the key type from the configuration file.
+    The key type defaults to `rsa`.
 
-    :return: A tuple containing the PSK path and name.
-    :rtype: tuple[str, str]
+    :return: A tuple containing the PSK path, name and key type.
+    :rtype: tuple[str, str, str]
     :raises FileNotFoundError: If the configuration file does not exist.
     :raises json.JSONDecodeError: If the configuration file is not valid JSON.
     """
 
     with open(config_json_path) as f:
         d = json.load(f)
-    return d["psk_path"], d["name"]
+    return d["psk_path"], d["name"], d.get("key_type", "rsa")
 
 def create_psk_path_if_not_exists(psk_path):
     """
@@ -58,22 +60,33 @@ def create_psk_path_if_not_exists(psk_path):
         os.makedirs(psk_path)
         print (f"\t {psk_path} created")
 
-def generate_key_pair(psk_path, key_size=2048):
+def generate_key_pair(psk_path, key_size=2048, key_type="rsa"):
     """
-    Generate an RSA key pair and save them to the PSK directory.
+    Generate an Ed25519 or RSA key pair and save them to the PSK directory.
 
     The private key is saved as `private_key.pem`, and the public key as `public_key.pem`.
+    RSA is the default. Ed25519 is opt-in: it signs much faster on the measurement point, but
+    the API verifies Ed25519 signatures slower than RSA signatures (see benchmark_signatures.py).
+    The API accepts both types, so measurement points with RSA and Ed25519 keys can be mixed.
 
     :param psk_path: The directory where the keys will be saved.
     :type psk_path: str
-    :param key_size: The size of the RSA key in bits. Default is 2048.
+    :param key_size: The size of the RSA key in bits. Default is 2048. Not used for Ed25519.
     :type key_size: int
+    :param key_type: The type of the key, `rsa` or `ed25519`. Default is `rsa`.
+    :type key_type: str
+    :raises ValueError: If the key type is not supported.
     """
 
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=key_size
-    )
+    if key_type == "ed25519":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    elif key_type == "rsa":
+        private_key = rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=key_size
+        )
+    else:
+        raise ValueError(f"Unsupported key type: {key_type}")
 
 
     private_pem = private_key.private_bytes(
@@ -120,7 +133,7 @@ def convert_to_ssh_format(public_key_path, name ):
     print(f"{ssh_key} {name}")
 
 if __name__ == "__main__":
-    psk_path,name = read_config_json()
+    psk_path, name, key_type = read_config_json()
     create_psk_path_if_not_exists(psk_path)
-    generate_key_pair(psk_path)
+    generate_key_pair(psk_path, key_type=key_type)
     convert_to_ssh_format(psk_path, name)
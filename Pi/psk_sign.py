@@ -2,26 +2,32 @@
 Digital Signature Module
 ========================
 
-This module provides functionality for signing measurement data using a private RSA key.
+This module provides functionality for signing measurement data using a private RSA or Ed25519 key.
 It includes functions to load a private key from a file and to generate a digital signature
-for a given dataset.
+for a given dataset. RSA is the default key type, Ed25519 keys (opt-in) are much cheaper to sign
+with on a Raspberry Pi.
 """
 
 from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from cryptography.hazmat.primitives import hashes, serialization
+import functools
 import json
 import base64
 
+@functools.lru_cache(maxsize=4)
 def get_priv_key_from_file(file_path):
     """
     Load a private key from a PEM file.
 
     This function reads a PEM-encoded private key from a specified file and loads it into memory.
+    The key is loaded once per process, as loading (and checking) an RSA key costs more than signing.
 
     :param file_path: The path to the PEM file containing the private key.
     :type file_path: str
     :return: The loaded private key.
-    :rtype: cryptography.hazmat.primitives.asymmetric.rsa.RSAPrivateKey
+    :rtype: cryptography.hazmat.primitives.asymmetric.rsa.RSAPrivateKey or
+        cryptography.hazmat.primitives.asymmetric.ed25519.Ed25519PrivateKey
     :raises ValueError: If the file is not a valid PEM private key file.
     :raises TypeError: If the key format is unsupported.
     :raises Exception: For other errors during key loading.
@@ -33,14 +39,32 @@ def get_priv_key_from_file(file_path):
         )
     return private_key
 
+def sign_message(private_key, message):
+    """
+    Sign a message with Ed25519 or with RSA-PSS and SHA-256, depending on the type of the private key.
+
+    :param private_key: The private key (see `get_priv_key_from_file`).
+    :param message: The message to be signed.
+    :type message: bytes
+    :return: The signature.
+    :rtype: bytes
+    """
+    if isinstance(private_key, Ed25519PrivateKey):
+        return private_key.sign(message)
+    return private_key.sign(
+        message,
+        padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+        hashes.SHA256()
+    )
+
 def sign_meas_data(priv_key_file, data):
     """
-    Sign measurement data using a private RSA key.
+    Sign measurement data using a private RSA or Ed25519 key.
 
     This function generates a digital signature for the given data using a private key loaded
     from the specified file. The data and its corresponding signature are returned as a dictionary.
 
-    :param priv_key_file: The path to the PEM file containing the private RSA key.
+    :param priv_key_file: The path to the PEM file containing the private RSA or Ed25519 key.
     :type priv_key_file: str
     :param data: The measurement data to be signed. It must be serializable to JSON.
     :type data: dict
@@ -52,15 +76,39 @@ def sign_meas_data(priv_key_file, data):
     """
     private_key = get_priv_key_from_file(priv_key_file)
     message = json.dumps(data).encode("utf-8")
-    signature = private_key.sign(
-        message,
-        padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
-        hashes.SHA256()
-    )
+    signature = sign_message(private_key, message)
 
     payload = {
         "data": data,
         "client_id": data["meas_point"],
         "signature": base64.b64encode(signature).decode("utf-8")
     }
-    return payload
\ No newline at end of file
+    return payload
+
+
+def sign_meas_batch(priv_key_file, data_list, client_id):
+    """
+    Sign a batch of measurement data with one signature.
+
+    The signature covers the whole list, so the API verifies the batch with a single
+    verification (see `/insert_batch/`).
+
+    :param priv_key_file: The path to the PEM file containing the private RSA or Ed25519 key.
+    :type priv_key_file: str
+    :param data_list: The measurement data to be signed. It must be serializable to JSON.
+    :type data_list: list[dict]
+    :param client_id: The name of the measurement point.
+    :type client_id: str
+    :return: A dictionary containing the list of data, the client id and the signature in base64 format.
+    :rtype: dict
+    """
+    private_key = get_priv_key_from_file(priv_key_file)
+    message = json.dumps(data_list).encode("utf-8")
+    signature = sign_message(private_key, message)
+
+    payload = {
+        "data": data_list,
+        "client_id": client_id,
+        "signature": base64.b64encode(signature).decode("utf-8")
+    }
+    return payload
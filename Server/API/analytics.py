@@ -0,0 +1,828 @@
+"""
+Module Name: Wassermonitor2 API analytics functions
+
+Description:
+    This file provides the signal processing functions for the wassermonitor API.
+
+    It includes functions for:
+        - Estimating the value and the quality of a measurement from its raw values.
+        - Converting measurement timestamps into hours.
+        - Calculating the derivation (fill rate) of a measurement series.
+        - Smoothing the derivation and marking its peaks.
+        - Resampling a measurement series onto a uniform time grid.
+        - Downsampling a measurement series to a point budget (Largest-Triangle-Three-Buckets).
+        - Detecting refill and consumption events.
+        - Forecasting the time until the water level crosses its thresholds.
+        - Calculating the night-time baseline consumption and detecting leaks.
+        - Distributing the calculation of many series over a process pool.
+
+Dependencies:
+    - numpy
+    - pandas
+    - scipy.signal (for signale processing)
+    - concurrent.futures, multiprocessing.shared_memory (for the process pool)
+
+    numpy, pandas and scipy.signal are imported on first use (see `lazy`), so the modules, which only
+    use the constants and the functions of the insert path, start without them.
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import multiprocessing
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+
+import lazy
+
+np = lazy.LazyModule('numpy')
+pd = lazy.LazyModule('pandas')
+signal = lazy.LazyModule('scipy.signal')
+
+# Outlier rejection: raw values further than OUTLIER_MAD_FACTOR * max(MAD, OUTLIER_MIN_MAD)
+# from the median are rejected (cm)
+OUTLIER_MAD_FACTOR = 3.5
+OUTLIER_MIN_MAD = 0.1
+# Quality of a measurement. Suspect: values rejected or spread above QUALITY_MAX_SPREAD (cm),
+# bad: less than half of the raw values usable
+QUALITY_BAD = 0
+QUALITY_SUSPECT = 1
+QUALITY_GOOD = 2
+QUALITY_MAX_SPREAD = 1.0
+
+# Parameters of the Savitzky-Golay filter applied to the derivation
+SAVGOL_WINDOW = 10
+SAVGOL_POLYORDER = 3
+# Series with less samples are not smoothed at all
+SAVGOL_MIN_SAMPLES = 100
+# Minimal height of a derivation peak (cm/h)
+PEAK_HEIGHT = 10
+# Rows in front of new data, which have to be recalculated on incremental updates
+DERIVED_CONTEXT_ROWS = 2 * SAVGOL_WINDOW
+# Minimal smoothed derivation of a refill and maximal derivation of a consumption (cm/h)
+EVENT_REFILL_RATE = PEAK_HEIGHT
+EVENT_CONSUMPTION_RATE = -1.0
+# Minimal number of samples of an event
+EVENT_MIN_SAMPLES = 3
+# Forecast: regression window, minimal samples/duration and maximal samples of the regression
+FORECAST_WINDOW_HOURS = 6
+FORECAST_MIN_SAMPLES = 10
+FORECAST_MIN_HOURS = 0.5
+FORECAST_MAX_SAMPLES = 120
+# Leak detection: minimal number of hourly level drops of a night baseline
+NIGHT_MIN_HOURS = 2
+
+# Process pool for large requests (see start_pool)
+_pool = None
+_pool_min_rows = 0
+DERIVATION_METRICS_KEYS = ('derivation', 'derivation_10', 'peaks_pos', 'peaks_neg')
+
+
+def robust_estimate_many(values):
+    """
+    Estimates the value, the spread and the quality of many measurements from their raw values.
+
+    Each measurement carries several raw values of a sensor. Raw values of exactly `0.0` are
+    read errors of the Pi and are ignored. Raw values further than `OUTLIER_MAD_FACTOR` times the
+    median absolute deviation (at least `OUTLIER_MIN_MAD`) from the median are rejected. The value
+    is the mean and the spread the standard deviation of the remaining raw values. All measurements
+    are calculated at once on a NaN padded matrix.
+
+    :param values: A list with the raw values of each measurement.
+    :type values: list
+
+    :returns: A dictionary with the arrays `value`, `spread` (`NaN` if nothing is left), `rejected`
+        (number of unused raw values) and `quality` (`QUALITY_GOOD`, `QUALITY_SUSPECT` or `QUALITY_BAD`).
+    :rtype: dict
+
+    **Example usage**::
+
+        robust_estimate_many([[31.3, 31.4, 0.0, 31.3, 31.4], [31.3, 31.4, 31.3, 31.4, 60.0]])
+        # {'value': array([31.35, 31.35]), 'spread': array([0.05, 0.05]),
+        #  'rejected': array([1, 1]), 'quality': array([1, 1])}
+    """
+    lengths = np.array([len(v) for v in values], dtype=np.int64)
+    raw = np.full((len(values), max(lengths.max(initial=0), 1)), np.nan)
+    for i, v in enumerate(values):
+        raw[i, :len(v)] = v
+    raw[raw == 0.0] = np.nan
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(raw, axis=1, keepdims=True)
+        mad = 1.4826 * np.nanmedian(np.abs(raw - median), axis=1, keepdims=True)
+    tolerance = OUTLIER_MAD_FACTOR * np.fmax(mad, OUTLIER_MIN_MAD)
+    inlier = np.abs(raw - median) <= tolerance
+
+    count = inlier.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = np.where(inlier, raw, 0.0).sum(axis=1) / count
+        spread = np.sqrt(np.where(inlier, (raw - value[:, None]) ** 2, 0.0).sum(axis=1) / count)
+    rejected = lengths - count
+
+    quality = np.full(len(values), QUALITY_GOOD)
+    quality[(rejected > 0) | (spread > QUALITY_MAX_SPREAD)] = QUALITY_SUSPECT
+    quality[(count == 0) | (2 * count < lengths)] = QUALITY_BAD
+    return {'value': value, 'spread': spread, 'rejected': rejected, 'quality': quality}
+
+
+def robust_estimate(values):
+    """
+    Estimates the value, the spread and the quality of one measurement (see `robust_estimate_many`).
+
+    :param values: The raw values of the measurement.
+    :type values: list
+
+    :returns: A dictionary with `value`, `spread` (`None` if no raw value is usable), `rejected` and `quality`.
+    :rtype: dict
+
+    **Example usage**::
+
+        robust_estimate([31.3, 31.4, 0.0, 31.3, 31.4])
+        # {'value': 31.35, 'spread': 0.05, 'rejected': 1, 'quality': 1}
+    """
+    result = robust_estimate_many([values])
+    value = float(result['value'][0])
+    spread = float(result['spread'][0])
+    return {
+        'value': None if np.isnan(value) else value,
+        'spread': None if np.isnan(spread) else spread,
+        'rejected': int(result['rejected'][0]),
+        'quality': int(result['quality'][0]),
+    }
+
+
+def to_hours(dt):
+    """
+    Converts a sequence of timestamps into hours since epoch.
+
+    :param dt: Timestamps as datetime objects or ISO formatted strings.
+    :type dt: list or pd.Series
+
+    :returns: The timestamps in hours since 1970-01-01 UTC.
+    :rtype: np.ndarray
+
+    **Example usage**::
+
+        hours = to_hours(['2024-12-15 10:00:00+00:00', '2024-12-15 10:30:00+00:00'])
+        # array([482890. , 482890.5])
+    """
+    ts = pd.to_datetime(pd.Series(dt), utc=True, format='ISO8601')
+    return ((ts - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(hours=1)).to_numpy(dtype=float)
+
+
+def to_hour(dt):
+    """
+    Converts a single timestamp into hours since epoch (see `to_hours`).
+
+    This avoids the overhead of pandas on the insert path. Timestamps without timezone are UTC.
+
+    :param dt: The timestamp as datetime object or ISO formatted string.
+    :type dt: datetime or str
+
+    :returns: The timestamp in hours since 1970-01-01 UTC.
+    :rtype: float
+
+    **Example usage**::
+
+        to_hour('2024-12-15 10:30:00+00:00')
+        # 482890.5
+    """
+    if isinstance(dt, str):
+        dt = datetime.fromisoformat(dt)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp() / 3600.0
+
+
+def compute_derivation_metrics(hours, meas_val, smooth=None):
+    """
+    Calculates the derivation, the smoothed derivation and its peaks for one sensor series.
+
+    The derivation is calculated as `-gradient(meas_val) / gradient(hours)`, so a positive
+    derivation means a rising water level. The smoothed derivation (`derivation_10`) is
+    calculated with a Savitzky-Golay filter. Peaks of the derivation higher than
+    `PEAK_HEIGHT` are marked with the value of the smoothed derivation.
+
+    :param hours: Timestamps of the series in hours (see `to_hours`), sorted ascending.
+    :type hours: np.ndarray
+
+    :param meas_val: Measured distances of the series.
+    :type meas_val: np.ndarray
+
+    :param smooth: Apply the Savitzky-Golay filter. If `None`, the filter is only applied
+        to series with more than `SAVGOL_MIN_SAMPLES` samples.
+    :type smooth: bool, optional
+
+    :returns: A dictionary with the arrays `derivation`, `derivation_10`, `peaks_pos` and
+        `peaks_neg`. Samples without a peak are `NaN` in the peak arrays.
+    :rtype: dict
+
+    **Example usage**::
+
+        metrics = compute_derivation_metrics(to_hours(df['dt']), df['meas_val'].to_numpy())
+        df['derivation'] = metrics['derivation']
+    """
+    hours = np.asarray(hours, dtype=float)
+    meas_val = np.asarray(meas_val, dtype=float)
+    n = len(meas_val)
+    if smooth is None:
+        smooth = n > SAVGOL_MIN_SAMPLES
+
+    try:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            derivation = -np.gradient(meas_val) / np.gradient(hours)
+        if smooth:
+            derivation_10 = signal.savgol_filter(derivation, SAVGOL_WINDOW, SAVGOL_POLYORDER)
+        else:
+            derivation_10 = np.zeros(n)
+    except ValueError as e:
+        print(f"WARNING: Value Error: {e}")
+        derivation = np.zeros(n)
+        derivation_10 = np.zeros(n)
+
+    peaks_pos = np.full(n, np.nan)
+    peaks_neg = np.full(n, np.nan)
+    try:
+        inds = signal.find_peaks(derivation, height=PEAK_HEIGHT)[0]
+        inds_neg = signal.find_peaks(0 - derivation, height=PEAK_HEIGHT)[0]
+        peaks_pos[inds] = derivation_10[inds]
+        peaks_neg[inds_neg] = derivation_10[inds_neg]
+    except ValueError as e:
+        print(f"Value Error:\t{e}")
+
+    return {
+        'derivation': derivation,
+        'derivation_10': derivation_10,
+        'peaks_pos': peaks_pos,
+        'peaks_neg': peaks_neg,
+    }
+
+
+def start_pool(size, min_rows):
+    """
+    Starts the process pool for `compute_derivation_metrics_many`.
+
+    :param size: The number of worker processes.
+    :type size: int
+
+    :param min_rows: Requests with less rows in total are calculated in the calling process,
+        because dispatching them costs more than it saves.
+    :type min_rows: int
+    """
+    global _pool, _pool_min_rows
+    stop_pool()
+    _pool = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context('spawn'))
+    _pool_min_rows = min_rows
+
+
+def stop_pool():
+    """
+    Shuts down the process pool, if it is running.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def _attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: spawned workers share the resource tracker of the API process,
+        # which unlinks the block, so registering it again does no harm
+        return shared_memory.SharedMemory(name=name)
+
+
+def _derivation_metrics_worker(in_name, out_name, total, offset, length, smooth):
+    """
+    Calculates `compute_derivation_metrics` for one series in a worker process.
+
+    The input block holds all `hours` followed by all `meas_val` of the request, the output
+    block holds the four metrics of all series. Only `[offset, offset + length)` is used.
+    """
+    shm_in = _attach_shared_memory(in_name)
+    shm_out = _attach_shared_memory(out_name)
+    try:
+        inputs = np.ndarray((2, total), dtype=np.float64, buffer=shm_in.buf)
+        outputs = np.ndarray((len(DERIVATION_METRICS_KEYS), total), dtype=np.float64, buffer=shm_out.buf)
+        metrics = compute_derivation_metrics(
+            inputs[0, offset:offset + length], inputs[1, offset:offset + length], smooth
+        )
+        for i, k in enumerate(DERIVATION_METRICS_KEYS):
+            outputs[i, offset:offset + length] = metrics[k]
+        del inputs, outputs
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+def compute_derivation_metrics_many(series, smooth=None):
+    """
+    Calculates `compute_derivation_metrics` for many series.
+
+    If the process pool is running (see `start_pool`) and the series have at least `min_rows` rows
+    in total, each series is calculated in a worker process. The arrays are transferred through
+    shared memory, only offsets are sent to the workers. Otherwise the series are calculated
+    in the calling process.
+
+    :param series: A list of `(hours, meas_val)` tuples of arrays. A third element overrides
+        `smooth` for this series.
+    :type series: list
+
+    :param smooth: See `compute_derivation_metrics`.
+    :type smooth: bool, optional
+
+    :returns: A list of metric dictionaries in the order of `series`.
+    :rtype: list
+
+    **Example usage**::
+
+        start_pool(4, 100000)
+        results = compute_derivation_metrics_many([(hours_a, meas_val_a), (hours_b, meas_val_b)])
+    """
+    series = [(x[0], x[1], x[2] if len(x) > 2 else smooth) for x in series]
+    lengths = [len(x[1]) for x in series]
+    total = sum(lengths)
+    if _pool is None or len(series) < 2 or total < _pool_min_rows:
+        return [compute_derivation_metrics(h, v, sm) for h, v, sm in series]
+
+    shm_in = shared_memory.SharedMemory(create=True, size=max(2 * total * 8, 1))
+    shm_out = shared_memory.SharedMemory(create=True, size=max(len(DERIVATION_METRICS_KEYS) * total * 8, 1))
+    try:
+        inputs = np.ndarray((2, total), dtype=np.float64, buffer=shm_in.buf)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        for (h, v, _), offset, length in zip(series, offsets, lengths):
+            inputs[0, offset:offset + length] = h
+            inputs[1, offset:offset + length] = v
+        futures = [
+            _pool.submit(_derivation_metrics_worker, shm_in.name, shm_out.name, total, int(o), n, x[2])
+            for x, o, n in zip(series, offsets, lengths)
+        ]
+        for f in futures:
+            f.result()
+        outputs = np.ndarray((len(DERIVATION_METRICS_KEYS), total), dtype=np.float64, buffer=shm_out.buf)
+        results = [
+            {k: outputs[i, o:o + n].copy() for i, k in enumerate(DERIVATION_METRICS_KEYS)}
+            for o, n in zip(offsets, lengths)
+        ]
+        del inputs, outputs
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+    return results
+
+
+def resample_series(series, step_minutes, dt_begin, dt_end, derivation=True):
+    """
+    Resamples the measurements of one sensor onto a uniform time grid and calculates the
+    derived metrics on this grid.
+
+    The grid covers `dt_begin` to `dt_end` with bins of `step_minutes`, aligned to multiples of
+    the step since epoch, so all sensors of a request get the same grid. Each bin holds the mean
+    of `meas_val` and the last sensor configuration of its samples. Bins without samples are
+    marked with `gap = True` and `meas_val = NaN`. The derivation is calculated for each
+    run of bins without gaps (see `compute_derivation_metrics`); runs longer than
+    `SAVGOL_WINDOW` bins are smoothed, because the filter is valid on a uniform grid.
+    The derived metrics of single bins between gaps are `NaN`.
+
+    :param series: The measurements of one sensor with the columns `mid`, `dt`, `mpName`, `sensorId`,
+        `max_val`, `warn`, `alarm`, `meas_val` and `tank_height` (see `database_utils.get_meas_data_from_sqlite_db`).
+    :type series: pd.DataFrame
+
+    :param step_minutes: The width of the bins in minutes.
+    :type step_minutes: int
+
+    :param dt_begin: Start of the grid.
+    :type dt_begin: datetime
+
+    :param dt_end: End of the grid.
+    :type dt_end: datetime
+
+    :param derivation: Calculate the derived metrics. If `False`, they are `NaN` and can be
+        calculated for many grids at once with `add_grid_derivation_metrics`.
+    :type derivation: bool, optional
+
+    :returns: One row per bin with the columns of `series` (`dt` is the beginning of the bin),
+        the derived metrics and `gap`.
+    :rtype: pd.DataFrame
+
+    **Example usage**::
+
+        grid = resample_series(df[df['sensorId'] == 'left_tank'], 5, datetime(2024, 12, 1), datetime(2024, 12, 2))
+    """
+    step = step_minutes / 60.0
+    bins = np.floor(to_hours(series['dt']) / step).astype(np.int64)
+    grid_begin, grid_end = np.floor(to_hours([dt_begin, dt_end]) / step).astype(np.int64)
+    grid = np.arange(grid_begin, grid_end + 1)
+
+    config_columns = ['mid', 'mpName', 'sensorId', 'max_val', 'warn', 'alarm', 'tank_height']
+    binned = series.assign(bin=bins).groupby('bin').agg(
+        meas_val=('meas_val', 'mean'),
+        **{c: (c, 'last') for c in config_columns}
+    )
+    binned = binned.reindex(grid)
+    gap = binned['meas_val'].isna().to_numpy()
+    binned[config_columns[1:]] = binned[config_columns[1:]].ffill().bfill()
+
+    hours = grid * step
+    meas_val = binned['meas_val'].to_numpy(dtype=float)
+    metrics = {k: np.full(len(grid), np.nan) for k in DERIVATION_METRICS_KEYS}
+
+    output = pd.DataFrame({
+        'mid': binned['mid'].to_numpy(),
+        'dt': pd.to_datetime(grid * round(step_minutes * 60), unit='s', utc=True).strftime('%Y-%m-%d %H:%M:%S+00:00'),
+        'mpName': binned['mpName'].to_numpy(),
+        'sensorId': binned['sensorId'].to_numpy(),
+        'max_val': binned['max_val'].to_numpy(),
+        'warn': binned['warn'].to_numpy(),
+        'alarm': binned['alarm'].to_numpy(),
+        'meas_val': meas_val,
+        'tank_height': binned['tank_height'].to_numpy(),
+        **metrics,
+        'gap': gap,
+    })
+    if derivation:
+        add_grid_derivation_metrics([output])
+    return output
+
+
+def add_grid_derivation_metrics(grids):
+    """
+    Calculates the derived metrics of resampled series (see `resample_series`) in place.
+
+    The metrics are calculated for each run of bins without gaps. The runs of all grids are
+    calculated at once with `compute_derivation_metrics_many`.
+
+    :param grids: The resampled series.
+    :type grids: list
+    """
+    segments = []
+    for g, grid in enumerate(grids):
+        hours = to_hours(grid['dt'])
+        meas_val = grid['meas_val'].to_numpy(dtype=float)
+        begins, ends = _find_runs(~grid['gap'].to_numpy(dtype=bool))
+        for b, e in zip(begins, ends + 1):
+            if e - b >= 2:
+                segments.append((g, b, e, hours[b:e], meas_val[b:e]))
+
+    results = compute_derivation_metrics_many(
+        [(h, v, e - b > SAVGOL_WINDOW) for _, b, e, h, v in segments]
+    )
+    for (g, b, e, _, _), metrics in zip(segments, results):
+        for k in DERIVATION_METRICS_KEYS:
+            grids[g].loc[b:e - 1, k] = metrics[k]
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Selects the points of a series, which represent its shape best (Largest-Triangle-Three-Buckets).
+
+    The first and the last point are kept. The other points are split into `n_out - 2` buckets and
+    from each bucket the point is selected, which spans the largest triangle with the point selected
+    from the bucket before and the average of the bucket after. The triangle areas are prepared for
+    all buckets at once, so only the choice of the point remains sequential.
+
+    :param x: The x values of the series, sorted ascending.
+    :type x: np.ndarray
+    :param y: The y values of the series without `NaN`.
+    :type y: np.ndarray
+    :param n_out: The number of points to select.
+    :type n_out: int
+
+    :returns: The sorted indices of the selected points.
+    :rtype: np.ndarray
+
+    **Example usage**::
+
+        idx = lttb_indices(hours, meas_val, 1000)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    starts = (np.arange(n_out - 2) * every).astype(np.int64) + 1
+    ends = np.append(starts[1:], n - 1)
+    # Averages of the following bucket, the last bucket is followed by the last point
+    lengths = ends - starts
+    cx = np.append(np.add.reduceat(x[:n - 1], starts)[1:] / lengths[1:], x[-1])
+    cy = np.append(np.add.reduceat(y[:n - 1], starts)[1:] / lengths[1:], y[-1])
+
+    idx = starts[:, None] + np.arange(lengths.max())
+    valid = idx < ends[:, None]
+    idx = np.where(valid, idx, starts[:, None])
+    bx, by = x[idx], y[idx]
+    # Area of the triangle (a, b, c) is |ax * p + ay * q + r| / 2
+    p = by - cy[:, None]
+    q = cx[:, None] - bx
+    r = bx * cy[:, None] - cx[:, None] * by
+    p[~valid] = q[~valid] = 0.0
+    r[~valid] = 0.0
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        j = np.argmax(np.abs(x[a] * p[i] + y[a] * q[i] + r[i]))
+        a = idx[i, j]
+        selected[i + 1] = a
+    return selected
+
+
+def _largest(indices, weights, count):
+    """
+    Returns the `count` indices with the largest weights, sorted ascending.
+    """
+    if len(indices) <= count:
+        return indices
+    return np.sort(indices[np.argsort(weights, kind='stable')[::-1][:count]])
+
+
+def downsample_series(series, max_points):
+    """
+    Downsamples the series of one sensor to at most `max_points` rows.
+
+    A quarter of the budget is reserved for the rows marked as peak (`peaks_pos` or `peaks_neg`, the most
+    prominent first) and a quarter for the first row of each gap without value (the longest gaps first).
+    The rest of the budget is split between `lttb_indices` on the measured value and on the smoothed
+    derivation, so refills and peaks of both charts are preserved.
+
+    :param series: The rows of one sensor sorted by `dt` with the columns `dt`, `meas_val`, `derivation_10`,
+        `peaks_pos` and `peaks_neg`.
+    :type series: pd.DataFrame
+    :param max_points: The point budget of the series.
+    :type max_points: int
+
+    :returns: The selected rows.
+    :rtype: pd.DataFrame
+
+    **Example usage**::
+
+        small = downsample_series(series, 2000)
+    """
+    if not max_points or len(series) <= max_points:
+        return series
+    hours = to_hours(series['dt'])
+    peaks = np.fmax(series['peaks_pos'].abs().to_numpy(dtype=float), series['peaks_neg'].abs().to_numpy(dtype=float))
+    peak_rows = np.flatnonzero(~np.isnan(peaks))
+    gap_starts, gap_ends = _find_runs(series['meas_val'].isna().to_numpy())
+    keep = [
+        _largest(peak_rows, peaks[peak_rows], max_points // 4),
+        _largest(gap_starts, gap_ends - gap_starts, max_points // 4),
+    ]
+    budget = max_points - len(keep[0]) - len(keep[1])
+    for column, n_out in (('meas_val', budget - budget // 2), ('derivation_10', budget // 2)):
+        values = series[column].to_numpy(dtype=float)
+        known = np.flatnonzero(~np.isnan(values))
+        if n_out >= 3:
+            keep.append(known[lttb_indices(hours[known], values[known], n_out)])
+        else:
+            keep.append(known[np.linspace(0, len(known) - 1, min(n_out, len(known))).astype(np.int64)])
+    return series.iloc[np.unique(np.concatenate(keep))].reset_index(drop=True)
+
+
+def _find_runs(mask):
+    """
+    Finds the runs of consecutive `True` values in a boolean array.
+
+    :returns: Two arrays with the first and the last index of each run.
+    :rtype: tuple
+    """
+    edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+
+def detect_events(hours, level, rate):
+    """
+    Detects refill and consumption events in a sensor series.
+
+    A refill is a run of samples with a rate of at least `EVENT_REFILL_RATE`, a consumption
+    is a run of samples with a rate of at most `EVENT_CONSUMPTION_RATE`. Runs with less than
+    `EVENT_MIN_SAMPLES` samples are ignored. Since the derivation is calculated with central
+    differences, each run is extended by one sample on both sides to get the full level change.
+
+    :param hours: Timestamps of the series in hours (see `to_hours`), sorted ascending.
+    :type hours: np.ndarray
+
+    :param level: The water level (`tank_height - meas_val`) of the series.
+    :type level: np.ndarray
+
+    :param rate: The smoothed derivation (`derivation_10`) of the series in cm/h.
+    :type rate: np.ndarray
+
+    :returns: A list of events sorted by their beginning. Each event is a dictionary with the keys
+        `event_type` (`'refill'` or `'consumption'`), `begin` and `end` (indices into the series),
+        `value_begin`, `value_end`, `volume` (level difference in cm) and `rate` (cm/h).
+    :rtype: list
+
+    **Example usage**::
+
+        events = detect_events(to_hours(df['dt']), df['value'].to_numpy(), df['derivation_10'].to_numpy())
+    """
+    hours = np.asarray(hours, dtype=float)
+    level = np.asarray(level, dtype=float)
+    rate = np.nan_to_num(np.asarray(rate, dtype=float))
+
+    events = []
+    for event_type, mask in (
+        ('refill', rate >= EVENT_REFILL_RATE),
+        ('consumption', rate <= EVENT_CONSUMPTION_RATE),
+    ):
+        begins, ends = _find_runs(mask)
+        keep = ends - begins + 1 >= EVENT_MIN_SAMPLES
+        begins = np.maximum(begins[keep] - 1, 0)
+        ends = np.minimum(ends[keep] + 1, len(level) - 1)
+        volumes = level[ends] - level[begins]
+        durations = hours[ends] - hours[begins]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where(durations > 0, volumes / durations, np.nan)
+        for i in range(len(begins)):
+            events.append({
+                'event_type': event_type,
+                'begin': int(begins[i]),
+                'end': int(ends[i]),
+                'value_begin': float(level[begins[i]]),
+                'value_end': float(level[ends[i]]),
+                'volume': round(float(volumes[i]), 1),
+                'rate': None if np.isnan(rates[i]) else round(float(rates[i]), 2),
+            })
+    events.sort(key=lambda e: e['begin'])
+    return events
+
+
+def theil_sen(x, y):
+    """
+    Calculates a robust linear regression (Theil-Sen estimator).
+
+    The slope is the median of the slopes between all pairs of samples, the intercept is the
+    median of `y - slope * x`. Single outliers (e.g. failed sensor readings) do not influence
+    the result. The pairs are built vectorized, so the cost grows with `len(x) ** 2`.
+
+    :param x: The x values.
+    :type x: np.ndarray
+
+    :param y: The y values.
+    :type y: np.ndarray
+
+    :returns: The slope and the intercept or `(nan, nan)`, if there are no two different x values.
+    :rtype: tuple
+
+    **Example usage**::
+
+        slope, intercept = theil_sen(np.array([0., 1., 2., 3.]), np.array([10., 9., 100., 7.]))
+        # (-1.0, 10.0)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    i, j = np.triu_indices(len(x), k=1)
+    dx = x[j] - x[i]
+    valid = dx != 0
+    if not valid.any():
+        return np.nan, np.nan
+    slope = np.median((y[j] - y[i])[valid] / dx[valid])
+    intercept = np.median(y - slope * x)
+    return float(slope), float(intercept)
+
+
+def forecast_crossings(hours, level, thresholds):
+    """
+    Forecasts when the water level will cross the given thresholds.
+
+    Only the consumption since the highest level in the given window (usually the end of the last
+    refill) is used. The level is fitted with `theil_sen` on at most `FORECAST_MAX_SAMPLES` samples,
+    the crossings are extrapolated from the fitted level at the last sample.
+
+    :param hours: Timestamps of the series in hours (see `to_hours`), sorted ascending.
+    :type hours: np.ndarray
+
+    :param level: The water level (`tank_height - meas_val`) of the series.
+    :type level: np.ndarray
+
+    :param thresholds: The thresholds to forecast, e.g. `{'warn': 90, 'alarm': 70, 'empty': 0}`.
+    :type thresholds: dict
+
+    :returns: `None`, if there is not enough data. Otherwise a dictionary with the fitted `rate`
+        (cm/h) and for each threshold the hours from the last sample until the crossing.
+        Thresholds already crossed are `0.0`, thresholds which are not reached (no consumption) are `None`.
+    :rtype: dict
+
+    **Example usage**::
+
+        forecast = forecast_crossings(hours, level, {'warn': 90, 'alarm': 70, 'empty': 0})
+        # {'rate': -2.5, 'warn': 3.9, 'alarm': 11.9, 'empty': 39.9}
+    """
+    hours = np.asarray(hours, dtype=float)
+    level = np.asarray(level, dtype=float)
+    if len(level) < FORECAST_MIN_SAMPLES:
+        return None
+    start = int(np.nanargmax(level))
+    hours, level = hours[start:], level[start:]
+    if len(level) < FORECAST_MIN_SAMPLES or hours[-1] - hours[0] < FORECAST_MIN_HOURS:
+        return None
+    stride = -(-len(level) // FORECAST_MAX_SAMPLES)
+    slope, current = theil_sen(hours[::-stride] - hours[-1], level[::-stride])
+    if np.isnan(slope):
+        return None
+
+    output = {'rate': round(slope, 2)}
+    for name, threshold in thresholds.items():
+        if current <= threshold:
+            output[name] = 0.0
+        elif slope < 0:
+            output[name] = round((threshold - current) / slope, 1)
+        else:
+            output[name] = None
+    return output
+
+
+def night_baselines(hours, levels, tz, night_begin, night_end):
+    """
+    Calculates the night-time baseline consumption of many sensors from their hourly levels.
+
+    The consumption of a night hour is the drop of the hourly mean level to the next hour of the
+    same night. The baseline of a night is the median of its hourly consumptions, so a single draw
+    or refill during the night does not change it. All sensors and nights are calculated at once.
+
+    :param hours: A contiguous grid of hours since epoch (UTC).
+    :type hours: np.ndarray
+    :param levels: The mean levels with one row per sensor and one column per hour (`NaN` if missing).
+    :type levels: np.ndarray
+    :param tz: The timezone of the night hours (e.g. `'Europe/Berlin'`).
+    :type tz: str
+    :param night_begin: First local hour of the night.
+    :type night_begin: int
+    :param night_end: Local hour after the night. Nights over midnight have `night_end < night_begin`.
+    :type night_end: int
+
+    :returns: A tuple with the dates of the nights (date of the morning, `datetime64[D]`), the baselines
+        in cm/h (`NaN` if less than `NIGHT_MIN_HOURS` consumptions are known) and the number of hourly
+        consumptions, both with one row per sensor and one column per night.
+    :rtype: tuple
+
+    **Example usage**::
+
+        nights, baseline, count = night_baselines(hours, levels, 'Europe/Berlin', 1, 5)
+    """
+    levels = np.atleast_2d(np.asarray(levels, dtype=float))
+    local = pd.to_datetime(np.asarray(hours, dtype=np.int64) * 3600, unit='s', utc=True).tz_convert(tz)
+    local_hour = local.hour.to_numpy()
+    night = local.tz_localize(None).normalize().to_numpy().astype('datetime64[D]')
+    if night_begin < night_end:
+        in_night = (local_hour >= night_begin) & (local_hour < night_end)
+    else:
+        in_night = (local_hour >= night_begin) | (local_hour < night_end)
+        night = night + (local_hour >= night_begin).astype('timedelta64[D]')
+
+    pos = np.flatnonzero(in_night[:-1] & in_night[1:] & (night[:-1] == night[1:]))
+    if len(pos) == 0:
+        empty = np.empty((len(levels), 0))
+        return np.array([], dtype='datetime64[D]'), empty, empty.astype(np.int64)
+    nights = np.arange(night[pos[0]], night[pos[-1]] + 1)
+    code = (night[pos] - nights[0]).astype(np.int64)
+    slot = np.arange(len(pos)) - np.searchsorted(code, code)
+
+    drops = np.full((len(levels), len(nights), slot.max() + 1), np.nan)
+    drops[:, code, slot] = levels[:, pos] - levels[:, pos + 1]
+    count = np.count_nonzero(~np.isnan(drops), axis=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        baseline = np.nanmedian(drops, axis=2)
+    baseline[count < NIGHT_MIN_HOURS] = np.nan
+    return nights, baseline, count
+
+
+def detect_leaks(baseline, threshold, min_nights):
+    """
+    Flags sustained night-time baselines (see `night_baselines`) as leaks.
+
+    A night is flagged, if the baseline of this night and of the `min_nights - 1` nights before is
+    above `threshold`.
+
+    :param baseline: The baselines with one row per sensor and one column per consecutive night.
+    :type baseline: np.ndarray
+    :param threshold: Minimal baseline consumption of a leaking night (cm/h).
+    :type threshold: float
+    :param min_nights: Number of consecutive leaking nights.
+    :type min_nights: int
+
+    :returns: The leak flags in the shape of `baseline`.
+    :rtype: np.ndarray
+
+    **Example usage**::
+
+        detect_leaks(np.array([[0.0, 0.3, 0.4, 0.5]]), 0.2, 3)
+        # array([[False, False, False,  True]])
+    """
+    baseline = np.atleast_2d(baseline)
+    leaking = np.nan_to_num(baseline, nan=-np.inf) > threshold
+    csum = np.concatenate([np.zeros((len(baseline), 1), dtype=np.int64), np.cumsum(leaking, axis=1)], axis=1)
+    first = np.maximum(np.arange(baseline.shape[1]) + 1 - min_nights, 0)
+    return csum[:, 1:] - csum[:, first] >= min_nights
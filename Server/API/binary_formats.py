@@ -0,0 +1,211 @@
+"""
+Module Name: Wassermonitor2 API binary formats
+
+Description:
+    This file encodes the measurement data of `/get/` (see `database_utils.get_meas_data_from_sqlite_db`)
+    in binary formats, which are selected by the `Accept` header of the request (see `negotiate`).
+
+    All formats carry the same columns, taken directly from the NumPy arrays of the DataFrame, so no
+    value is converted into a Python object:
+
+        - `dt`: Timestamp in milliseconds since 1970-01-01 UTC (int64)
+        - `value`, `tank_height`, `max_val`, `warn`, `alarm`, `derivation`, `derivation_10`,
+          `peaks_pos`, `peaks_neg`: float64, `NaN` if unknown
+        - `gap`: Only if resampled, 1 for bins without measurements (uint8)
+
+    The rows are sorted by measurement point and sensor, the rows of each sensor are sorted by `dt`.
+    The sensors are listed once with the offset and the number of their rows.
+
+    Formats:
+
+        - `application/vnd.apache.arrow.stream`: Arrow IPC stream with one record batch. The measurement
+          point and the sensor are dictionary encoded columns `meas_point` and `sensor`.
+        - `application/msgpack`: MessagePack map with `sensors` and `columns`. Each column is a map with
+          the NumPy `dtype` (e.g. `<f8`) and the little-endian array as `data`.
+        - `application/octet-stream`: The length of a JSON header (uint32, little-endian), the JSON header
+          with `rows`, `sensors` and `columns` (name, dtype, byte offset and count of each column) and the
+          little-endian arrays. The header is padded to 8 bytes and each array starts at a multiple of
+          8 bytes after the header.
+
+Dependencies:
+    - numpy, pandas (imported on first use, see `lazy`)
+    - pyarrow (optional, for Arrow IPC)
+    - msgpack (optional, for MessagePack)
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import json
+import struct
+
+import lazy
+
+np = lazy.LazyModule('numpy')
+pd = lazy.LazyModule('pandas')
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+MSGPACK = 'application/msgpack'
+RAW = 'application/octet-stream'
+
+FLOAT_COLUMNS = (
+    'value', 'tank_height', 'max_val', 'warn', 'alarm', 'derivation', 'derivation_10', 'peaks_pos', 'peaks_neg'
+)
+
+
+def columns_from_meas_data(data):
+    """
+    Converts the measurement data into sorted NumPy columns.
+
+    :param data: The measurement data (see `database_utils.get_meas_data_from_sqlite_db`).
+    :type data: pd.DataFrame
+
+    :returns: A tuple with the list of sensors (`meas_point`, `sensor`, `offset` and `count` of the rows)
+        and a dictionary with the columns.
+    :rtype: tuple
+
+    **Example usage**::
+
+        sensors, columns = columns_from_meas_data(data)
+    """
+    if data.empty:
+        return [], {'dt': np.empty(0, dtype='<i8'), **{k: np.empty(0, dtype='<f8') for k in FLOAT_COLUMNS}}
+    # Factorizing the columns separately is faster than factorizing a MultiIndex
+    mp_codes, meas_points = pd.factorize(data['mpName'], sort=True)
+    sensor_codes, sensor_names = pd.factorize(data['sensorId'], sort=True)
+    codes, keys = pd.factorize(mp_codes * len(sensor_names) + sensor_codes, sort=True)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(keys))
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    sensors = [
+        {'meas_point': meas_points[k // len(sensor_names)], 'sensor': sensor_names[k % len(sensor_names)],
+         'offset': int(o), 'count': int(c)}
+        for k, o, c in zip(keys, offsets, counts)
+    ]
+    # The sensors of a measurement point share most timestamps, so each distinct timestamp is parsed once
+    dt_codes, dt_strings = pd.factorize(data['dt'])
+    dt = pd.to_datetime(dt_strings, utc=True, format='ISO8601').to_numpy(dtype='datetime64[ms]')
+    columns = {'dt': dt.astype('<i8')[dt_codes][order]}
+    for k in FLOAT_COLUMNS:
+        columns[k] = data[k].to_numpy(dtype='<f8', na_value=np.nan)[order]
+    if 'gap' in data:
+        columns['gap'] = data['gap'].to_numpy(dtype=bool).astype(np.uint8)[order]
+    return sensors, columns
+
+
+def encode_arrow(sensors, columns):
+    """
+    Encodes the columns (see `columns_from_meas_data`) as Arrow IPC stream.
+
+    :rtype: bytes
+    """
+    import pyarrow as pa
+
+    codes = np.repeat(np.arange(len(sensors), dtype=np.int32), [s['count'] for s in sensors])
+    meas_points = pd.unique(pd.Series([s['meas_point'] for s in sensors], dtype=object))
+    mp_codes = pd.Index(meas_points).get_indexer([s['meas_point'] for s in sensors]).astype(np.int32)
+    arrays = {
+        'meas_point': pa.DictionaryArray.from_arrays(pa.array(mp_codes[codes]), pa.array(meas_points, pa.string())),
+        'sensor': pa.DictionaryArray.from_arrays(pa.array(codes), pa.array([s['sensor'] for s in sensors], pa.string())),
+        'dt': pa.array(columns['dt'], pa.timestamp('ms', tz='UTC')),
+    }
+    for k, v in columns.items():
+        if k != 'dt':
+            arrays[k] = pa.array(v)
+    table = pa.table(arrays)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_msgpack(sensors, columns):
+    """
+    Encodes the columns (see `columns_from_meas_data`) as MessagePack.
+
+    :rtype: bytes
+    """
+    import msgpack
+
+    return msgpack.packb({
+        'sensors': sensors,
+        'columns': {k: {'dtype': v.dtype.str, 'data': v.tobytes()} for k, v in columns.items()},
+    })
+
+
+def encode_raw(sensors, columns):
+    """
+    Encodes the columns (see `columns_from_meas_data`) as little-endian arrays with a JSON header.
+
+    :rtype: bytes
+    """
+    header_columns = []
+    offset = 0
+    for k, v in columns.items():
+        header_columns.append({'name': k, 'dtype': v.dtype.str, 'offset': offset, 'count': len(v)})
+        offset += -(-v.nbytes // 8) * 8
+    rows = len(columns['dt'])
+    header = json.dumps({'rows': rows, 'sensors': sensors, 'columns': header_columns}).encode()
+    header += b' ' * (-(len(header) + 4) % 8)
+    parts = [struct.pack('<I', len(header)), header]
+    for v in columns.values():
+        parts += [memoryview(v).cast('B'), b'\0' * (-v.nbytes % 8)]
+    return b''.join(parts)
+
+
+ENCODERS = {
+    ARROW_STREAM: encode_arrow,
+    MSGPACK: encode_msgpack,
+    RAW: encode_raw,
+}
+MEDIA_TYPE_ALIASES = {
+    'application/x-msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+}
+
+
+def negotiate(accept):
+    """
+    Selects a binary format by the `Accept` header of a request.
+
+    The media types are checked in their order, media types with `q=0` are skipped. JSON (and
+    `*/*`) before a binary format selects JSON.
+
+    :param accept: The `Accept` header of the request.
+    :type accept: str
+
+    :returns: The media type of the binary format or `None` for JSON.
+    :rtype: str
+
+    **Example usage**::
+
+        negotiate('application/vnd.apache.arrow.stream, application/json;q=0.5')
+        # 'application/vnd.apache.arrow.stream'
+    """
+    for part in (accept or '').split(','):
+        media_type, *params = [p.strip() for p in part.split(';')]
+        if any(p.replace(' ', '') in ('q=0', 'q=0.0') for p in params):
+            continue
+        media_type = MEDIA_TYPE_ALIASES.get(media_type.lower(), media_type.lower())
+        if media_type in ENCODERS:
+            return media_type
+        if media_type in ('application/json', '*/*', 'application/*'):
+            return None
+    return None
+
+
+def encode(media_type, data):
+    """
+    Encodes the measurement data in a binary format.
+
+    :param media_type: The media type of the format (see `negotiate`).
+    :type media_type: str
+    :param data: The measurement data (see `database_utils.get_meas_data_from_sqlite_db`).
+    :type data: pd.DataFrame
+
+    :returns: The encoded data.
+    :rtype: bytes
+
+    :raises ImportError: If the optional dependency of the format is not installed.
+    """
+    return ENCODERS[media_type](*columns_from_meas_data(data))
@@ -0,0 +1,264 @@
+"""
+Module Name: Wassermonitor2 API response compression
+
+Description:
+    This file compresses the responses of the API with gzip, brotli (`br`) or zstd, negotiated by the
+    `Accept-Encoding` header of the request (see `negotiate`).
+
+    `CompressionMiddleware` is an ASGI middleware, which compresses the body chunk by chunk. Each
+    chunk of a streamed response is compressed and flushed at once, so the response is never buffered
+    as a whole and streamed clients receive each chunk without delay. Responses smaller than
+    `minimum_size` and responses, which already have a `Content-Encoding`, are sent unchanged.
+    Large chunks are compressed in the thread pool, so they do not block the event loop.
+
+    The number of responses, the bytes before and after the compression and the CPU time spent on the
+    compression are counted per encoding (see `get_stats`).
+
+Dependencies:
+    - zlib (gzip)
+    - brotli (optional, for `br`)
+    - zstandard (optional, for `zstd`)
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import threading
+import time
+import zlib
+
+from fastapi.concurrency import run_in_threadpool
+
+GZIP = 'gzip'
+BROTLI = 'br'
+ZSTD = 'zstd'
+
+# Preferred encodings first, if the client accepts several with the same quality
+PREFERENCE = (ZSTD, BROTLI, GZIP)
+DEFAULT_LEVELS = {GZIP: 6, BROTLI: 4, ZSTD: 3}
+# Chunks with at least this number of bytes are compressed in the thread pool
+THREAD_MIN_SIZE = 256 * 1024
+
+_lock = threading.Lock()
+# encoding -> counters
+_stats = {}
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data, final):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _Brotli:
+    def __init__(self, level):
+        import brotli
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data, final):
+        output = self._compressor.process(data)
+        return output + (self._compressor.finish() if final else self._compressor.flush())
+
+
+class _Zstd:
+    def __init__(self, level):
+        import zstandard
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data, final):
+        output = self._compressor.compress(data)
+        return output + (self._compressor.flush() if final else self._compressor.flush(self._flush_block))
+
+
+COMPRESSORS = {
+    GZIP: _Gzip,
+    BROTLI: _Brotli,
+    ZSTD: _Zstd,
+}
+
+
+def available_encodings():
+    """
+    Returns the encodings, whose libraries are installed, in the order of `PREFERENCE`.
+
+    :rtype: list
+    """
+    encodings = []
+    for encoding in PREFERENCE:
+        try:
+            COMPRESSORS[encoding](1)
+        except ImportError:
+            continue
+        encodings.append(encoding)
+    return encodings
+
+
+def negotiate(accept_encoding, encodings):
+    """
+    Selects the encoding of a response by the `Accept-Encoding` header of the request.
+
+    The encoding with the highest quality is selected, the order of `encodings` decides between
+    encodings with the same quality. `*` matches all encodings, which are not listed.
+
+    :param accept_encoding: The `Accept-Encoding` header of the request.
+    :type accept_encoding: str
+    :param encodings: The available encodings, preferred first.
+    :type encodings: list
+
+    :returns: The selected encoding or `None` for an uncompressed response.
+    :rtype: str
+
+    **Example usage**::
+
+        negotiate('gzip, deflate, br;q=0.9', ['zstd', 'br', 'gzip'])
+        # 'gzip'
+    """
+    qualities = {}
+    for part in (accept_encoding or '').split(','):
+        name, *params = [p.strip() for p in part.split(';')]
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[name.lower()] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = qualities.get(encoding, qualities.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _count(encoding, bytes_in, bytes_out, cpu_seconds, response=False):
+    with _lock:
+        stats = _stats.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0})
+        stats['responses'] += response
+        stats['bytes_in'] += bytes_in
+        stats['bytes_out'] += bytes_out
+        stats['cpu_seconds'] += cpu_seconds
+
+
+def get_stats():
+    """
+    Returns the compression counters per encoding.
+
+    :returns: A dictionary `output[encoding]` with the number of `responses`, the bytes before (`bytes_in`)
+        and after (`bytes_out`) the compression, the saved bytes (`bytes_saved`) and the CPU time spent
+        on the compression (`cpu_seconds`).
+    :rtype: dict
+
+    **Example usage**::
+
+        get_stats()
+        # {'gzip': {'responses': 12, 'bytes_in': 3145728, 'bytes_out': 262144, 'bytes_saved': 2883584,
+        #           'cpu_seconds': 0.041}}
+    """
+    with _lock:
+        return {
+            encoding: {**stats, 'bytes_saved': stats['bytes_in'] - stats['bytes_out']}
+            for encoding, stats in _stats.items()
+        }
+
+
+def _compress(compressor, data, final):
+    start = time.thread_time()
+    output = compressor.compress(data, final)
+    return output, time.thread_time() - start
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware, which compresses the responses (see module description).
+
+    :param app: The ASGI application.
+    :param minimum_size: Responses with less bytes are not compressed.
+    :type minimum_size: int
+    :param levels: The compression level of each encoding (see `DEFAULT_LEVELS`).
+    :type levels: dict
+    :param encodings: The enabled encodings, preferred first. Defaults to all available encodings.
+    :type encodings: list
+
+    **Example usage**::
+
+        app.add_middleware(CompressionMiddleware, minimum_size=1024, levels={'gzip': 6, 'br': 4, 'zstd': 3})
+    """
+    def __init__(self, app, minimum_size=1024, levels=None, encodings=None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.encodings = available_encodings() if encodings is None else list(encodings)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope['headers'])
+        encoding = negotiate(headers.get(b'accept-encoding', b'').decode('latin-1'), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(self.app, encoding, self.levels[encoding], self.minimum_size)(scope, receive, send)
+
+
+class _CompressedResponder:
+    def __init__(self, app, encoding, level, minimum_size):
+        self.app = app
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message['type'] == 'http.response.start':
+            self.start = message
+            self.passthrough = any(k.lower() == b'content-encoding' for k, _ in message.get('headers', []))
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+        if self.passthrough:
+            await self._send_start()
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._send_start()
+                await self.send(message)
+                return
+            self.compressor = COMPRESSORS[self.encoding](self.level)
+            headers = [(k, v) for k, v in self.start.get('headers', []) if k.lower() != b'content-length']
+            headers += [(b'content-encoding', self.encoding.encode()), (b'vary', b'Accept-Encoding')]
+            self.start = {**self.start, 'headers': headers}
+            await self._send_start()
+
+        if len(body) >= THREAD_MIN_SIZE:
+            output, cpu_seconds = await run_in_threadpool(_compress, self.compressor, body, not more_body)
+        else:
+            output, cpu_seconds = _compress(self.compressor, body, not more_body)
+        _count(self.encoding, len(body), len(output), cpu_seconds, response=not more_body)
+        await self.send({'type': 'http.response.body', 'body': output, 'more_body': more_body})
+
+    async def _send_start(self):
+        if self.start is not None:
+            await self.send(self.start)
+            self.start = None
@@ -10,8 +10,8 @@ Description:
 
 Dependencies:
     - sqlite3  (for sqlite support)
-    - pymysql (for mysql support)
-    - scipy.signal (for signale processing)
+    - pymysql (for mysql support, imported on first use)
+    - numpy, pandas (imported on first use, see `lazy`)
 
 Configuration:
     - Some parameters can be configured in the config_file ../config.cfg.
@@ -20,18 +20,151 @@ Author:
     - Carl Philipp Koppen (admin@wassermonitor.de)
 
 """
+import contextlib
 import os.path
+import sys
+import time
 
-import numpy
-import pandas as pd
-import pymysql
 import sqlite3
 from sqlite3 import Error
-from datetime import datetime, timezone, timedelta
-import pandas as pd
+from datetime import datetime, timezone, timedelta, date
 import pytz
-import numpy as np
-from scipy import signal
+import analytics
+import lazy
+import metrics
+import profiling
+
+np = lazy.LazyModule('numpy')
+pd = lazy.LazyModule('pandas')
+
+# Value of a measurement: the robust estimate stored on insert (see analytics.robust_estimate),
+# the average for measurements inserted before quality scoring
+SQL_MEAS_VALUE = "COALESCE(q.value, AVG(v.value))"
+SQL_QUALITY_JOIN = "LEFT JOIN meas_quality q ON q.measurement_id = m.id"
+SQL_USABLE_QUALITY = f"COALESCE(q.quality, {analytics.QUALITY_GOOD}) > {analytics.QUALITY_BAD}"
+# Columns of the measurement data (see get_meas_data_from_sqlite_db)
+SQL_MEAS_DATA_COLUMNS = f"""m.id, m.dt, mp.name, s.name, s.max_val, s.warn, s.alarm, {SQL_MEAS_VALUE}, tank_height,
+    d.derivation, d.derivation_10, d.peaks_pos, d.peaks_neg, d.measurement_id IS NOT NULL"""
+MEAS_DATA_COLUMNS = [
+    'mid', 'dt', 'mpName', 'sensorId', 'max_val', 'warn', 'alarm', 'meas_val', 'tank_height',
+    'derivation', 'derivation_10', 'peaks_pos', 'peaks_neg', 'derived'
+]
+
+SQLITE_SECONDS = metrics.Histogram(
+    'wassermonitor_sqlite_duration_seconds',
+    'Duration of the SQLite statements (execute), of reading their rows (fetch) and of the commits per function.',
+    ['function', 'operation'],
+)
+SQLITE_CONNECTIONS = metrics.Gauge('wassermonitor_sqlite_open_connections', 'Open SQLite connections.')
+
+# Lock of the write transactions and journal mode of the SQLite files (see configure_sqlite)
+_write_lock = contextlib.nullcontext()
+_journal_mode = None
+
+
+def configure_sqlite(write_lock=None, journal_mode=None):
+    """
+    Configures the SQLite access for several processes, which write to the same SQLite files (see `workers`).
+
+    :param write_lock: A reentrant context manager, which is held by each write transaction, so the writers queue
+        for it instead of retrying against the lock of SQLite. Defaults to no lock.
+    :param journal_mode: The journal mode of the SQLite files, e.g. `WAL`, so the readers do not block the
+        writers. Defaults to the journal mode of the files.
+    :type journal_mode: str
+
+    **Example usage**::
+
+        configure_sqlite(workers.ProcessLock('../run/sqlite-write.lock'), 'WAL')
+    """
+    global _write_lock, _journal_mode
+    _write_lock = write_lock or contextlib.nullcontext()
+    _journal_mode = journal_mode
+
+
+class _TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return sqlite3.Cursor.execute(self, sql, parameters)
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - start, self.connection.function, 'execute')
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return sqlite3.Cursor.executemany(self, sql, seq_of_parameters)
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - start, self.connection.function, 'execute')
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return sqlite3.Cursor.executescript(self, sql_script)
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - start, self.connection.function, 'execute')
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return sqlite3.Cursor.fetchone(self)
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - start, self.connection.function, 'fetch')
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return sqlite3.Cursor.fetchmany(self, self.arraysize if size is None else size)
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - start, self.connection.function, 'fetch')
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return sqlite3.Cursor.fetchall(self)
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - start, self.connection.function, 'fetch')
+
+
+class _TimedConnection(sqlite3.Connection):
+    """
+    SQLite connection, which records the durations of its statements and commits (see `SQLITE_SECONDS`)
+    with the name of the function, which opened it.
+    """
+    function = 'unknown'
+    _open = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._open = True
+        SQLITE_CONNECTIONS.inc()
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            SQLITE_SECONDS.observe(time.perf_counter() - start, self.function, 'commit')
+
+    def close(self):
+        if self._open:
+            self._open = False
+            SQLITE_CONNECTIONS.dec()
+        return super().close()
+
+    def __del__(self):
+        if self._open:
+            self._open = False
+            SQLITE_CONNECTIONS.dec()
+
+def _sqlite3_connect(db_file, function):
+    conn = sqlite3.connect(db_file, factory=_TimedConnection)
+    conn.function = function
+    if _journal_mode:
+        conn.execute(f"PRAGMA journal_mode={_journal_mode}")
+    return conn
 
 def get_mysql_connection(conf):
     """
@@ -54,6 +187,7 @@ def get_mysql_connection(conf):
         conf = {'host': 'localhost', 'user': 'root', 'pass': 'password', 'db': 'test_db'}
         conn, cur = get_mysql_connection(conf)
     """
+    import pymysql
 
     conn = pymysql.connect(host=conf['host'], user=conf['user'], password=conf['pass'],
                             db=conf['db'], connect_timeout=60)
@@ -61,10 +195,14 @@ def get_mysql_connection(conf):
     return conn, cur
 
 
+# SQLite files, whose tables were created by this process (see get_sqlite3_connection)
+_created_files = set()
+
 def get_sqlite3_connection(db_file):
     """
     Establishes a connection to an SQLite3 database, creates the database if it doesn't exist,
-    and returns the connection and cursor objects.
+    and returns the connection and cursor objects. The tables are created with the first connection
+    to each file (see `create_sqlite_database`).
 
     :param db_file: The file path to the SQLite3 database file.
     :type db_file: str
@@ -79,9 +217,13 @@ def get_sqlite3_connection(db_file):
         db_file = 'example.db'
         conn, cur = get_sqlite3_connection(db_file)
     """
-    conn = sqlite3.connect(db_file)
+    # The tables are created once per file, unless the file was removed meanwhile
+    created = db_file in _created_files and os.path.exists(db_file)
+    # The statements of the connection are recorded with the name of the calling function
+    conn = _sqlite3_connect(db_file, sys._getframe(1).f_code.co_name)
     cur = conn.cursor()
-    create_sqlite_database(conn, cur)
+    if not created and create_sqlite_database(conn, cur):
+        _created_files.add(db_file)
     return conn, cur
 
 def create_sqlite_database(conn, cur):
@@ -93,14 +235,20 @@ def create_sqlite_database(conn, cur):
     - `sensor`: Stores sensor data, including the sensor's ID, measurement point ID, name, tank height, maximum value, warning threshold, and alarm threshold.
     - `measurement`: Stores measurement data, including the measurement's ID, datetime, sensor ID, and a comment.
     - `meas_val`: Stores measurement values, including the value of the measurement and any associated comment.
+    - `meas_quality`: Stores the robust value, the spread, the number of rejected raw values and the quality flag per measurement (see `insert_value`).
     - `messages`: Stores message data, including a timestamp, signal and email targets, message text, and alarm/warning flags.
+    - `derived_metrics`: Stores the derivation, the smoothed derivation and its peaks per measurement (see `update_derived_metrics`).
+    - `events`: Stores the detected refill and consumption events per sensor (see `update_derived_metrics`).
+    - `hourly_levels`: Stores the mean, minimum and maximum water level per sensor and hour (see `update_hourly_levels`).
+    - `night_baselines`: Stores the night-time baseline consumption and the leak flag per sensor and night (see `store_night_baselines`).
 
     :param conn: The SQLite3 connection object.
     :type conn: sqlite3.Connection
     :param cur: The SQLite3 cursor object.
     :type cur: sqlite3.Cursor
 
-    :raises Error: If there is an error while executing the SQL commands.
+    :returns: Whether the tables were created. SQL errors are printed instead of raised.
+    :rtype: bool
 
     **Example usage**::
 
@@ -146,6 +294,16 @@ def create_sqlite_database(conn, cur):
         );
     """)
 
+    template.append("""
+        CREATE TABLE IF NOT EXISTS meas_quality (
+            measurement_id INTEGER NOT NULL PRIMARY KEY REFERENCES measurement(id),
+            value FLOAT,
+            spread FLOAT,
+            rejected INTEGER NOT NULL,
+            quality INTEGER NOT NULL
+        );
+    """)
+
     template.append("""
         CREATE TABLE IF NOT EXISTS messages (
             id INTEGER NOT NULL PRIMARY KEY,
@@ -162,14 +320,79 @@ def create_sqlite_database(conn, cur):
         );
     """)
 
+    template.append("""
+        CREATE TABLE IF NOT EXISTS derived_metrics (
+            measurement_id INTEGER NOT NULL PRIMARY KEY REFERENCES measurement(id),
+            dt DATETIME NOT NULL,
+            derivation FLOAT,
+            derivation_10 FLOAT,
+            peaks_pos FLOAT,
+            peaks_neg FLOAT
+        );
+    """)
+
+    template.append("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER NOT NULL PRIMARY KEY,
+            meas_point VARCHAR(1024) NOT NULL,
+            sensor VARCHAR(1024) NOT NULL,
+            event_type VARCHAR(32) NOT NULL,
+            dt_begin DATETIME NOT NULL,
+            dt_end DATETIME NOT NULL,
+            value_begin FLOAT NOT NULL,
+            value_end FLOAT NOT NULL,
+            volume FLOAT NOT NULL,
+            rate FLOAT
+        );
+    """)
+
+    template.append("""
+        CREATE INDEX IF NOT EXISTS idx_events_sensor_dt ON events(meas_point, sensor, dt_begin);
+    """)
+
+    template.append("""
+        CREATE TABLE IF NOT EXISTS hourly_levels (
+            sensor_id INTEGER NOT NULL REFERENCES sensor(id),
+            hour INTEGER NOT NULL,
+            level_mean FLOAT NOT NULL,
+            level_min FLOAT NOT NULL,
+            level_max FLOAT NOT NULL,
+            count INTEGER NOT NULL,
+            last_measurement_id INTEGER NOT NULL,
+            PRIMARY KEY (sensor_id, hour)
+        );
+    """)
+
+    template.append("""
+        CREATE TABLE IF NOT EXISTS night_baselines (
+            meas_point VARCHAR(1024) NOT NULL,
+            sensor VARCHAR(1024) NOT NULL,
+            night DATE NOT NULL,
+            baseline FLOAT,
+            hours INTEGER NOT NULL,
+            leak INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (meas_point, sensor, night)
+        );
+    """)
+
+    template.append("""
+        CREATE INDEX IF NOT EXISTS idx_measurement_sensor_dt ON measurement(sensor_id, dt);
+    """)
+
+    template.append("""
+        CREATE INDEX IF NOT EXISTS idx_meas_val_measurement ON meas_val(measurement_id);
+    """)
+
     try:
         for line in template:
             cur.execute(line)
 
         conn.commit()
+        return True
 
     except Error as e:
         print(f"Database_creation: SQL Error: {e}\n {line}")
+        return False
 
 
 
@@ -359,7 +582,7 @@ def sqlite_get_meas_point_id(db_conf, mp_name,dt):
         return mp_id
 
 
-def insert_value(db_conf, val_dict):
+def insert_value(db_conf, val_dict, quality=None):
     """
     Inserts a new measurement and associated values into the SQLite database.
 
@@ -367,13 +590,15 @@ def insert_value(db_conf, val_dict):
     associated values, such as sensor values and their corresponding timestamps.
     It first retrieves or generates the necessary sensor and measurement point IDs,
     then creates a new measurement entry, and finally inserts the actual measurement
-    values.
+    values. The robust value and the quality of the measurement are stored in `meas_quality`.
 
     :param db_conf: A dictionary containing the database configuration.
         It should have the following keys:
         - 'engine': Should be 'sqlite' for this function to work.
         - 'sqlite_path': The file path to the SQLite database directory.
 
+    :param quality: The result of `analytics.robust_estimate` for the values. Calculated, if not given.
+
     :param val_dict: A dictionary containing the measurement data to insert.
         It should have the following keys:
         - 'datetime': ISO formatted datetime string for the measurement timestamp.
@@ -408,6 +633,10 @@ def insert_value(db_conf, val_dict):
         result = insert_value(db_conf, val_dict)
     """
 
+    with _write_lock:
+        return _insert_value(db_conf, val_dict, quality)
+
+def _insert_value(db_conf, val_dict, quality):
     meas_dt = datetime.fromisoformat(val_dict['datetime'])
     mp_id = sqlite_get_meas_point_id(db_conf, val_dict['meas_point'], meas_dt)
     s_id = sqlite_get_sensor_id(
@@ -446,8 +675,115 @@ def insert_value(db_conf, val_dict):
     for value in val_dict['values']:
         x = insert_and_get_id(db_conf, meas_dt, sql, [meas_id, value])
 
+    # INSERT QUALITY
+    if quality is None:
+        quality = analytics.robust_estimate(val_dict['values'])
+    sql = "INSERT INTO meas_quality(measurement_id, value, spread, rejected, quality) VALUES (?, ?, ?, ?, ?);"
+    insert_and_get_id(
+        db_conf, meas_dt, sql,
+        [meas_id, quality['value'], quality['spread'], quality['rejected'], quality['quality']]
+    )
+
     return False
 
+def insert_values(db_conf, val_dicts, qualities=None):
+    """
+    Inserts a batch of measurements with one connection and one transaction per SQLite file.
+
+    The measurements are stored like `insert_value` stores them. Each measurement is inserted within
+    a savepoint, so a failing measurement is rolled back without the other measurements of the batch.
+    The measurement points and sensors are looked up once per batch.
+
+    :param db_conf: A dictionary containing the database configuration (see `insert_value`).
+    :type db_conf: dict
+    :param val_dicts: The measurements to insert (see `insert_value`).
+    :type val_dicts: list
+    :param qualities: The result of `analytics.robust_estimate` for each measurement. Calculated, if not given.
+    :type qualities: list
+
+    :returns: A list with `None` for each inserted measurement and the error message for each failed measurement.
+    :rtype: list
+
+    **Example usage**::
+
+        errors = insert_values(db_conf, [val_dict_1, val_dict_2])
+        # [None, None]
+    """
+    if qualities is None:
+        qualities = [analytics.robust_estimate(v['values']) for v in val_dicts]
+    errors = [None] * len(val_dicts)
+    files = {}
+    for i, val_dict in enumerate(val_dicts):
+        meas_dt = datetime.fromisoformat(val_dict['datetime'])
+        files.setdefault(get_sqlite3_file_name_from_conf(meas_dt), []).append((i, meas_dt))
+
+    now = datetime.now(timezone.utc)
+    comment = f'received at {now.isoformat()}'
+    for file_name, items in files.items():
+        with _write_lock:
+            conn, cur = get_sqlite3_connection(db_conf['sqlite_path'] + file_name)
+            try:
+                cur.execute("BEGIN")
+                mp_ids = {}
+                s_ids = {}
+                for i, meas_dt in items:
+                    val_dict, quality = val_dicts[i], qualities[i]
+                    cur.execute("SAVEPOINT item")
+                    try:
+                        mp_name = val_dict['meas_point']
+                        if mp_name not in mp_ids:
+                            cur.execute("SELECT max(id) FROM meas_point WHERE name = ?", [mp_name])
+                            mp_ids[mp_name] = cur.fetchone()[0]
+                            if mp_ids[mp_name] is None:
+                                cur.execute("INSERT INTO meas_point (name) VALUES (?)", [mp_name])
+                                mp_ids[mp_name] = cur.lastrowid
+                        sensor = (
+                            mp_ids[mp_name], val_dict['sensor_name'], val_dict['tank_height'],
+                            val_dict['max_val'], val_dict['warn'], val_dict['alarm']
+                        )
+                        if sensor not in s_ids:
+                            cur.execute(
+                                "SELECT max(id) FROM sensor WHERE meas_point_id = ? AND name = ? AND tank_height = ? "
+                                "AND max_val = ? AND warn = ? AND alarm = ?", sensor
+                            )
+                            s_ids[sensor] = cur.fetchone()[0]
+                            if s_ids[sensor] is None:
+                                cur.execute(
+                                    "INSERT INTO sensor(meas_point_id, name, tank_height, max_val, warn, alarm) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)", sensor
+                                )
+                                s_ids[sensor] = cur.lastrowid
+                        cur.execute(
+                            "INSERT INTO measurement(dt, sensor_id, comment) VALUES (?, ?, ?)",
+                            [meas_dt, s_ids[sensor], comment]
+                        )
+                        meas_id = cur.lastrowid
+                        cur.executemany(
+                            "INSERT INTO meas_val(measurement_id, value) VALUES (?, ?)",
+                            [(meas_id, value) for value in val_dict['values']]
+                        )
+                        cur.execute(
+                            "INSERT INTO meas_quality(measurement_id, value, spread, rejected, quality) VALUES (?, ?, ?, ?, ?)",
+                            [meas_id, quality['value'], quality['spread'], quality['rejected'], quality['quality']]
+                        )
+                        cur.execute("RELEASE item")
+                    except Error as e:
+                        cur.execute("ROLLBACK TO item")
+                        cur.execute("RELEASE item")
+                        # Ids of rolled back inserts must not be reused
+                        mp_ids.clear()
+                        s_ids.clear()
+                        errors[i] = str(e)
+                conn.commit()
+            except Error as e:
+                print("SQL ERROR: %s" % e)
+                conn.rollback()
+                for i, _ in items:
+                    errors[i] = errors[i] or str(e)
+            finally:
+                conn.close()
+    return errors
+
 def get_sqlite3_file_name_from_conf(dt):
     """
     Generates an SQLite3 file name based on the provided datetime object.
@@ -526,7 +862,7 @@ def convert_nan_to_none (x):
 
 
 
-def get_meas_data_from_sqlite_db(db_conf, dt_begin = None, dt_end = None):
+def get_meas_data_from_sqlite_db(db_conf, dt_begin = None, dt_end = None, resample = None, min_quality = analytics.QUALITY_SUSPECT, meas_point = None, sensors = None, max_points = None):
     """
     Retrieve measurement data from SQLite database within a specified date range.
 
@@ -534,6 +870,11 @@ def get_meas_data_from_sqlite_db(db_conf, dt_begin = None, dt_end = None):
     date range (`dt_begin` to `dt_end`) and calculates additional metrics such as the slope and
     derivation of measurements. The results are returned as a pandas DataFrame.
 
+    Without `resample` the derived metrics are the stored metrics of the continuous sensor series (see
+    `update_derived_metrics`), so they do not depend on the queried range: e.g. a short range is smoothed,
+    if the series is longer than `analytics.SAVGOL_MIN_SAMPLES`, and the range edges are no edges of the
+    filter. Only the measurements without stored metrics (yet) are calculated over the queried range.
+
     :param db_conf: Configuration dictionary containing database connection settings. Must include the key
         `engine` with value `'sqlite'` and `sqlite_path` specifying the path to the database files.
     :type db_conf: dict
@@ -544,6 +885,25 @@ def get_meas_data_from_sqlite_db(db_conf, dt_begin = None, dt_end = None):
     :param dt_end: End of the date range for the query. If not provided, defaults to the current time in UTC.
     :type dt_end: datetime, optional
 
+    :param resample: Width of a time grid in minutes. If given, each sensor is resampled onto this grid
+        from `dt_begin` to `dt_end` and the derived metrics are calculated on the grid
+        (see `analytics.resample_series`). Empty bins are marked in the additional column `gap`.
+    :type resample: int, optional
+
+    :param min_quality: Measurements with a lower quality flag (see `analytics.robust_estimate`) are skipped.
+        Defaults to `analytics.QUALITY_SUSPECT`, so only bad measurements are skipped.
+    :type min_quality: int, optional
+
+    :param meas_point: Only query the measurements of this measurement point, if given.
+    :type meas_point: str, optional
+
+    :param sensors: Only query the measurements of these sensors, if given.
+    :type sensors: list, optional
+
+    :param max_points: Point budget per sensor. If given, longer series are downsampled after the derived
+        metrics are calculated (see `analytics.downsample_series`), so the peaks are kept.
+    :type max_points: int, optional
+
     :returns: A DataFrame containing the queried data with the following columns:
         - `mid`: Measurement ID
         - `dt`: Timestamp of the measurement
@@ -553,10 +913,12 @@ def get_meas_data_from_sqlite_db(db_conf, dt_begin = None, dt_end = None):
         - `max_val`: Maximum value for the sensor
         - `warn`: Warning threshold
         - `alarm`: Alarm threshold
-        - `meas_val`: Measured value
-        - `slope`: Gradient of measured values over time
-        - `derivation`: Derived metric calculated as `-slope / slope_date`
+        - `meas_val`: Measured value (robust estimate of the raw values)
+        - `derivation`: Derived metric calculated as `-gradient(meas_val) / gradient(hours)`
+        - `derivation_10`: Smoothed derivation
+        - `peaks_pos`, `peaks_neg`: Smoothed derivation at the peaks of the derivation, otherwise `None`
         - `value`: Difference between `tank_height` and `meas_val`, rounded to 1 decimal place
+        - `gap`: Only if resampled: `True` for bins without measurements
     :rtype: pd.DataFrame
 
     :raises ValueError: If the database engine is not SQLite, or if the inputs `dt_begin` or `dt_end` are
@@ -599,72 +961,932 @@ def get_meas_data_from_sqlite_db(db_conf, dt_begin = None, dt_end = None):
 
     if dt_begin > dt_end:
         raise ValueError(f"Invalid input: dt_begin ({dt_begin}) has to be before dt_end ({dt_end})!")
-    sql = """
-        SELECT m.id,m.dt, mp.name, s.name, s.max_val, s.warn, s.alarm, AVG(v.value), tank_height
+    sql = f"""
+        SELECT {SQL_MEAS_DATA_COLUMNS}
         FROM meas_val v 
         INNER JOIN measurement m ON v.measurement_id=m.id 
         INNER JOIN sensor s ON m.sensor_id = s.id 
         INNER JOIN meas_point mp ON s.meas_point_id = mp.id 
-        WHERE m.dt > ? AND m.dt < ?
-        GROUP BY m.dt
+        LEFT JOIN derived_metrics d ON d.measurement_id = m.id
+        {SQL_QUALITY_JOIN}
+        WHERE m.dt > ? AND m.dt < ? AND COALESCE(q.quality, {analytics.QUALITY_GOOD}) >= ?
     """
-
-    output = pd.DataFrame()
-
+    args = [dt_begin, dt_end, min_quality]
+    if meas_point is not None:
+        sql += " AND mp.name = ?"
+        args.append(meas_point)
+    if sensors is not None:
+        sql += f" AND s.name IN ({', '.join('?' * len(sensors))})"
+        args += list(sensors)
+    sql += " GROUP BY m.id ORDER BY m.dt"
+
+    raw = []
+    parts = []
+
+    start = time.perf_counter()
     for m in get_months_between(dt_begin, dt_end):
         db_path = f"{db_conf['sqlite_path']}/{m}.sqlite"
         if os.path.exists(db_path):
             conn, cur = get_sqlite3_connection(db_path)
-            cur.execute(sql,[dt_begin, dt_end])
+            cur.execute(sql, args)
             res = pd.DataFrame(cur.fetchall())
+            conn.close()
             if res.empty:
                 continue
-            res.columns = ['mid', 'dt', 'mpName', 'sensorId', 'max_val', 'warn', 'alarm', 'meas_val', 'tank_height']
-            #res['value']
-            for sens in res.sensorId.unique():
-                res_sens = res[res['sensorId'] == sens].copy().reset_index(drop=True)
-                try:
-                    slope_val = pd.Series(np.gradient(res_sens.meas_val), name='slope')
-                    #print (slope_val)
-
-                    slope_date = pd.to_datetime(res_sens.dt)
-                    slope_date = slope_date.astype('int64') // 10**9 / 3600 # in hours
-                    slope_date = pd.Series(np.gradient(slope_date), name='slope')
-                    #slope_date = slope_date.apply(datetime_to_hours)
-                    res_sens['derivation'] = -slope_val / slope_date
-                    if len (res_sens['derivation']) > 100:
-                        res_sens['derivation_10'] = signal.savgol_filter(res_sens['derivation'], 10, 3)
-                    else:
-                        res_sens['derivation_10'] = 0.0
-                except ValueError as e:
-                    print (f"WARNING: Value Error: {e}")
-                    res_sens['derivation'] = 0.0
-                    res_sens['derivation_10'] = 0.0
-
-                try:
-                    inds = signal.find_peaks(res_sens['derivation'], height=10)[0]
-                    inds_neg = signal.find_peaks(0-res_sens['derivation'], height=10)[0]
-                    #print(inds)
-                    res_sens['peaks_pos'] = np.nan
-                    res_sens['peaks_neg'] = np.nan
-                    res_sens.loc[inds, 'peaks_pos'] = res_sens['derivation_10'].iloc[inds]
-                    res_sens.loc[inds_neg, 'peaks_neg'] = res_sens['derivation_10'].iloc[inds_neg]
-                except ValueError as e:
-                    print(f"Value Error:\t{e}")
-                    res_sens['peaks_pos'] = np.nan
-                    res_sens['peaks_neg'] = np.nan
-
-                res_sens['peaks_pos'] = res_sens['peaks_pos'].replace({np.nan: None})
-                res_sens['peaks_neg'] = res_sens['peaks_neg'].replace({np.nan: None})
-                output = pd.concat([output, res_sens], ignore_index=True)
-            conn.close()
+            res.columns = MEAS_DATA_COLUMNS
+            if resample:
+                # The grid runs over all months, so resample after reading all SQLite files
+                raw.append(res)
+                continue
+            for (mp, sens), res_sens in res.groupby(['mpName', 'sensorId'], sort=False):
+                parts.append(res_sens.copy().reset_index(drop=True))
         else:
             continue
+    profiling.record_phase('query', start)
+
+    start = time.perf_counter()
+    if raw:
+        raw = pd.concat(raw, ignore_index=True)
+        parts = [
+            analytics.resample_series(res_sens, resample, dt_begin, dt_end, derivation=False)
+            for (mp, sens), res_sens in raw.groupby(['mpName', 'sensorId'], sort=False)
+        ]
+        analytics.add_grid_derivation_metrics(parts)
+    else:
+        parts = _add_pending_derivation_metrics(parts)
+
+    if max_points:
+        parts = [analytics.downsample_series(p, max_points) for p in parts]
+
+    output = _concat_meas_data(parts)
+    profiling.record_phase('analytics', start)
+    return output
+
+
+def _add_pending_derivation_metrics(parts):
+    """
+    Calculates the derived metrics of the series, which are not stored (yet), for the queried range and
+    drops the column `derived`.
+    """
+    pending = [p for p in parts if not p['derived'].all()]
+    results = analytics.compute_derivation_metrics_many([
+        (analytics.to_hours(p['dt']), p['meas_val'].to_numpy(dtype=float)) for p in pending
+    ])
+    for p, metrics in zip(pending, results):
+        for k in metrics:
+            p[k] = metrics[k]
+    return [p.drop(columns=['derived']) for p in parts]
+
+
+def _concat_meas_data(parts):
+    """
+    Concatenates the series of `get_meas_data_from_sqlite_db` and adds the column `value`.
+    """
+    output = pd.DataFrame()
+    if parts:
+        output = pd.concat(parts, ignore_index=True)
+        output['peaks_pos'] = output['peaks_pos'].astype(object).where(output['peaks_pos'].notna(), None)
+        output['peaks_neg'] = output['peaks_neg'].astype(object).where(output['peaks_neg'].notna(), None)
     if 'max_val' in list(output.keys()) and 'meas_val' in list(output.keys()):
         output['value'] = round(output['tank_height'] - output['meas_val'], 1)
-    #output['peaks_pos'] = output['peaks_pos'].apply(lambda x: None if np.isnan(x) else x)
-    #output['peaks_neg'] = output['peaks_neg'].apply(lambda x: None if np.isnan(x) else x)
-    #print(output['peaks_pos'].to_list())
+    return output
+
+
+def _previous_month_file(db_file_name):
+    # "MM-YYYY.sqlite" of the month before
+    month, year = int(db_file_name[:2]), int(db_file_name[3:7])
+    return f"{month - 1:02d}-{year}.sqlite" if month > 1 else f"12-{year - 1}.sqlite"
+
+
+def _shard_order(month):
+    # "MM-YYYY" of the SQLite file name as (year, month)
+    return month[3:], month[:2]
+
+
+def get_meas_data_page_from_sqlite_db(db_conf, dt_begin, dt_end, page_size, positions=None, min_quality = analytics.QUALITY_SUSPECT, meas_point = None, sensors = None):
+    """
+    Retrieve one page of the measurement data of `get_meas_data_from_sqlite_db` with at most `page_size`
+    measurements per sensor.
+
+    The position of each sensor series is kept in `positions` as `(shard, dt, id)` of its last returned
+    measurement. The next page continues each series directly after its position: the query seeks in the
+    index `idx_measurement_sensor_dt` of the shard with `dt >= ? AND (dt > ? OR id > ?)` and reads only
+    `page_size + 1` rows, so a page costs the same at the end of a long range as at its beginning (unlike
+    `OFFSET`, which reads and skips all preceding rows). The ids only order the measurements of the same
+    shard, in the following shards the series continues after `dt`.
+
+    Each page reads the sensors of all shards in the range, so a sensor, which only appears in a later
+    shard, is returned from its first measurement on. The derived metrics, which are not stored (yet), are
+    calculated for the page. Resampling and downsampling need the whole range and are not available.
+
+    :param db_conf: Configuration dictionary containing database connection settings (see `get_meas_data_from_sqlite_db`).
+    :type db_conf: dict
+    :param dt_begin: Start of the date range.
+    :type dt_begin: datetime
+    :param dt_end: End of the date range.
+    :type dt_end: datetime
+    :param page_size: The maximal number of measurements per sensor.
+    :type page_size: int
+    :param positions: The positions returned with the previous page. Defaults to the first page.
+    :type positions: dict, optional
+    :param min_quality: Measurements with a lower quality flag are skipped (see `get_meas_data_from_sqlite_db`).
+    :type min_quality: int, optional
+    :param meas_point: Only query the measurements of this measurement point, if given.
+    :type meas_point: str, optional
+    :param sensors: Only query the measurements of these sensors, if given.
+    :type sensors: list, optional
+
+    :returns: A tuple containing:
+        - The DataFrame of the page with the columns of `get_meas_data_from_sqlite_db`.
+        - The positions of the next page: `positions[(meas_point, sensor)]` is `(shard, dt, id)` or `None`,
+          if the series is complete. `None`, if all series are complete.
+    :rtype: tuple
+
+    :raises ValueError: If the database engine is not SQLite, or if `dt_begin` is after `dt_end`.
+
+    **Example usage**::
+
+        data, positions = get_meas_data_page_from_sqlite_db(db_conf, dt_begin, dt_end, 1000)
+        while positions is not None:
+            data, positions = get_meas_data_page_from_sqlite_db(db_conf, dt_begin, dt_end, 1000, positions)
+    """
+    if not db_conf['engine'] == 'sqlite':
+        raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
+    if dt_begin > dt_end:
+        raise ValueError(f"Invalid input: dt_begin ({dt_begin}) has to be before dt_end ({dt_end})!")
+
+    sql_sensors = "SELECT s.id, mp.name, s.name FROM sensor s INNER JOIN meas_point mp ON s.meas_point_id = mp.id"
+    args_sensors = []
+    if meas_point is not None:
+        sql_sensors += " WHERE mp.name = ?"
+        args_sensors.append(meas_point)
+    if sensors is not None:
+        sql_sensors += " AND" if meas_point is not None else " WHERE"
+        sql_sensors += f" s.name IN ({', '.join('?' * len(sensors))})"
+        args_sensors += list(sensors)
+    sql = f"""
+        SELECT {SQL_MEAS_DATA_COLUMNS}
+        FROM measurement m
+        INNER JOIN meas_val v ON v.measurement_id = m.id
+        INNER JOIN sensor s ON m.sensor_id = s.id
+        INNER JOIN meas_point mp ON s.meas_point_id = mp.id
+        LEFT JOIN derived_metrics d ON d.measurement_id = m.id
+        {SQL_QUALITY_JOIN}
+        WHERE m.id IN (
+            SELECT m.id FROM measurement m
+            {SQL_QUALITY_JOIN}
+            WHERE m.sensor_id = ? AND m.dt >= ? AND (m.dt > ? OR m.id > ?) AND m.dt < ?
+                AND COALESCE(q.quality, {analytics.QUALITY_GOOD}) >= ?
+            ORDER BY m.dt, m.id LIMIT ?
+        )
+        GROUP BY m.id ORDER BY m.dt, m.id
+    """
+    positions = dict(positions or {})
+    rows = {}
+
+    start = time.perf_counter()
+    for m in get_months_between(dt_begin, dt_end):
+        db_path = f"{db_conf['sqlite_path']}/{m}.sqlite"
+        if not os.path.exists(db_path):
+            continue
+        conn, cur = get_sqlite3_connection(db_path)
+        cur.execute(sql_sensors, args_sensors)
+        sensor_ids = {}
+        for s_id, mp_name, s_name in cur.fetchall():
+            sensor_ids.setdefault((mp_name, s_name), []).append(s_id)
+        for series, ids in sensor_ids.items():
+            # New series start at dt_begin
+            position = positions.setdefault(series, (m, str(dt_begin), sys.maxsize))
+            series_rows = rows.setdefault(series, [])
+            if position is None or len(series_rows) > page_size or _shard_order(position[0]) > _shard_order(m):
+                continue
+            shard, dt, mid = position if position[0] == m else (m, position[1], sys.maxsize)
+            limit = page_size + 1 - len(series_rows)
+            for s_id in ids:
+                cur.execute(sql, [s_id, dt, dt, mid, dt_end, min_quality, limit])
+                series_rows += [(m,) + row for row in cur.fetchall()]
+            if len(ids) > 1:
+                series_rows.sort(key=lambda row: (row[2], row[1]))
+                del series_rows[page_size + 1:]
+        conn.close()
+    profiling.record_phase('query', start)
+
+    start = time.perf_counter()
+    parts = []
+    for series in sorted(positions):
+        # Series without a shard in the range are complete
+        series_rows = rows.get(series, [])
+        if len(series_rows) > page_size:
+            # The additional row shows, that the series continues
+            shard, mid, dt = series_rows[page_size - 1][:3]
+            positions[series] = (shard, dt, mid)
+            del series_rows[page_size:]
+        else:
+            positions[series] = None
+        if series_rows:
+            parts.append(pd.DataFrame([row[1:] for row in series_rows], columns=MEAS_DATA_COLUMNS))
+    output = _concat_meas_data(_add_pending_derivation_metrics(parts))
+    profiling.record_phase('analytics', start)
+    if all(position is None for position in positions.values()):
+        positions = None
+    return output, positions
+
+
+def _sqlite_series_rows(cur, mp_name, s_name, dt_from=None):
+    """
+    Fetches the measurements of one sensor series from an opened SQLite database.
+    Bad measurements (see `analytics.robust_estimate`) are skipped.
+
+    :param cur: The SQLite3 cursor object.
+    :param mp_name: The name of the measurement point.
+    :param s_name: The name of the sensor.
+    :param dt_from: Only rows with `dt >= dt_from` are returned, if given.
+
+    :returns: A list of `(measurement_id, dt, avg_value)` tuples, sorted by `dt`.
+    :rtype: list
+    """
+    sql = f"""
+        SELECT m.id, m.dt, {SQL_MEAS_VALUE}
+        FROM meas_val v
+        INNER JOIN measurement m ON v.measurement_id = m.id
+        INNER JOIN sensor s ON m.sensor_id = s.id
+        INNER JOIN meas_point mp ON s.meas_point_id = mp.id
+        {SQL_QUALITY_JOIN}
+        WHERE mp.name = ? AND s.name = ? AND m.dt >= ? AND {SQL_USABLE_QUALITY}
+        GROUP BY m.id
+        ORDER BY m.dt
+    """
+    cur.execute(sql, [mp_name, s_name, dt_from if dt_from is not None else ''])
+    return cur.fetchall()
+
+
+def _sqlite_series_rows_before(cur, mp_name, s_name, dt, limit):
+    """
+    Fetches the last `limit` measurements of one sensor series before `dt` from an opened SQLite database
+    (see `_sqlite_series_rows`). Each sensor id of the series is read backwards in the index
+    `idx_measurement_sensor_dt`, so at most `limit` rows per sensor id are read.
+
+    :returns: A list of `(measurement_id, dt, avg_value)` tuples, sorted by `dt`.
+    :rtype: list
+    """
+    cur.execute(
+        "SELECT s.id FROM sensor s INNER JOIN meas_point mp ON s.meas_point_id = mp.id WHERE mp.name = ? AND s.name = ?",
+        [mp_name, s_name]
+    )
+    rows = []
+    for (sensor_id,) in cur.fetchall():
+        cur.execute(
+            f"""
+            SELECT m.id, m.dt, COALESCE(q.value, (SELECT AVG(v.value) FROM meas_val v WHERE v.measurement_id = m.id))
+            FROM measurement m
+            {SQL_QUALITY_JOIN}
+            WHERE m.sensor_id = ? AND m.dt < ? AND {SQL_USABLE_QUALITY}
+                AND EXISTS (SELECT 1 FROM meas_val v WHERE v.measurement_id = m.id)
+            ORDER BY m.dt DESC
+            LIMIT ?
+            """,
+            [sensor_id, dt, limit]
+        )
+        rows += cur.fetchall()
+    rows.sort(key=lambda r: (r[1], r[0]))
+    return rows[-limit:] if limit > 0 else []
+
+
+def _new_series_of_file(cur):
+    """
+    Finds the sensor series of an opened SQLite database with new measurements, i.e. usable measurements
+    after the last `measurement_id` with derived metrics. The measurements of a file are derived in the
+    order of their ids (see `_update_derived_metrics_of_series`), so only the new rows are read.
+
+    :param cur: The SQLite3 cursor object.
+
+    :returns: The timestamp of the first new measurement per `(meas_point, sensor)`.
+    :rtype: dict
+    """
+    cur.execute("SELECT COALESCE(MAX(measurement_id), 0) FROM derived_metrics")
+    last_id = cur.fetchone()[0]
+    cur.execute(
+        f"""
+        SELECT mp.name, s.name, MIN(m.dt)
+        FROM measurement m
+        INNER JOIN sensor s ON m.sensor_id = s.id
+        INNER JOIN meas_point mp ON s.meas_point_id = mp.id
+        {SQL_QUALITY_JOIN}
+        WHERE m.id > ? AND {SQL_USABLE_QUALITY}
+        GROUP BY mp.name, s.name
+        """,
+        [last_id]
+    )
+    return {(mp_name, s_name): dt for mp_name, s_name, dt in cur.fetchall()}
+
+
+def _update_derived_metrics_of_series(cur, mp_name, s_name, first_new_dt, previous_cur=None):
+    """
+    Updates the `derived_metrics` rows of one sensor series after new measurements.
+
+    The stored metrics are the metrics of the continuous series of the sensor, so they do not depend on
+    the month files or on the range of a `/get/` request. The new measurements (from `first_new_dt` on)
+    are calculated together with the `DERIVED_CONTEXT_ROWS` measurements in front of them, which are taken
+    from the previous month file (`previous_cur`), if the month file has less. The first half of the context
+    rows is not written back, because the gradient and the Savitzky-Golay filter are not valid at the
+    beginning of the window, the second half is written back to the file it belongs to.
+
+    Series with not more than `SAVGOL_MIN_SAMPLES` measurements in front of the new ones are calculated
+    completely, because the filter is only applied to longer series. Series with less than `SAVGOL_WINDOW`
+    measurements are skipped, `/get/` calculates their metrics until they are longer.
+
+    :param cur: The SQLite3 cursor object of the month file.
+    :param mp_name: The name of the measurement point.
+    :param s_name: The name of the sensor.
+    :param first_new_dt: The timestamp of the first new measurement (see `_new_series_of_file`).
+    :param previous_cur: The SQLite3 cursor object of the previous month file, if it exists.
+
+    :returns: The number of written rows and the timestamp of the first written row per changed file
+        as list of `(cursor, count, dt)`.
+    :rtype: list
+    """
+    before = [(cur, r) for r in _sqlite_series_rows_before(
+        cur, mp_name, s_name, first_new_dt, analytics.SAVGOL_MIN_SAMPLES + 1
+    )]
+    if len(before) <= analytics.SAVGOL_MIN_SAMPLES and previous_cur is not None:
+        before = [(previous_cur, r) for r in _sqlite_series_rows_before(
+            previous_cur, mp_name, s_name, first_new_dt, analytics.SAVGOL_MIN_SAMPLES + 1 - len(before)
+        )] + before
+    if len(before) > analytics.SAVGOL_MIN_SAMPLES:
+        window = before[-analytics.DERIVED_CONTEXT_ROWS:]
+        skip = analytics.DERIVED_CONTEXT_ROWS // 2
+        smooth = True
+    else:
+        window = before
+        skip = 0
+        smooth = None
+    window += [(cur, r) for r in _sqlite_series_rows(cur, mp_name, s_name, first_new_dt)]
+    if len(window) < analytics.SAVGOL_WINDOW:
+        return []
+
+    metrics = analytics.compute_derivation_metrics(
+        analytics.to_hours([r[1] for _, r in window]),
+        np.asarray([r[2] for _, r in window], dtype=float),
+        smooth=smooth
+    )
+    data = {}
+    for i in range(skip, len(window)):
+        file_cur, (measurement_id, dt, _) = window[i]
+        data.setdefault(file_cur, []).append((
+            measurement_id, dt,
+            convert_nan_to_none(float(metrics['derivation'][i])),
+            convert_nan_to_none(float(metrics['derivation_10'][i])),
+            convert_nan_to_none(float(metrics['peaks_pos'][i])),
+            convert_nan_to_none(float(metrics['peaks_neg'][i])),
+        ))
+    for file_cur, rows in data.items():
+        file_cur.executemany(
+            """
+            INSERT OR REPLACE INTO derived_metrics(measurement_id, dt, derivation, derivation_10, peaks_pos, peaks_neg)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+    return [(file_cur, len(rows), rows[0][1]) for file_cur, rows in data.items()]
+
+
+def _update_events_of_series(cur, mp_name, s_name, dt_changed):
+    """
+    Updates the stored refill and consumption events of one sensor series in an opened SQLite database.
+
+    The events are detected again from the beginning of the last stored event (which might
+    still be running) or from `dt_changed`, whichever is earlier. Older events are kept.
+
+    :param cur: The SQLite3 cursor object.
+    :param mp_name: The name of the measurement point.
+    :param s_name: The name of the sensor.
+    :param dt_changed: The timestamp of the first row with changed derived metrics.
+
+    :returns: The number of written events.
+    :rtype: int
+    """
+    cur.execute(
+        """
+        SELECT MIN(dt_begin) FROM events
+        WHERE meas_point = ? AND sensor = ? AND (
+            dt_end >= ? OR dt_end = (SELECT MAX(dt_end) FROM events WHERE meas_point = ? AND sensor = ?)
+        )
+        """,
+        [mp_name, s_name, dt_changed, mp_name, s_name]
+    )
+    dt_from = cur.fetchone()[0]
+    if dt_from is None or dt_changed < dt_from:
+        dt_from = dt_changed
+    cur.execute(
+        "DELETE FROM events WHERE meas_point = ? AND sensor = ? AND dt_begin >= ?",
+        [mp_name, s_name, dt_from]
+    )
+
+    cur.execute(
+        f"""
+        SELECT m.dt, s.tank_height - {SQL_MEAS_VALUE}, d.derivation_10
+        FROM meas_val v
+        INNER JOIN measurement m ON v.measurement_id = m.id
+        INNER JOIN sensor s ON m.sensor_id = s.id
+        INNER JOIN meas_point mp ON s.meas_point_id = mp.id
+        INNER JOIN derived_metrics d ON d.measurement_id = m.id
+        {SQL_QUALITY_JOIN}
+        WHERE mp.name = ? AND s.name = ? AND m.dt >= ?
+        GROUP BY m.id
+        ORDER BY m.dt
+        """,
+        [mp_name, s_name, dt_from]
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return 0
+    dts, level, rate = zip(*rows)
+    events = analytics.detect_events(
+        analytics.to_hours(dts),
+        np.asarray(level, dtype=float),
+        np.asarray(rate, dtype=float)
+    )
+    cur.executemany(
+        """
+        INSERT INTO events(meas_point, sensor, event_type, dt_begin, dt_end, value_begin, value_end, volume, rate)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                mp_name, s_name, e['event_type'], dts[e['begin']], dts[e['end']],
+                round(e['value_begin'], 1), round(e['value_end'], 1), e['volume'], e['rate']
+            )
+            for e in events
+        ]
+    )
+    return len(events)
+
+
+def update_derived_metrics(db_conf, db_file_names=None):
+    """
+    Updates the stored derived metrics (derivation, smoothed derivation and peaks) and the
+    refill and consumption events of all sensors. The hourly levels are updated as well
+    (see `update_hourly_levels`).
+
+    The metrics are maintained incrementally: for each sensor series only the new measurements and
+    the trailing window needed by the gradient and the Savitzky-Golay filter are recalculated
+    (see `_update_derived_metrics_of_series`), the window reaches into the previous month file, so
+    the metrics are continuous across the files. Afterwards the events of the changed part of the
+    series are detected again (see `_update_events_of_series`).
+    Files without new measurements cost one query of the primary key (see `_new_series_of_file`).
+
+    :param db_conf: A dictionary containing the database configuration.
+        It should have the following keys:
+        - 'engine': Should be 'sqlite' for this function to work.
+        - 'sqlite_path': The file path to the SQLite database directory.
+
+    :param db_file_names: The SQLite files (e.g. `['12-2024.sqlite']`) to update.
+        If not given, all SQLite files in `sqlite_path` are updated.
+    :type db_file_names: list, optional
+
+    :returns: The number of written rows.
+    :rtype: int
+
+    :raises ValueError: If the 'engine' in db_conf is not 'sqlite'.
+
+    **Example usage**::
+
+        db_conf = {
+            'engine': 'sqlite',
+            'sqlite_path': '/path/to/db/'
+        }
+        update_derived_metrics(db_conf, ['12-2024.sqlite'])
+    """
+    if not db_conf['engine'] == 'sqlite':
+        raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
+    if db_file_names is None:
+        db_file_names = get_all_sqlite_files(db_conf['sqlite_path'])
+
+    written = 0
+    for db_file_name in db_file_names:
+        db_path = db_conf['sqlite_path'] + db_file_name
+        if not os.path.exists(db_path):
+            continue
+        previous_path = db_conf['sqlite_path'] + _previous_month_file(db_file_name)
+        with _write_lock:
+            conn, cur = get_sqlite3_connection(db_path)
+            previous_conn = None
+            try:
+                new_series = _new_series_of_file(cur)
+                previous_cur = None
+                if new_series and os.path.exists(previous_path):
+                    previous_conn, previous_cur = get_sqlite3_connection(previous_path)
+                for (mp_name, s_name), first_new_dt in new_series.items():
+                    changed = _update_derived_metrics_of_series(cur, mp_name, s_name, first_new_dt, previous_cur)
+                    for file_cur, count, dt_changed in changed:
+                        _update_events_of_series(file_cur, mp_name, s_name, dt_changed)
+                        written += count
+                _update_hourly_levels(cur)
+                if previous_conn is not None:
+                    previous_conn.commit()
+                conn.commit()
+            except Error as e:
+                print(f"SQL ERROR while updating derived metrics in {db_path}: {e}")
+            finally:
+                if previous_conn is not None:
+                    previous_conn.close()
+                conn.close()
+    return written
+
+def _update_hourly_levels(cur):
+    cur.execute(f"""
+        SELECT MIN(m.dt)
+        FROM measurement m
+        {SQL_QUALITY_JOIN}
+        WHERE m.id > (SELECT COALESCE(MAX(last_measurement_id), 0) FROM hourly_levels) AND {SQL_USABLE_QUALITY}
+    """)
+    dt_from = cur.fetchone()[0]
+    if dt_from is None:
+        return 0
+    dt_from = datetime.fromisoformat(dt_from)
+    if dt_from.tzinfo is None:
+        dt_from = dt_from.replace(tzinfo=timezone.utc)
+    dt_from = dt_from.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    # Compared in UTC seconds, because the stored timestamps may have any UTC offset
+    cur.execute(f"""
+        INSERT OR REPLACE INTO hourly_levels(
+            sensor_id, hour, level_mean, level_min, level_max, count, last_measurement_id
+        )
+        SELECT sensor_id, hour, AVG(level), MIN(level), MAX(level), COUNT(*), MAX(id)
+        FROM (
+            SELECT m.sensor_id AS sensor_id, m.id AS id,
+                CAST(strftime('%s', m.dt) AS INTEGER) / 3600 AS hour,
+                s.tank_height - {SQL_MEAS_VALUE} AS level
+            FROM meas_val v
+            INNER JOIN measurement m ON v.measurement_id = m.id
+            INNER JOIN sensor s ON m.sensor_id = s.id
+            {SQL_QUALITY_JOIN}
+            WHERE CAST(strftime('%s', m.dt) AS INTEGER) >= ? AND {SQL_USABLE_QUALITY}
+            GROUP BY m.id
+        )
+        GROUP BY sensor_id, hour
+    """, [int(dt_from.timestamp())])
+    return cur.rowcount
+
+def update_hourly_levels(db_conf, db_file_names=None):
+    """
+    Updates the hourly levels (mean, minimum and maximum water level per sensor and hour).
+
+    The hourly levels are maintained incrementally: only the hours from the earliest measurement
+    inserted since the last update on are aggregated again. Bad measurements are skipped.
+    Hours are counted in UTC since 1970-01-01.
+
+    :param db_conf: A dictionary containing the database configuration.
+        It should have the following keys:
+        - 'engine': Should be 'sqlite' for this function to work.
+        - 'sqlite_path': The file path to the SQLite database directory.
+
+    :param db_file_names: The SQLite files (e.g. `['12-2024.sqlite']`) to update.
+        If not given, all SQLite files in `sqlite_path` are updated.
+    :type db_file_names: list, optional
+
+    :returns: The number of written rows.
+    :rtype: int
+
+    :raises ValueError: If the 'engine' in db_conf is not 'sqlite'.
+
+    **Example usage**::
+
+        update_hourly_levels(db_conf, ['12-2024.sqlite'])
+    """
+    if not db_conf['engine'] == 'sqlite':
+        raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
+    if db_file_names is None:
+        db_file_names = get_all_sqlite_files(db_conf['sqlite_path'])
+
+    written = 0
+    for db_file_name in db_file_names:
+        db_path = db_conf['sqlite_path'] + db_file_name
+        if not os.path.exists(db_path):
+            continue
+        with _write_lock:
+            conn, cur = get_sqlite3_connection(db_path)
+            try:
+                written += _update_hourly_levels(cur)
+                conn.commit()
+            except Error as e:
+                print(f"SQL ERROR while updating hourly levels in {db_path}: {e}")
+            finally:
+                conn.close()
+    return written
+
+def get_hourly_levels_from_sqlite_db(db_conf, dt_begin, dt_end, hours_of_day=None):
+    """
+    Retrieve the hourly levels of all sensors within a specified date range.
+
+    The rows are read as numbers only, the sensors are returned once, so a whole year of a fleet
+    is read in a few seconds.
+
+    :param db_conf: Configuration dictionary containing database connection settings. Must include the key
+        `engine` with value `'sqlite'` and `sqlite_path` specifying the path to the database files.
+    :type db_conf: dict
+
+    :param dt_begin: Start of the date range.
+    :type dt_begin: datetime
+
+    :param dt_end: End of the date range.
+    :type dt_end: datetime
+
+    :param hours_of_day: Only return these hours of the day (UTC), if given.
+    :type hours_of_day: list, optional
+
+    :returns: A tuple with the list of sensors as `(meas_point, sensor)` tuples and a DataFrame with the
+        columns `sensor_index` (index in the list of sensors), `hour` (hours since epoch) and `level_mean`.
+    :rtype: tuple
+
+    :raises ValueError: If the 'engine' in db_conf is not 'sqlite'.
+
+    **Example usage**::
+
+        sensors, hourly = get_hourly_levels_from_sqlite_db(db_conf, datetime(2024, 1, 1, tzinfo=pytz.utc), datetime(2025, 1, 1, tzinfo=pytz.utc))
+    """
+    if not db_conf['engine'] == 'sqlite':
+        raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
+
+    sql = """
+        SELECT sensor_id, hour, level_mean
+        FROM hourly_levels
+        WHERE hour >= ? AND hour < ?
+    """
+    args = [int(analytics.to_hour(dt_begin)), int(np.ceil(analytics.to_hour(dt_end)))]
+    if hours_of_day is not None:
+        sql += f" AND hour % 24 IN ({', '.join('?' * len(hours_of_day))})"
+        args += [int(h) for h in hours_of_day]
+    sensors = {}
+    parts = []
+    for m in get_months_between(dt_begin, dt_end):
+        db_path = f"{db_conf['sqlite_path']}/{m}.sqlite"
+        if not os.path.exists(db_path):
+            continue
+        conn, cur = get_sqlite3_connection(db_path)
+        cur.execute("""
+            SELECT s.id, mp.name, s.name
+            FROM sensor s
+            INNER JOIN meas_point mp ON s.meas_point_id = mp.id
+        """)
+        # Sensor ids are local to a SQLite file
+        index = {row[0]: sensors.setdefault((row[1], row[2]), len(sensors)) for row in cur.fetchall()}
+        cur.execute(sql, args)
+        part = np.array(cur.fetchall(), dtype=float).reshape(-1, 3)
+        conn.close()
+        lookup = np.zeros(max(index, default=0) + 1, dtype=np.int64)
+        lookup[list(index)] = list(index.values())
+        parts.append(pd.DataFrame({
+            'sensor_index': lookup[part[:, 0].astype(np.int64)],
+            'hour': part[:, 1].astype(np.int64),
+            'level_mean': part[:, 2],
+        }))
+    if not parts:
+        return [], pd.DataFrame({'sensor_index': [], 'hour': [], 'level_mean': []})
+    return list(sensors), pd.concat(parts, ignore_index=True)
+
+def store_night_baselines(db_conf, baselines):
+    """
+    Stores the night-time baseline consumption of the sensors. Existing nights are replaced.
+
+    :param db_conf: Configuration dictionary containing database connection settings. Must include the key
+        `engine` with value `'sqlite'` and `sqlite_path` specifying the path to the database files.
+    :type db_conf: dict
+
+    :param baselines: A list of `(meas_point, sensor, night, baseline, hours, leak)` tuples. `night` is the
+        date (`datetime.date`) of the morning the night ends. Each night is stored in the SQLite file of
+        its month, nights without SQLite file are skipped.
+    :type baselines: list
+
+    :returns: The number of stored nights.
+    :rtype: int
+
+    :raises ValueError: If the 'engine' in db_conf is not 'sqlite'.
+    """
+    if not db_conf['engine'] == 'sqlite':
+        raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
+
+    by_file = {}
+    for row in baselines:
+        by_file.setdefault(f"{row[2].month:02d}-{row[2].year}.sqlite", []).append(row)
+    stored = 0
+    for db_file_name, rows in by_file.items():
+        db_path = db_conf['sqlite_path'] + db_file_name
+        if not os.path.exists(db_path):
+            continue
+        with _write_lock:
+            conn, cur = get_sqlite3_connection(db_path)
+            try:
+                cur.executemany("""
+                    INSERT OR REPLACE INTO night_baselines(meas_point, sensor, night, baseline, hours, leak)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [(r[0], r[1], r[2].isoformat(), r[3], r[4], int(r[5])) for r in rows])
+                conn.commit()
+                stored += len(rows)
+            except Error as e:
+                print(f"SQL ERROR while storing night baselines in {db_path}: {e}")
+            finally:
+                conn.close()
+    return stored
+
+def get_last_night_baseline_date(db_conf):
+    """
+    Returns the date of the last stored night baseline (see `store_night_baselines`) or `None`.
+
+    :param db_conf: Configuration dictionary containing database connection settings.
+    :type db_conf: dict
+
+    :rtype: datetime.date
+    """
+    for db_file_name in reversed(get_all_sqlite_files(db_conf['sqlite_path'])):
+        conn, cur = get_sqlite3_connection(db_conf['sqlite_path'] + db_file_name)
+        cur.execute("SELECT MAX(night) FROM night_baselines")
+        night = cur.fetchone()[0]
+        conn.close()
+        if night is not None:
+            return date.fromisoformat(night)
+    return None
+
+def get_night_baselines_from_sqlite_db(db_conf, dt_begin, dt_end, meas_point=None):
+    """
+    Retrieve the stored night-time baseline consumption and leak flags within a specified date range.
+
+    :param db_conf: Configuration dictionary containing database connection settings. Must include the key
+        `engine` with value `'sqlite'` and `sqlite_path` specifying the path to the database files.
+    :type db_conf: dict
+
+    :param dt_begin: Start of the date range.
+    :type dt_begin: datetime
+
+    :param dt_end: End of the date range.
+    :type dt_end: datetime
+
+    :param meas_point: Only return the nights of this measurement point, if given.
+    :type meas_point: str, optional
+
+    :returns: A nested dictionary `output[meas_point][sensor]` with a list of nights sorted by date. Each
+        night contains `night`, `baseline` (consumption in cm/h), `hours` and `leak`.
+    :rtype: dict
+
+    :raises ValueError: If the 'engine' in db_conf is not 'sqlite' or `dt_begin` is after `dt_end`.
+
+    **Example usage**::
+
+        nights = get_night_baselines_from_sqlite_db(db_conf, datetime(2024, 12, 1), datetime(2024, 12, 31), 'raspi1')
+        leaks = [n['night'] for n in nights['raspi1']['left_tank'] if n['leak']]
+    """
+    if not db_conf['engine'] == 'sqlite':
+        raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
+    if dt_begin > dt_end:
+        raise ValueError(f"Invalid input: dt_begin ({dt_begin}) has to be before dt_end ({dt_end})!")
+
+    sql = """
+        SELECT meas_point, sensor, night, baseline, hours, leak
+        FROM night_baselines
+        WHERE night >= ? AND night <= ?
+    """
+    args = [dt_begin.date().isoformat(), dt_end.date().isoformat()]
+    if meas_point is not None:
+        sql += " AND meas_point = ?"
+        args.append(meas_point)
+    sql += " ORDER BY night"
+
+    output = {}
+    for m in get_months_between(dt_begin, dt_end):
+        db_path = f"{db_conf['sqlite_path']}/{m}.sqlite"
+        if not os.path.exists(db_path):
+            continue
+        conn, cur = get_sqlite3_connection(db_path)
+        cur.execute(sql, args)
+        for row in cur.fetchall():
+            output.setdefault(row[0], {}).setdefault(row[1], []).append({
+                'night': row[2],
+                'baseline': row[3],
+                'hours': row[4],
+                'leak': bool(row[5]),
+            })
+        conn.close()
+    return output
+
+def get_recent_levels_from_sqlite_db(db_conf, dt_begin, dt_end):
+    """
+    Retrieve the water levels of all sensors within a (short) date range.
+
+    :param db_conf: Configuration dictionary containing database connection settings. Must include the key
+        `engine` with value `'sqlite'` and `sqlite_path` specifying the path to the database files.
+    :type db_conf: dict
+
+    :param dt_begin: Start of the date range.
+    :type dt_begin: datetime
+
+    :param dt_end: End of the date range.
+    :type dt_end: datetime
+
+    :returns: A dictionary `output[(meas_point, sensor)]` with a list of `(dt, level, warn, alarm)` tuples
+        sorted by `dt`. The level is `tank_height - AVG(value)`.
+    :rtype: dict
+
+    :raises ValueError: If the 'engine' in db_conf is not 'sqlite'.
+
+    **Example usage**::
+
+        recent = get_recent_levels_from_sqlite_db(db_conf, datetime.now(timezone.utc) - timedelta(hours=6), datetime.now(timezone.utc))
+    """
+    if not db_conf['engine'] == 'sqlite':
+        raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
+
+    sql = f"""
+        SELECT mp.name, s.name, m.dt, s.tank_height - {SQL_MEAS_VALUE}, s.warn, s.alarm
+        FROM meas_val v
+        INNER JOIN measurement m ON v.measurement_id = m.id
+        INNER JOIN sensor s ON m.sensor_id = s.id
+        INNER JOIN meas_point mp ON s.meas_point_id = mp.id
+        {SQL_QUALITY_JOIN}
+        WHERE m.dt > ? AND m.dt < ? AND {SQL_USABLE_QUALITY}
+        GROUP BY m.id
+        ORDER BY m.dt
+    """
+    output = {}
+    for m in get_months_between(dt_begin, dt_end):
+        db_path = f"{db_conf['sqlite_path']}/{m}.sqlite"
+        if not os.path.exists(db_path):
+            continue
+        conn, cur = get_sqlite3_connection(db_path)
+        cur.execute(sql, [dt_begin, dt_end])
+        for row in cur.fetchall():
+            output.setdefault((row[0], row[1]), []).append(row[2:])
+        conn.close()
+    return output
+
+def get_events_from_sqlite_db(db_conf, dt_begin, dt_end, meas_point=None):
+    """
+    Retrieve the stored refill and consumption events within a specified date range.
+
+    :param db_conf: Configuration dictionary containing database connection settings. Must include the key
+        `engine` with value `'sqlite'` and `sqlite_path` specifying the path to the database files.
+    :type db_conf: dict
+
+    :param dt_begin: Start of the date range. Events ending before are not returned.
+    :type dt_begin: datetime
+
+    :param dt_end: End of the date range. Events beginning after are not returned.
+    :type dt_end: datetime
+
+    :param meas_point: Only return events of this measurement point, if given.
+    :type meas_point: str, optional
+
+    :returns: A nested dictionary `output[meas_point][sensor]` with a list of events sorted by their
+        beginning. Each event contains `event_type`, `dt_begin`, `dt_end`, `value_begin`, `value_end`,
+        `volume` and `rate`.
+    :rtype: dict
+
+    :raises ValueError: If the 'engine' in db_conf is not 'sqlite' or `dt_begin` is after `dt_end`.
+
+    .. note::
+
+        Events are detected per SQLite file, so an event running over the turn of a month is
+        returned as two events.
+
+    **Example usage**::
+
+        events = get_events_from_sqlite_db(db_conf, datetime(2024, 12, 1), datetime(2024, 12, 31), 'raspi1')
+        for e in events['raspi1']['left_tank']:
+            print(e['event_type'], e['dt_begin'], e['volume'])
+    """
+    if not db_conf['engine'] == 'sqlite':
+        raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
+    if dt_begin > dt_end:
+        raise ValueError(f"Invalid input: dt_begin ({dt_begin}) has to be before dt_end ({dt_end})!")
+
+    sql = """
+        SELECT meas_point, sensor, event_type, dt_begin, dt_end, value_begin, value_end, volume, rate
+        FROM events
+        WHERE dt_end > ? AND dt_begin < ?
+    """
+    args = [dt_begin, dt_end]
+    if meas_point is not None:
+        sql += " AND meas_point = ?"
+        args.append(meas_point)
+    sql += " ORDER BY dt_begin"
+
+    output = {}
+    for m in get_months_between(dt_begin, dt_end):
+        db_path = f"{db_conf['sqlite_path']}/{m}.sqlite"
+        if not os.path.exists(db_path):
+            continue
+        conn, cur = get_sqlite3_connection(db_path)
+        cur.execute(sql, args)
+        for row in cur.fetchall():
+            output.setdefault(row[0], {}).setdefault(row[1], []).append({
+                'event_type': row[2],
+                'dt_begin': row[3],
+                'dt_end': row[4],
+                'value_begin': row[5],
+                'value_end': row[6],
+                'volume': row[7],
+                'rate': row[8],
+            })
+        conn.close()
     return output
 
 def get_latest_database_file(path):
@@ -746,6 +1968,61 @@ def get_all_sqlite_files(path):
             )
     return [x.strftime("%m-%Y.sqlite") for x in sorted(datetime_list)]
 
+# SQLite file -> (file change counter, last measurement id)
+_shard_versions = {}
+
+def _file_change_counter(path):
+    # Bytes 24-27 of the SQLite header are incremented by each write transaction
+    with open(path, 'rb') as f:
+        f.seek(24)
+        counter = int.from_bytes(f.read(4), 'big')
+    # In WAL mode the header only changes with the checkpoints, the transactions increment the
+    # counter in bytes 8-11 of the WAL index
+    try:
+        with open(path + '-shm', 'rb') as f:
+            f.seek(8)
+            return counter, int.from_bytes(f.read(4), sys.byteorder)
+    except FileNotFoundError:
+        return counter
+
+def get_data_version(db_conf):
+    """
+    Returns the version of the stored data, which changes with each insert and each write of the
+    background tasks (derived metrics, events, hourly levels, night baselines).
+
+    The version consists of the last measurement id (the insert sequence) and the file change counter
+    of the SQLite header of each file (and the change counter of the WAL index in WAL mode, see
+    `configure_sqlite`). The last measurement id is only queried again, if the file change counter
+    changed, so an unchanged database costs one read of 4 bytes per file.
+
+    :param db_conf: A dictionary containing the database configuration (see `insert_value`).
+    :type db_conf: dict
+
+    :returns: A tuple with the file name, the last measurement id and the file change counter of each file.
+    :rtype: tuple
+
+    **Example usage**::
+
+        get_data_version(db_conf)
+        # (('11-2024.sqlite', 43200, 1811), ('12-2024.sqlite', 1523, 97))
+    """
+    version = []
+    for file_name in get_all_sqlite_files(db_conf['sqlite_path']):
+        path = db_conf['sqlite_path'] + file_name
+        counter = _file_change_counter(path)
+        cached = _shard_versions.get(path)
+        if cached is None or cached[0] != counter:
+            conn = _sqlite3_connect(path, 'get_data_version')
+            try:
+                last_id = conn.execute("SELECT MAX(id) FROM measurement").fetchone()[0]
+            except Error:
+                last_id = None
+            finally:
+                conn.close()
+            cached = _shard_versions[path] = (counter, last_id)
+        version.append((file_name, cached[1], counter))
+    return tuple(version)
+
 def assign_color(value, warn, alarm):
     if value < alarm:
         return 'alarm'
@@ -754,8 +2031,8 @@ def assign_color(value, warn, alarm):
     else:
         return 'normal'
 
-def assign_sign(value,warn,alarm, dt):
-    if datetime.fromisoformat(dt) < datetime.now(tz=pytz.utc) - timedelta(minutes=15):
+def assign_sign(value,warn,alarm, dt, now=None):
+    if datetime.fromisoformat(dt) < (now or datetime.now(tz=pytz.utc)) - timedelta(minutes=15):
         return '⚪'
     else:
         if value < alarm:
@@ -812,19 +2089,22 @@ def get_last_meas_data_from_sqlite_db(db_conf):
     db_path_list = [db_conf['sqlite_path'] + x for x in get_all_sqlite_files(db_conf['sqlite_path'])]
     print (db_path_list)
 
-    sql = """
-        SELECT m.id, m.dt, mp.name, s.name, s.max_val, s.warn, s.alarm, AVG(v.value), tank_height
+    sql = f"""
+        SELECT m.id, m.dt, mp.name, s.name, s.max_val, s.warn, s.alarm, {SQL_MEAS_VALUE}, tank_height
         FROM meas_val v
         INNER JOIN measurement m ON v.measurement_id = m.id
         INNER JOIN sensor s ON m.sensor_id = s.id
         INNER JOIN meas_point mp ON s.meas_point_id = mp.id
+        {SQL_QUALITY_JOIN}
         WHERE m.id IN (
             SELECT id
             FROM measurement m_inner
             WHERE m_inner.dt = (
                 SELECT MAX(m_inner2.dt)
                 FROM measurement m_inner2
+                LEFT JOIN meas_quality q2 ON q2.measurement_id = m_inner2.id
                 WHERE m_inner2.sensor_id = m_inner.sensor_id
+                AND COALESCE(q2.quality, {analytics.QUALITY_GOOD}) > {analytics.QUALITY_BAD}
             )
         )
         GROUP BY m.dt;  
@@ -896,24 +2176,42 @@ def get_available_meas_points_from_sqlite_db(db_conf):
     """
     if not db_conf['engine'] == 'sqlite':
         raise ValueError("Invalid Database function call: This functions is only for sqlite3 approach. Please configure it in your config.cfg file.")
-    db_path_list = [db_conf['sqlite_path'] + x for x in get_all_sqlite_files(db_conf['sqlite_path'])]
-
-    sql = "SELECT DISTINCT(name) FROM meas_point;"
     last_data = get_last_meas_data_from_sqlite_db(db_conf)
 
     output = {}
+    for mp_name in get_meas_point_names_from_sqlite_db(db_conf):
+        #output.append({
+        #    "name":row[0],
+        #    "status": [{'sensor':x, 'status':assign_sign(last_data[row[0]][x]['value'],last_data[row[0]][x]['warn'],last_data[row[0]][x]['alarm'])} for x in last_data[row[0]]]
+        #})
+        #o_str = f"{row[0]}".join([(f" {assign_sign(last_data[row[0]][x]['value'],last_data[row[0]][x]['warn'],last_data[row[0]][x]['alarm'])}") for x in last_data[row[0]]])
+        output[mp_name] = [f" {assign_sign(last_data[mp_name][x]['value'],last_data[mp_name][x]['warn'],last_data[mp_name][x]['alarm'],last_data[mp_name][x]['dt'])}" for x in last_data[mp_name]]
+
+    return output
+
+def get_meas_point_names_from_sqlite_db(db_conf):
+    """
+    Returns the names of all measurement points in the SQLite files.
+
+    :param dict db_conf: A dictionary containing the database configuration (see `get_available_meas_points_from_sqlite_db`).
+
+    :returns: The unique measurement point names in the order of their first appearance.
+    :rtype: list
+
+    **Example usage**::
+
+        get_meas_point_names_from_sqlite_db(db_conf)
+        # ['raspi1', 'raspi2']
+    """
+    db_path_list = [db_conf['sqlite_path'] + x for x in get_all_sqlite_files(db_conf['sqlite_path'])]
+    sql = "SELECT DISTINCT(name) FROM meas_point;"
+    output = []
     for db_path in db_path_list:
         conn, cur = get_sqlite3_connection(db_path)
         cur.execute(sql)
-        res = cur.fetchall()
-        for row in res:
+        for row in cur.fetchall():
             if not row[0] in output:
-                #output.append({
-                #    "name":row[0],
-                #    "status": [{'sensor':x, 'status':assign_sign(last_data[row[0]][x]['value'],last_data[row[0]][x]['warn'],last_data[row[0]][x]['alarm'])} for x in last_data[row[0]]]
-                #})
-                #o_str = f"{row[0]}".join([(f" {assign_sign(last_data[row[0]][x]['value'],last_data[row[0]][x]['warn'],last_data[row[0]][x]['alarm'])}") for x in last_data[row[0]]])
-                output[row[0]] = [f" {assign_sign(last_data[row[0]][x]['value'],last_data[row[0]][x]['warn'],last_data[row[0]][x]['alarm'],last_data[row[0]][x]['dt'])}" for x in last_data[row[0]]]
-
+                output.append(row[0])
+        conn.close()
     return output
 
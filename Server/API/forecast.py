@@ -0,0 +1,125 @@
+"""
+Module Name: Wassermonitor2 API forecast
+
+Description:
+    This file keeps the forecast of the time until each sensor crosses its warning threshold,
+    its alarm threshold and zero.
+
+    The API process holds a short window of recent levels per sensor in memory. Each insert
+    appends one sample to the window of its sensor and recalculates the forecast of this sensor
+    with `analytics.forecast_crossings`, so no database query is needed on the insert path.
+    After the startup the windows are loaded from the database with `load_forecast_windows`.
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import bisect
+import threading
+from datetime import datetime, timezone, timedelta
+
+import analytics
+import database_utils as dbu
+
+_lock = threading.Lock()
+# (meas_point, sensor) -> sorted list of (hours, level)
+_windows = {}
+# meas_point -> sensor -> forecast dictionary
+_forecasts = {}
+
+
+def _calculate(key, warn, alarm):
+    window = _windows[key]
+    hours = [x[0] for x in window]
+    level = [x[1] for x in window]
+    result = analytics.forecast_crossings(hours, level, {'warn': warn, 'alarm': alarm, 'empty': 0.0})
+    _forecasts.setdefault(key[0], {})[key[1]] = result
+
+
+def add_sample(meas_point, sensor, dt, level, warn, alarm):
+    """
+    Adds a sample to the window of a sensor and updates the forecast of this sensor.
+
+    Samples older than `analytics.FORECAST_WINDOW_HOURS` before the newest sample of the
+    window are ignored.
+
+    :param meas_point: The name of the measurement point.
+    :param sensor: The name of the sensor.
+    :param dt: The timestamp of the sample.
+    :type dt: datetime or str
+    :param level: The water level (`tank_height - meas_val`) of the sample.
+    :param warn: The warning threshold of the sensor.
+    :param alarm: The alarm threshold of the sensor.
+
+    **Example usage**::
+
+        add_sample('raspi1', 'left_tank', '2024-12-15T10:00:00+00:00', 95.3, 90, 70)
+    """
+    hours = analytics.to_hour(dt)
+    key = (meas_point, sensor)
+    with _lock:
+        window = _windows.setdefault(key, [])
+        if window and hours < window[-1][0] - analytics.FORECAST_WINDOW_HOURS:
+            return
+        bisect.insort(window, (hours, float(level)))
+        first = bisect.bisect_left(window, (window[-1][0] - analytics.FORECAST_WINDOW_HOURS,))
+        del window[:first]
+        _calculate(key, warn, alarm)
+
+
+def add_measurement(measurement, quality):
+    """
+    Adds an inserted measurement (see `main.SensorData`) to the forecast.
+    Bad measurements are ignored.
+
+    :param measurement: The inserted measurement data.
+    :type measurement: dict
+
+    :param quality: The robust value and the quality of the measurement (see `analytics.robust_estimate`).
+    :type quality: dict
+    """
+    if quality['quality'] == analytics.QUALITY_BAD:
+        return
+    add_sample(
+        measurement['meas_point'],
+        measurement['sensor_name'],
+        measurement['datetime'],
+        measurement['tank_height'] - quality['value'],
+        measurement['warn'],
+        measurement['alarm'],
+    )
+
+
+def get_forecast(meas_point, sensor):
+    """
+    Returns the current forecast of a sensor.
+
+    :returns: The forecast dictionary (see `analytics.forecast_crossings`) or `None`,
+        if there is not enough recent data.
+    :rtype: dict
+    """
+    with _lock:
+        return _forecasts.get(meas_point, {}).get(sensor)
+
+
+def load_forecast_windows(db_conf):
+    """
+    Loads the recent levels of all sensors from the database and calculates their forecasts.
+    The samples, which were added by inserts meanwhile, are kept.
+
+    :param db_conf: A dictionary containing the database configuration (see `database_utils`).
+    :type db_conf: dict
+    """
+    dt_end = datetime.now(timezone.utc)
+    dt_begin = dt_end - timedelta(hours=analytics.FORECAST_WINDOW_HOURS)
+    recent = dbu.get_recent_levels_from_sqlite_db(db_conf, dt_begin, dt_end)
+    with _lock:
+        for (meas_point, sensor), rows in recent.items():
+            key = (meas_point, sensor)
+            # One by one like on insert, so the loading does not import pandas (see lazy)
+            samples = {analytics.to_hour(r[0]): float(r[1]) for r in rows}
+            samples.update(_windows.get(key, []))
+            window = sorted(samples.items())
+            first = bisect.bisect_left(window, (window[-1][0] - analytics.FORECAST_WINDOW_HOURS,))
+            _windows[key] = window[first:]
+            _calculate(key, rows[-1][2], rows[-1][3])
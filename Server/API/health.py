@@ -0,0 +1,211 @@
+"""
+Module Name: Wassermonitor2 API sensor health
+
+Description:
+    This file keeps a streaming health monitor of each sensor, which detects stuck, noisy and
+    drifting sensors and sensors which stopped sending.
+
+    The API process holds a fixed number of exponentially weighted moving averages (EWMA) per
+    sensor in memory. Each insert updates the state of its sensor in constant time with
+    `add_measurement`, so neither the insert path nor `get_health` query the database. The
+    averages are weighted by the time between two measurements, so irregular measurement
+    intervals do not change the result. On startup the states are warmed up from the database
+    with `load_health_state`.
+
+    A sensor is
+
+    - `stuck`, if its level did not change by more than `STUCK_TOLERANCE` for `STUCK_HOURS`.
+    - `noisy`, if the average spread of its raw values, the average jump of its level or the
+      share of bad measurements (see `analytics.robust_estimate`) is too high.
+    - `drifting`, if its level rises slowly over hours. Refills are faster than
+      `analytics.EVENT_REFILL_RATE` and are not part of this average.
+    - `silent`, if it did not send a measurement for `SILENT_HOURS`.
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import math
+import threading
+from datetime import datetime, timezone, timedelta
+
+import analytics
+import database_utils as dbu
+
+# Time constants of the moving averages in hours
+EWMA_HOURS = 1.0
+DRIFT_EWMA_HOURS = 6.0
+STUCK_TOLERANCE = 0.01
+STUCK_HOURS = 2.0
+NOISY_SPREAD = 2.0
+NOISY_JUMP = 3.0
+NOISY_BAD_SHARE = 0.2
+DRIFT_RATE = 0.3
+SILENT_HOURS = 1.0
+
+STATUS_OK = 'ok'
+
+_lock = threading.Lock()
+# (meas_point, sensor) -> state dictionary
+_states = {}
+
+
+def _weight(dt_hours, tau):
+    return 1.0 - math.exp(-dt_hours / tau)
+
+
+def _ewma(old, new, weight):
+    return new if old is None else old + weight * (new - old)
+
+
+def add_sample(meas_point, sensor, dt, level, spread=None, quality=analytics.QUALITY_GOOD):
+    """
+    Updates the health state of a sensor with one measurement.
+
+    Measurements older than the last measurement of the sensor are ignored.
+
+    :param meas_point: The name of the measurement point.
+    :param sensor: The name of the sensor.
+    :param dt: The timestamp of the measurement.
+    :type dt: datetime or str
+    :param level: The water level (`tank_height - meas_val`) of the measurement, `None` for bad measurements.
+    :param spread: The spread of the raw values of the measurement (see `analytics.robust_estimate`).
+    :param quality: The quality flag of the measurement.
+
+    **Example usage**::
+
+        add_sample('raspi1', 'left_tank', '2024-12-15T10:00:00+00:00', 95.3, 0.05, analytics.QUALITY_GOOD)
+    """
+    hours = analytics.to_hour(dt)
+    key = (meas_point, sensor)
+    bad = quality == analytics.QUALITY_BAD or level is None
+    with _lock:
+        state = _states.get(key)
+        if state is None:
+            _states[key] = {
+                'hours': hours, 'level': None if bad else float(level), 'last_change': hours,
+                'spread': spread, 'jump': 0.0, 'rate': 0.0, 'bad_share': 1.0 if bad else 0.0,
+            }
+            return
+        dt_hours = hours - state['hours']
+        if dt_hours <= 0:
+            return
+        state['hours'] = hours
+        weight = _weight(dt_hours, EWMA_HOURS)
+        state['bad_share'] = _ewma(state['bad_share'], 1.0 if bad else 0.0, weight)
+        if bad:
+            return
+        if spread is not None:
+            state['spread'] = _ewma(state['spread'], spread, weight)
+        level = float(level)
+        if state['level'] is None:
+            state['level'] = level
+            state['last_change'] = hours
+            return
+        step = level - state['level']
+        state['level'] = level
+        if abs(step) > STUCK_TOLERANCE:
+            state['last_change'] = hours
+        state['jump'] = _ewma(state['jump'], abs(step), weight)
+        rate = step / dt_hours
+        if rate < analytics.EVENT_REFILL_RATE:
+            state['rate'] = _ewma(state['rate'], rate, _weight(dt_hours, DRIFT_EWMA_HOURS))
+
+
+def add_measurement(measurement, quality):
+    """
+    Updates the health state with an inserted measurement (see `main.SensorData`).
+
+    :param measurement: The inserted measurement data.
+    :type measurement: dict
+
+    :param quality: The robust value and the quality of the measurement (see `analytics.robust_estimate`).
+    :type quality: dict
+    """
+    add_sample(
+        measurement['meas_point'],
+        measurement['sensor_name'],
+        measurement['datetime'],
+        None if quality['value'] is None else measurement['tank_height'] - quality['value'],
+        quality['spread'],
+        quality['quality'],
+    )
+
+
+def _status(state, now_hours):
+    issues = []
+    if state['level'] is not None and state['hours'] - state['last_change'] >= STUCK_HOURS:
+        issues.append('stuck')
+    if (state['spread'] or 0.0) > NOISY_SPREAD or state['jump'] > NOISY_JUMP or state['bad_share'] > NOISY_BAD_SHARE:
+        issues.append('noisy')
+    if state['rate'] > DRIFT_RATE:
+        issues.append('drifting')
+    if now_hours - state['hours'] >= SILENT_HOURS:
+        issues.append('silent')
+    return {
+        'status': issues[0] if issues else STATUS_OK,
+        'issues': issues,
+        'hours_since_change': round(state['hours'] - state['last_change'], 2),
+        'spread': None if state['spread'] is None else round(state['spread'], 2),
+        'jump': round(state['jump'], 2),
+        'drift_rate': round(state['rate'], 2),
+        'bad_share': round(state['bad_share'], 2),
+    }
+
+
+def get_health(meas_point, sensor, now=None):
+    """
+    Returns the health of a sensor.
+
+    :param meas_point: The name of the measurement point.
+    :param sensor: The name of the sensor.
+    :param now: The current time to detect silent sensors. Defaults to now.
+    :type now: datetime
+
+    :returns: A dictionary with the `status` (`ok` or the first of `issues`), the list of `issues` and
+        the underlying averages, or `None` if the sensor is unknown.
+    :rtype: dict
+
+    **Example usage**::
+
+        get_health('raspi1', 'left_tank')
+        # {'status': 'ok', 'issues': [], 'hours_since_change': 0.0, 'spread': 0.05, 'jump': 0.1,
+        #  'drift_rate': -1.2, 'bad_share': 0.0}
+    """
+    now_hours = analytics.to_hour(now or datetime.now(timezone.utc))
+    with _lock:
+        state = _states.get((meas_point, sensor))
+        return None if state is None else _status(state, now_hours)
+
+
+def get_all_health(now=None):
+    """
+    Returns the health of all known sensors.
+
+    :param now: The current time to detect silent sensors. Defaults to now.
+    :type now: datetime
+
+    :returns: A dictionary `output[meas_point][sensor]` with the health of each sensor (see `get_health`).
+    :rtype: dict
+    """
+    now_hours = analytics.to_hour(now or datetime.now(timezone.utc))
+    output = {}
+    with _lock:
+        for (meas_point, sensor), state in sorted(_states.items()):
+            output.setdefault(meas_point, {})[sensor] = _status(state, now_hours)
+    return output
+
+
+def load_health_state(db_conf):
+    """
+    Warms up the health states of all sensors with their recent levels from the database.
+
+    :param db_conf: A dictionary containing the database configuration (see `database_utils`).
+    :type db_conf: dict
+    """
+    dt_end = datetime.now(timezone.utc)
+    dt_begin = dt_end - timedelta(hours=DRIFT_EWMA_HOURS)
+    recent = dbu.get_recent_levels_from_sqlite_db(db_conf, dt_begin, dt_end)
+    for (meas_point, sensor), rows in recent.items():
+        for row in rows:
+            add_sample(meas_point, sensor, row[0], row[1])
@@ -0,0 +1,206 @@
+"""
+Module Name: Wassermonitor2 API latest measurements
+
+Description:
+    This file keeps the latest measurement of each sensor and the list of the measurement points
+    in memory, so `/get_latest/` and `/get_available_meas_points` do not query the database.
+
+    On startup the states are loaded from the database with `load_latest_state`. Afterwards each
+    insert updates the state of its sensor with `add_measurement`. Bad measurements (see
+    `analytics.robust_estimate`) and measurements older than the stored one are ignored like in
+    `database_utils.get_last_meas_data_from_sqlite_db`.
+
+    The colour of a sensor only depends on its stored state and on the current time: a measurement
+    older than `DEPRECATED_MINUTES` is `deprecated`. So the colours are evaluated on each read
+    (see `state_color`), while the stored states only change with inserts.
+
+    Each insert and each load increments the insert sequence of the process, so `get_version`
+    identifies the stored states without a query of the database (see the `ETag` of
+    `/get_latest/` in `main.conditional_response`).
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import os
+import threading
+from datetime import datetime, timezone, timedelta
+
+import analytics
+import database_utils as dbu
+
+# Measurements older than this are shown as deprecated
+DEPRECATED_MINUTES = 15
+
+_lock = threading.Lock()
+# meas_point -> sensor -> state dictionary (dt, warn, alarm, max_val, tank_height, value)
+_states = {}
+# (meas_point, sensor) -> timestamp of the state in hours
+_hours = {}
+_loaded = False
+# Number of inserts and loads, which changed the states in this process
+_sequence = 0
+# Distinguishes the sequences of the worker processes and of restarts
+_instance = f"{os.getpid()}-{os.urandom(4).hex()}"
+
+
+def _as_datetime(dt):
+    dt = datetime.fromisoformat(dt) if isinstance(dt, str) else dt
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def state_color(value, warn, alarm, dt, now=None):
+    """
+    Returns the colour of a sensor state: `deprecated`, if the measurement is older than
+    `DEPRECATED_MINUTES`, otherwise the colour of the thresholds (see `database_utils.assign_color`).
+
+    :param value: The water level of the measurement.
+    :param warn: The warning threshold of the sensor.
+    :param alarm: The alarm threshold of the sensor.
+    :param dt: The timestamp of the measurement.
+    :type dt: datetime or str
+    :param now: The current time. Defaults to now.
+    :type now: datetime
+
+    :rtype: str
+
+    **Example usage**::
+
+        state_color(95.3, 90, 70, '2024-12-15T10:00:00+00:00')
+        # 'deprecated'
+    """
+    if _as_datetime(dt) < (now or datetime.now(timezone.utc)) - timedelta(minutes=DEPRECATED_MINUTES):
+        return 'deprecated'
+    return dbu.assign_color(value, warn, alarm)
+
+
+def _set_state(meas_point, sensor, state):
+    hours = analytics.to_hour(state['dt'])
+    key = (meas_point, sensor)
+    if key in _hours and hours < _hours[key]:
+        return
+    _hours[key] = hours
+    _states.setdefault(meas_point, {})[sensor] = state
+
+
+def add_measurement(measurement, quality):
+    """
+    Updates the latest state of a sensor with an inserted measurement (see `main.SensorData`).
+
+    :param measurement: The inserted measurement data.
+    :type measurement: dict
+
+    :param quality: The robust value and the quality of the measurement (see `analytics.robust_estimate`).
+    :type quality: dict
+    """
+    global _sequence
+    with _lock:
+        _sequence += 1
+        _states.setdefault(measurement['meas_point'], {})
+        if quality['value'] is None or quality['quality'] <= analytics.QUALITY_BAD:
+            return
+        _set_state(measurement['meas_point'], measurement['sensor_name'], {
+            'dt': measurement['datetime'],
+            'warn': measurement['warn'],
+            'alarm': measurement['alarm'],
+            'max_val': measurement['max_val'],
+            'tank_height': measurement['tank_height'],
+            'value': round(measurement['tank_height'] - quality['value'], 1),
+        })
+
+
+def load_latest_state(db_conf):
+    """
+    Loads the latest measurement of each sensor and the measurement points from the database.
+
+    :param db_conf: A dictionary containing the database configuration (see `database_utils`).
+    :type db_conf: dict
+    """
+    global _loaded, _sequence
+    last_data = dbu.get_last_meas_data_from_sqlite_db(db_conf)
+    meas_points = dbu.get_meas_point_names_from_sqlite_db(db_conf)
+    with _lock:
+        for meas_point in meas_points:
+            _states.setdefault(meas_point, {})
+        for meas_point, sensors in last_data.items():
+            for sensor, state in sensors.items():
+                _set_state(meas_point, sensor, {k: v for k, v in state.items() if k != 'color'})
+        _sequence += 1
+        _loaded = True
+
+
+def is_loaded():
+    """
+    Returns whether the states were loaded from the database (see `load_latest_state`).
+
+    :rtype: bool
+    """
+    return _loaded
+
+
+def get_version():
+    """
+    Returns the version of the stored states: the process and its insert sequence, which changes
+    with each `add_measurement` and `load_latest_state`.
+
+    :rtype: tuple
+
+    **Example usage**::
+
+        get_version()
+        # ('4711-9f3c2a1b', 1523)
+    """
+    with _lock:
+        return _instance, _sequence
+
+
+def get_last_meas_data(now=None):
+    """
+    Returns the latest measurement of each sensor like `database_utils.get_last_meas_data_from_sqlite_db`.
+
+    :param now: The current time to detect deprecated measurements. Defaults to now.
+    :type now: datetime
+
+    :returns: A dictionary `output[meas_point][sensor]` with `dt`, `warn`, `alarm`, `max_val`,
+        `tank_height`, `value` and `color` of the latest measurement.
+    :rtype: dict
+
+    **Example usage**::
+
+        get_last_meas_data()
+        # {'raspi1': {'left_tank': {'dt': '2024-12-15T10:00:00+00:00', 'warn': 90, 'alarm': 70,
+        #                           'max_val': 135, 'tank_height': 155, 'value': 95.3, 'color': 'normal'}}}
+    """
+    now = now or datetime.now(timezone.utc)
+    output = {}
+    with _lock:
+        for meas_point, sensors in _states.items():
+            if not sensors:
+                continue
+            output[meas_point] = {
+                sensor: {**state, 'color': state_color(state['value'], state['warn'], state['alarm'], state['dt'], now)}
+                for sensor, state in sensors.items()
+            }
+    return output
+
+
+def get_available_meas_points(now=None):
+    """
+    Returns the measurement points with the status sign of each sensor like
+    `database_utils.get_available_meas_points_from_sqlite_db`.
+
+    :param now: The current time to detect deprecated measurements. Defaults to now.
+    :type now: datetime
+
+    :returns: A dictionary `output[meas_point]` with the list of the status signs of its sensors.
+    :rtype: dict
+    """
+    now = now or datetime.now(timezone.utc)
+    with _lock:
+        return {
+            meas_point: [
+                f" {dbu.assign_sign(state['value'], state['warn'], state['alarm'], state['dt'], now)}"
+                for state in sensors.values()
+            ]
+            for meas_point, sensors in _states.items()
+        }
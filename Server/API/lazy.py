@@ -0,0 +1,68 @@
+"""
+Module Name: Wassermonitor2 API lazy imports
+
+Description:
+    This file defers the import of the heavy analytics stack (numpy, pandas, scipy.signal) until it is
+    used, so the API starts and answers the requests, which are served from memory (e.g.
+    `/get_latest/`), without it.
+
+    A `LazyModule` stands in for the module as global of the importing module. The first access of an
+    attribute imports the module and copies its attributes into the stand-in, so later accesses are
+    as fast as on the module itself. The modules can be loaded ahead of their first use with `load`
+    (see `prewarm` in the `API` section of the configuration).
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for the module `name`, which is imported on the first access of one of its attributes.
+
+    :param name: The name of the module, e.g. `pandas` or `scipy.signal`.
+    :type name: str
+
+    **Example usage**::
+
+        pd = LazyModule('pandas')
+        df = pd.DataFrame({'dt': [], 'meas_val': []})  # imports pandas
+    """
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def _lazy_load(self):
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attr):
+        # Only called for attributes, which were not copied yet
+        return getattr(self._lazy_load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._lazy_name}'>"
+
+
+def load(*modules):
+    """
+    Imports the modules of the given `LazyModule` stand-ins now.
+
+    **Example usage**::
+
+        load(np, pd, signal)
+    """
+    for module in modules:
+        if isinstance(module, LazyModule):
+            module._lazy_load()
+
+
+def loaded(module):
+    """
+    Returns whether the module of a `LazyModule` stand-in is imported.
+
+    :rtype: bool
+    """
+    return not isinstance(module, LazyModule) or '__name__' in module.__dict__
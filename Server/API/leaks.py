@@ -0,0 +1,132 @@
+"""
+Module Name: Wassermonitor2 API leak detection
+
+Description:
+    This file runs the nightly leak detection.
+
+    Slow leaks show up as a steady consumption during the night hours, when nobody draws water.
+    The job reads the hourly levels (see `database_utils.update_hourly_levels`) instead of the
+    measurements, calculates the night-time baseline consumption of all sensors at once
+    (see `analytics.night_baselines`), flags sustained baselines above a threshold as leaks
+    (see `analytics.detect_leaks`) and stores the result per sensor and night in the table
+    `night_baselines`.
+
+    Each run only stores the nights after the last stored night, the first run calculates the
+    whole history.
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+from datetime import datetime, timezone, timedelta
+
+import analytics
+import database_utils as dbu
+import lazy
+
+np = lazy.LazyModule('numpy')
+pd = lazy.LazyModule('pandas')
+
+
+def run_leak_detection(db_conf, threshold, min_nights, night_begin, night_end, tz, now=None):
+    """
+    Calculates and stores the night-time baselines and leak flags of all completed nights.
+
+    :param db_conf: A dictionary containing the database configuration (see `database_utils`).
+    :type db_conf: dict
+    :param threshold: Minimal baseline consumption of a leaking night (cm/h).
+    :type threshold: float
+    :param min_nights: Number of consecutive leaking nights until a leak is flagged.
+    :type min_nights: int
+    :param night_begin: First local hour of the night.
+    :type night_begin: int
+    :param night_end: Local hour after the night.
+    :type night_end: int
+    :param tz: The timezone of the night hours.
+    :type tz: str
+    :param now: The current time. Defaults to now.
+    :type now: datetime
+
+    :returns: A tuple with the number of stored nights and the number of leaking nights among them.
+    :rtype: tuple
+
+    **Example usage**::
+
+        stored, leaking = run_leak_detection(db_conf, 0.2, 3, 1, 5, 'Europe/Berlin')
+    """
+    now = now or datetime.now(timezone.utc)
+    dbu.update_hourly_levels(db_conf)
+
+    last_night = dbu.get_last_night_baseline_date(db_conf)
+    if last_night is not None:
+        dt_begin = datetime(last_night.year, last_night.month, last_night.day, tzinfo=timezone.utc)
+        dt_begin -= timedelta(days=min_nights + 1)
+    else:
+        files = dbu.get_all_sqlite_files(db_conf['sqlite_path'])
+        if not files:
+            return 0, 0
+        month, year = files[0].split('.')[0].split('-')
+        dt_begin = datetime(int(year), int(month), 1, tzinfo=timezone.utc) - timedelta(days=1)
+
+    # Only the hours of the day (UTC), which are night hours at any time of the year, are read
+    hours = np.arange(int(analytics.to_hour(dt_begin)), int(np.ceil(analytics.to_hour(now))) + 1)
+    local_hour = pd.to_datetime(hours * 3600, unit='s', utc=True).tz_convert(tz).hour.to_numpy()
+    if night_begin < night_end:
+        in_night = (local_hour >= night_begin) & (local_hour < night_end)
+    else:
+        in_night = (local_hour >= night_begin) | (local_hour < night_end)
+    sensors, hourly = dbu.get_hourly_levels_from_sqlite_db(
+        db_conf, dt_begin, now, np.unique(hours[in_night] % 24)
+    )
+    if hourly.empty:
+        return 0, 0
+    levels = np.full((len(sensors), len(hours)), np.nan)
+    levels[hourly['sensor_index'].to_numpy(), hourly['hour'].to_numpy() - hours[0]] = hourly['level_mean'].to_numpy()
+
+    nights, baseline, count = analytics.night_baselines(hours, levels, tz, night_begin, night_end)
+    if len(nights) == 0:
+        return 0, 0
+    leak = analytics.detect_leaks(baseline, threshold, min_nights)
+
+    # Only completed nights after the last stored night
+    local_now = pd.Timestamp(now).tz_convert(tz)
+    last_complete = np.datetime64(local_now.date(), 'D')
+    if local_now.hour < night_end:
+        last_complete -= 1
+    first = np.datetime64(last_night, 'D') + 1 if last_night is not None else nights[0]
+    selected = np.flatnonzero((nights >= first) & (nights <= last_complete))
+
+    rows = []
+    for n in selected:
+        night = nights[n].astype(object)
+        for s, (meas_point, sensor) in enumerate(sensors):
+            if count[s, n] == 0:
+                continue
+            value = baseline[s, n]
+            rows.append((
+                meas_point, sensor, night,
+                None if np.isnan(value) else round(float(value), 3),
+                int(count[s, n]), bool(leak[s, n])
+            ))
+    stored = dbu.store_night_baselines(db_conf, rows)
+    return stored, sum(r[5] for r in rows)
+
+
+def seconds_until(hour, tz, now=None):
+    """
+    Returns the seconds until the next full local `hour`.
+
+    :param hour: The local hour of the next run.
+    :type hour: int
+    :param tz: The timezone of `hour`.
+    :type tz: str
+    :param now: The current time. Defaults to now.
+    :type now: datetime
+
+    :rtype: float
+    """
+    now = pd.Timestamp(now or datetime.now(timezone.utc)).tz_convert(tz)
+    run = now.normalize() + pd.Timedelta(hours=hour)
+    if run <= now:
+        run += pd.Timedelta(days=1)
+    return (run - now).total_seconds()
@@ -0,0 +1,185 @@
+"""
+Module Name: Wassermonitor2 API live push
+
+Description:
+    This file pushes each inserted measurement to the subscribers of the live endpoints
+    (Server-Sent Events and WebSocket, see `main`), so clients do not need to poll `/get_latest/`.
+
+    Each subscriber has a bounded buffer of `buffer_size` events. A subscriber, which does not read
+    its events fast enough, loses its buffered events once the buffer is full and receives a single
+    `resync` event instead. The client then fetches the current state from `/get_latest/` and
+    continues with the following events. So a slow consumer never holds more than `buffer_size`
+    events in memory and never slows down the insert path or the other subscribers.
+
+    An idle subscriber is a suspended coroutine, which waits for its event. Inserts without subscribers
+    do not build any events.
+
+    `publish` and `subscribe` must be called in the event loop of the API. Inserts, which run in the
+    thread pool, hand their measurements over to the event loop (see `main.publish_live_measurement`).
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import asyncio
+import itertools
+from collections import deque
+
+import analytics
+import latest
+
+MEASUREMENT = 'measurement'
+RESYNC = 'resync'
+
+DEFAULT_BUFFER_SIZE = 100
+
+_subscribers = set()
+_sequence = itertools.count(1)
+
+
+class Subscriber:
+    """
+    A subscriber of the live measurements with a bounded buffer (see module description).
+
+    :param meas_points: Only receive the measurements of these measurement points. Defaults to all.
+    :type meas_points: list
+    :param buffer_size: The maximum number of buffered events.
+    :type buffer_size: int
+    """
+    def __init__(self, meas_points=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.meas_points = set(meas_points) if meas_points else None
+        self.buffer_size = max(1, buffer_size)
+        self.dropped = 0
+        self._buffer = deque()
+        self._resync = False
+        self._ready = asyncio.Event()
+
+    def put(self, event):
+        """
+        Buffers an event, if its measurement point is subscribed. If the buffer is full, the buffered
+        events are dropped and the subscriber has to resync.
+        """
+        if self.meas_points is not None and event['meas_point'] not in self.meas_points:
+            return
+        if len(self._buffer) >= self.buffer_size:
+            self.dropped += len(self._buffer)
+            self._buffer.clear()
+            self._resync = True
+        self._buffer.append(event)
+        self._ready.set()
+
+    async def get(self):
+        """
+        Waits for the next event.
+
+        :returns: The next measurement event or a `resync` event with the number of dropped events.
+        :rtype: dict
+        """
+        while not self._buffer and not self._resync:
+            self._ready.clear()
+            await self._ready.wait()
+        if self._resync:
+            self._resync = False
+            return {'type': RESYNC, 'id': next(_sequence), 'dropped': self.dropped}
+        return self._buffer.popleft()
+
+
+def subscribe(meas_points=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Registers a new subscriber of the live measurements.
+
+    :param meas_points: Only receive the measurements of these measurement points. Defaults to all.
+    :type meas_points: list
+    :param buffer_size: The maximum number of buffered events of the subscriber.
+    :type buffer_size: int
+
+    :returns: The subscriber. It has to be removed with `unsubscribe`.
+    :rtype: Subscriber
+
+    **Example usage**::
+
+        subscriber = subscribe(['raspi1'])
+        try:
+            while True:
+                event = await subscriber.get()
+        finally:
+            unsubscribe(subscriber)
+    """
+    subscriber = Subscriber(meas_points, buffer_size)
+    _subscribers.add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber):
+    """
+    Removes a subscriber of the live measurements.
+    """
+    _subscribers.discard(subscriber)
+
+
+def subscriber_count():
+    """
+    Returns the number of subscribers.
+
+    :rtype: int
+    """
+    return len(_subscribers)
+
+
+def measurement_event(measurement, quality, now=None):
+    """
+    Builds the event of an inserted measurement with its level and colour like `/get_latest/`.
+
+    :param measurement: The inserted measurement data (see `main.SensorData`).
+    :type measurement: dict
+    :param quality: The robust value and the quality of the measurement (see `analytics.robust_estimate`).
+    :type quality: dict
+    :param now: The current time to detect deprecated measurements. Defaults to now.
+    :type now: datetime
+
+    :returns: The event or `None` for bad measurements, which are not shown by `/get_latest/` either.
+    :rtype: dict
+
+    **Example usage**::
+
+        measurement_event(measurement, analytics.robust_estimate(measurement['values']))
+        # {'type': 'measurement', 'id': 17, 'meas_point': 'raspi1', 'sensor_name': 'left_tank',
+        #  'dt': '2024-12-15T10:00:00+00:00', 'value': 95.3, 'color': 'normal', 'quality': 2,
+        #  'warn': 90, 'alarm': 70, 'max_val': 135, 'tank_height': 155}
+    """
+    if quality['value'] is None or quality['quality'] <= analytics.QUALITY_BAD:
+        return None
+    value = round(measurement['tank_height'] - quality['value'], 1)
+    color = latest.state_color(value, measurement['warn'], measurement['alarm'], measurement['datetime'], now)
+    return {
+        'type': MEASUREMENT,
+        'id': next(_sequence),
+        'meas_point': measurement['meas_point'],
+        'sensor_name': measurement['sensor_name'],
+        'dt': measurement['datetime'],
+        'value': value,
+        'color': color,
+        'quality': quality['quality'],
+        'warn': measurement['warn'],
+        'alarm': measurement['alarm'],
+        'max_val': measurement['max_val'],
+        'tank_height': measurement['tank_height'],
+    }
+
+
+def publish(measurement, quality):
+    """
+    Pushes an inserted measurement to all subscribers of its measurement point.
+
+    :param measurement: The inserted measurement data (see `main.SensorData`).
+    :type measurement: dict
+    :param quality: The robust value and the quality of the measurement (see `analytics.robust_estimate`).
+    :type quality: dict
+    """
+    if not _subscribers:
+        return
+    event = measurement_event(measurement, quality)
+    if event is None:
+        return
+    for subscriber in _subscribers:
+        subscriber.put(event)
@@ -10,7 +10,8 @@ The module handles authentication via signature verification and processes senso
     - Pydantic: For data validation using models.
     - SQLite: For database interactions through `database_utils`.
     - configparser: For reading configuration settings from a file.
-    - json: For JSON serialization.
+    - json: For JSON serialization of the legacy responses.
+    - orjson: For the fast JSON serialization of the `/v2/` responses.
     - psk_auth: For handling public keys and signature verification.
     - datetime: For working with date and time.
     - base64: For encoding and decoding signatures.
@@ -18,9 +19,84 @@ The module handles authentication via signature verification and processes senso
 **API Endpoints**:
 
     - `POST /insert/`: Inserts sensor data into the database after verifying the signature.
+    - `POST /insert_batch/`: Inserts a batch of measurements, signed one by one or with one signature over the batch, and returns the status of each measurement.
     - `POST /get/`: Retrieves sensor data within a specified time range.
     - `POST /get_latest/`: Retrieves the most recent sensor measurements.
     - `POST /get_available_meas_points`: Fetches available measurement points from the database.
+    - `POST /get_events/`: Retrieves the detected refill and consumption events within a specified time range.
+    - `POST /get_health/`: Retrieves the health status (stuck, noisy, drifting, silent) of each sensor.
+    - `POST /get_leaks/`: Retrieves the night-time baseline consumption and the leak flags of each sensor within a specified time range.
+    - `POST /get_metrics/`: Retrieves the operational counters of the API (e.g. the response compression).
+    - `GET /metrics`: Exposes the metrics of the API in the text format of Prometheus (see `metrics`).
+    - `GET /live/`: Pushes each inserted measurement as Server-Sent Events, optionally filtered by `meas_point`.
+    - `WEBSOCKET /ws/live/`: Pushes each inserted measurement as JSON message, optionally filtered by `meas_point`.
+
+    All read endpoints are also available below `/v2/` (e.g. `POST /v2/get/`). The `/v2/` endpoints return
+    plain JSON documents, while the original endpoints return the pretty printed JSON document encoded as a
+    JSON string for old clients (see `json_response`).
+
+    `/get/` returns binary formats instead of JSON, if they are requested by the `Accept` header: Arrow IPC
+    stream, MessagePack or raw little-endian arrays with a JSON header (see `binary_formats`).
+
+    Long ranges of `/get/` can be fetched in pages: with `page_size` each response contains at most this number
+    of measurements per sensor and the cursor of the next page in its `Next-Cursor` header (and the URL of the
+    next page in a `Link` header for `GET` requests). The cursor is passed as `cursor` with the otherwise unchanged
+    request. Each page continues directly after the last measurement of each sensor in the index of its SQLite
+    file, so a page costs the same wherever it is in the range (see `database_utils.get_meas_data_page_from_sqlite_db`).
+
+    The read endpoints are also available as `GET` requests with the request fields as query parameters
+    (e.g. `GET /v2/get/?dt_begin=2024-12-01T00:00:00&dt_end=2024-12-02T00:00:00&sensors=left_tank&sensors=right_tank`).
+    These responses carry an `ETag`, which is derived from the data version of the database (see
+    `database_utils.get_data_version`), or for `/get_latest/` and `/get_available_meas_points` from the insert
+    sequence of the in-memory state (see `latest.get_version`), and a `Cache-Control` header with `cache_max_age` of the `API` section of
+    the configuration. A request with a matching `If-None-Match` header gets `304 Not Modified` without querying
+    the database, so clients and reverse proxies can poll cheaply (see `conditional_response`).
+
+    The live endpoints push an event with the level and the colour of each inserted measurement, so clients do
+    not need to poll `/get_latest/`. A client, which does not keep up, receives a `resync` event instead of the
+    dropped events and fetches `/get_latest/` again (see `live`). The `live` section of the configuration sets
+    the buffer size per client, the interval of the keep-alive comments and the maximum number of clients.
+
+    `/metrics` counts the requests and their durations per route, the durations of the SQLite statements and
+    commits per function of `database_utils`, the durations of the signature verifications, the inserted
+    measurements per measurement point, the rows returned per `/get/` request, the SQLite files and connections,
+    the subscribers of the live endpoints and the response compression.
+
+    Each response has a `Server-Timing` header with the durations of its phases (`query`, `analytics`,
+    `serialize`). If `enable` is set in the `profiling` section of the configuration, the stacks of the
+    requests are sampled and requests slower than `slow_threshold` are captured with their profile and memory
+    peak (see `profiling`).
+
+    All responses are compressed with gzip, brotli or zstd, if the `Accept-Encoding` header of the request
+    allows it (see `compression`). The `compression` section of the configuration sets the minimum size, the
+    enabled encodings and their levels.
+
+    The endpoints never block the event loop: the database queries, the analytics and the signature verification
+    run in a bounded thread pool (see `run_blocking`, `worker_threads` in the `API` section of the configuration),
+    and the delay after an invalid token is awaited instead of slept.
+
+    numpy, pandas and scipy are imported on their first use (see `lazy`), so the API starts listening and answers
+    `/get_latest/` from memory without them. The background work, which needs them (the forecasts of the recent
+    levels, the first pass of the derived metrics and the leak detection), starts `startup_delay` seconds after the
+    startup (`API` section of the configuration), until then `/get_latest/` has no forecasts. With `prewarm` they
+    are imported in the background after the startup as well, together with a query of the recent measurements, so
+    the first `/get/` request does not wait for them.
+
+    With `count` in the `workers` section of the configuration, the API runs in several worker processes
+    (`python main.py`). Each worker applies the inserts of the other workers to its in-memory state, `/metrics`
+    adds up the metrics of all workers, the SQLite writes queue for one lock and the SQLite files use WAL mode,
+    so the readers do not block the writers (see `workers`). The leak detection runs in one worker only.
+
+**Background Tasks**:
+
+    - `forecast_loader()`: Loads the recent levels for the forecasts (see `forecast.load_forecast_windows`) after the startup. The forecasts are updated on each insert.
+    - `health.load_health_state()`: Warms up the sensor health monitor with the recent levels on startup. The health is updated on each insert.
+    - `latest.load_latest_state()`: Loads the latest measurement of each sensor and the measurement points on startup, if `latest_cache` is set in the `API` section of the configuration. They are updated on each insert, so `/get_latest/` and `/get_available_meas_points` do not query the database.
+    - `analytics.start_pool()`: Starts the process pool for the analytics of large `/get/` requests, if `pool_size` is set in the `analytics` section of the configuration.
+    - `derived_metrics_worker()`: Brings the SQLite files up to date after the startup and keeps the stored derived metrics (derivation, smoothed derivation and peaks), the refill and consumption events and the hourly levels up to date after inserts.
+    - `leak_detection_worker()`: Runs the leak detection (see `leaks.run_leak_detection`) after the startup and daily at `leak_hour`.
+    - `prewarm_worker()`: Imports the analytics stack and queries the recent measurements after the startup, if `prewarm` is set in the `API` section of the configuration.
+    - `shared_state_worker()`: Applies the inserts of the other worker processes and stores the metrics of this worker, if several workers are configured.
 
 **Classes**:
 
@@ -32,10 +108,31 @@ The module handles authentication via signature verification and processes senso
     - `validate_json(data: dict)`: Validates sensor data against the `SensorData` model. Raises HTTPException if validation fails.
     - `validate_request_json(data: dict)`: Validates the time range data against the `request_json` model. Raises HTTPException if validation fails.
     - `insert_to_db(measurement)`: Inserts valid measurement data into the database.
+    - `insert_batch_to_db(batch)`: Verifies, validates and inserts a batch of measurements in one transaction.
+    - `after_insert(measurement, quality)`: Applies an inserted measurement to the in-memory state, the live subscribers and the metrics.
+    - `query_measurement_data(request_dict)`: Fetches the measurement data from the database for a given time range.
     - `request_measurement_data(request_dict)`: Fetches and returns measurement data from the database for a given time range.
+    - `request_measurement_binary(request, request_dict, media_type)`: Returns the measurement data in a binary format.
+    - `request_measurement_json(request, request_dict)`: Returns the measurement data as JSON response.
+    - `encode_cursor(positions)`, `decode_cursor(cursor)`: Encode and decode the cursor of a paginated `/get/` request.
     - `request_last_measurements()`: Retrieves the most recent measurements from the database.
     - `request_measurement_points()`: Returns a list of available measurement points in the database.
+    - `request_events(request_dict)`: Returns the refill and consumption events for a given time range.
+    - `request_health()`: Returns the health status of each sensor.
+    - `request_leaks(request_dict)`: Returns the night-time baselines and leak flags for a given time range.
+    - `request_metrics()`: Returns the operational counters of the API.
     - `verify_signature(public_key, data, signature)`: Verifies the authenticity of the signature using the public key.
+    - `verify_measurement_signature(public_key, data, signature)`: Verifies a signature and records its duration.
+    - `json_response(request, data)`: Serializes the response data in the format of the requested API version.
+    - `run_blocking(func, *args)`: Runs blocking work in the bounded thread pool.
+    - `blocking_json_response(request, func, *args)`: Calls `func` and serializes its result in the bounded thread pool.
+    - `query_request_dict(request)`: Validates the query parameters of a `GET` read request.
+    - `cached_data_version()`: Returns the version of the in-memory state of `/get_latest/` and `/get_available_meas_points`.
+    - `conditional_response(request, respond, time_dependent=False, data_version=None)`: Answers a `GET` read request with `304 Not Modified`, if the client has the current data.
+    - `publish_live_measurement(measurement, quality)`: Pushes an inserted measurement to the subscribers of the live endpoints.
+    - `apply_shared_inserts()`: Applies the inserts of the other worker processes to the in-memory state.
+    - `prewarm_caches(hours)`: Imports the analytics stack and queries the recent measurements ahead of the first `/get/` request.
+    - `run()`: Serves the API with uvicorn (`python main.py`).
 
 **Configuration**:
 
@@ -51,27 +148,61 @@ The module handles authentication via signature verification and processes senso
     - Carl Philipp Koppen (admin@wassermonitor.de)
 """
 
-from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi import FastAPI, Request, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_406_NOT_ACCEPTABLE
-from pydantic import BaseModel, ValidationError
-import time
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import anyio
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_406_NOT_ACCEPTABLE, HTTP_503_SERVICE_UNAVAILABLE
+from pydantic import BaseModel, ValidationError, Field, model_validator
+from typing import Literal
+import orjson
 import database_utils as dbu
+import analytics
+import binary_formats
+import compression
+import forecast
+import health
+import latest
+import lazy
+import leaks
+import live
+import metrics
+import profiling
+import workers
 import configparser
 import json
-from datetime import datetime
+from datetime import datetime, timezone, timedelta
 from psk_auth import load_authorized_keys, verify_signature
 import base64
 import os
+import sys
 import logging
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+from contextlib import asynccontextmanager
+
+if __name__ == '__main__':
+    # `python main.py` only starts the application of the module "main" (see `run`). Without `__file__`, the
+    # processes, which multiprocessing spawns (analytics pool, uvicorn workers), do not run this script again
+    # as __mp_main__ with its side effects (configuration, log, keys, application).
+    del __file__
+    import main
+    main.run()
+    sys.exit()
+
+np = lazy.LazyModule('numpy')
+pd = lazy.LazyModule('pandas')
 
 # Loggerconfig
 logger = logging.getLogger('wassermonitor warning bot')
 logger.setLevel(logging.INFO)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-fh = logging.FileHandler(os.path.abspath("../log/API.log"))
+# The worker processes write to the same log file (see workers)
+fh = workers.LockedFileHandler(os.path.abspath("../log/API.log"))
 fh.setFormatter(formatter)
 fh.setLevel(logging.INFO)
 ch = logging.StreamHandler()
@@ -109,9 +240,48 @@ with open(msg_json,'r', encoding='utf-8') as f:
 PORT = int(config['API']['port'])
 logger.info (f"API-Port:{PORT}")
 
+# Worker processes (see workers)
+WORKERS = config.getint('workers', 'count', fallback=1)
+workers_directory = os.path.abspath(config.get('workers', 'directory', fallback='../run'))
+shared_store = None
+if WORKERS > 1:
+    os.makedirs(workers_directory, exist_ok=True)
+    dbu.configure_sqlite(workers.ProcessLock(os.path.join(workers_directory, 'sqlite-write.lock')), 'WAL')
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
-def verify_token(token: str = Depends(oauth2_scheme)):
+# Delay of the response to an invalid token in seconds
+AUTH_FAILURE_DELAY = 5
+
+# Seconds after the startup until the background tasks start their work (see lifespan)
+STARTUP_DELAY = config.getfloat('API', 'startup_delay', fallback=1)
+
+# Bounded thread pool for blocking work (SQLite, pandas/scipy, signature verification)
+blocking_limiter = anyio.CapacityLimiter(config.getint('API', 'worker_threads', fallback=8))
+
+async def run_blocking(func, *args):
+    """
+    Runs blocking work in the bounded thread pool, so the event loop keeps serving other requests.
+
+    At most `worker_threads` (`API` section of the configuration) calls run at the same time, further
+    calls wait for a free thread.
+
+    **Args**:
+
+        - `func` (callable): The blocking function.
+        - `*args`: The arguments of `func`.
+
+    **Returns**:
+
+        - The result of `func`.
+
+    **Example**::
+
+        data = await run_blocking(dbu.get_last_meas_data_from_sqlite_db, config['database'])
+    """
+    return await anyio.to_thread.run_sync(functools.partial(func, *args), limiter=blocking_limiter)
+
+async def verify_token(token: str = Depends(oauth2_scheme)):
     """
     Verifies the provided token against the expected token from the configuration.
 
@@ -131,7 +301,8 @@ def verify_token(token: str = Depends(oauth2_scheme)):
     """
 
     if token != config['API']['token']:
-        time.sleep(5)
+        # The delay only holds this request, the event loop serves other requests meanwhile
+        await asyncio.sleep(AUTH_FAILURE_DELAY)
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
@@ -190,16 +361,41 @@ class request_json(BaseModel):
 
         - `dt_begin` (datetime): The start date and time of the requested period.
         - `dt_end` (datetime): The end date and time of the requested period.
+        - `resample` (int, optional): Width of a time grid in minutes, the data is resampled onto.
+        - `min_quality` (int, optional): Minimal quality flag of the returned measurements (0: bad, 1: suspect, 2: good).
+        - `format` (str, optional): `rows` (default) for one object per measurement or `columns` for one array per field.
+        - `meas_point` (str, optional): Only return the data of this measurement point.
+        - `sensors` (list, optional): Only return the data of these sensors.
+        - `max_points` (int, optional): Point budget per sensor, longer series are downsampled.
+        - `page_size` (int, optional): Return the data in pages of at most this number of measurements per sensor.
+        - `cursor` (str, optional): The cursor of the next page (see `encode_cursor`).
 
     **Example**::
 
         request = request_json(
             dt_begin=datetime(2024, 12, 1, 8, 0),
-            dt_end=datetime(2024, 12, 1, 18, 0)
+            dt_end=datetime(2024, 12, 1, 18, 0),
+            resample=5
         )
     """
     dt_begin: datetime
     dt_end: datetime
+    resample: int | None = Field(default=None, gt=0)
+    min_quality: int | None = Field(default=None, ge=0, le=2)
+    format: Literal['rows', 'columns'] = 'rows'
+    meas_point: str | None = None
+    sensors: list[str] | None = None
+    max_points: int | None = Field(default=None, ge=3)
+    page_size: int | None = Field(default=None, ge=1)
+    cursor: str | None = None
+
+    @model_validator(mode='after')
+    def check_pagination(self):
+        if self.cursor is not None and self.page_size is None:
+            raise ValueError("cursor requires page_size")
+        if self.page_size is not None and (self.resample or self.max_points):
+            raise ValueError("page_size can not be combined with resample or max_points")
+        return self
 
 def validate_json(data: dict):
     """
@@ -288,14 +484,53 @@ def validate_request_json(data):
             detail="Invalid JSON Structure",
         )
 
+# Metrics (see metrics.render)
+SIGNATURE_SECONDS = metrics.Histogram(
+    'wassermonitor_signature_verification_duration_seconds', 'Duration of the signature verifications.'
+)
+MEASUREMENTS_INSERTED = metrics.Counter(
+    'wassermonitor_measurements_inserted_total', 'Inserted measurements per measurement point.', ['meas_point']
+)
+GET_ROWS = metrics.Histogram(
+    'wassermonitor_get_rows', 'Rows returned per /get/ request.', buckets=(10, 100, 1000, 10000, 100000, 1000000)
+)
+metrics.GaugeCallback(
+    'wassermonitor_sqlite_shards', 'Monthly SQLite files.',
+    lambda: len(dbu.get_all_sqlite_files(config['database']['sqlite_path'])), shared=True,
+)
+metrics.GaugeCallback('wassermonitor_live_subscribers', 'Subscribers of the live endpoints.', live.subscriber_count)
+for key, documentation in (
+    ('responses', 'Compressed responses per encoding.'),
+    ('bytes_in', 'Response bytes before the compression per encoding.'),
+    ('bytes_out', 'Response bytes after the compression per encoding.'),
+    ('cpu_seconds', 'CPU time of the response compression per encoding.'),
+):
+    metrics.CounterCallback(
+        f'wassermonitor_compression_{key}_total', documentation,
+        lambda key=key: {(encoding,): stats[key] for encoding, stats in compression.get_stats().items()},
+        ['encoding'],
+    )
+
+def verify_measurement_signature(public_key, data, signature):
+    """
+    Verifies the signature of a measurement or a batch (see `psk_auth.verify_signature`) and records
+    the duration of the verification (see `metrics`).
+    """
+    start = time.perf_counter()
+    try:
+        return verify_signature(public_key, data, signature)
+    finally:
+        SIGNATURE_SECONDS.observe(time.perf_counter() - start)
+
 def insert_to_db(measurement):
     """
     Inserts measurement data into the database.
 
     This function checks whether the provided `measurement` is a dictionary. If it is,
     it attempts to insert the measurement data into the database using the `insert_value`
-    function from the `dbu` module. If the provided `measurement` is not a dictionary,
-    it returns a simple message.
+    function from the `dbu` module. The robust value and the quality of the measurement are
+    calculated once (see `analytics.robust_estimate`) and stored with it. If the provided
+    `measurement` is not a dictionary, it returns a simple message.
 
     **Args**:
 
@@ -324,13 +559,627 @@ def insert_to_db(measurement):
         result = insert_to_db(measurement)
     """
     if isinstance(measurement, dict):
-        return dbu.insert_value(config['database'], measurement)
+        quality = analytics.robust_estimate(measurement['values'])
+        result = dbu.insert_value(config['database'], measurement, quality)
+        after_insert(measurement, quality)
+        if shared_store is not None:
+            shared_store.publish([(measurement, quality)])
+        return result
     return {'message':'Received'}
 
+def insert_batch_to_db(batch):
+    """
+    Verifies, validates and inserts a batch of measurements.
+
+    The batch is either signed as a whole (`data` is the list of measurements and `signature` the signature
+    over this list) or each measurement is signed on its own (`items` is a list of objects with `data` and
+    `signature`, like the payload of `/insert/`). All valid measurements are inserted in one transaction
+    (see `database_utils.insert_values`). Invalid measurements are skipped and reported.
+
+    **Args**:
+
+        - `batch` (dict): The batch with the `client_id` and either `data` and `signature` or `items`.
+
+    **Returns**:
+
+        - `dict`: The response with the number of `inserted` and `rejected` measurements and the status of each
+          measurement (`items`, in the order of the batch).
+
+    **Raises**:
+
+        - `HTTPException`: If the client is unknown or the signature of the batch is invalid (401), if the batch is
+          too large (413) or if its structure is invalid (406).
+
+    **Example**::
+
+        batch = {
+            'client_id': 'raspi1',
+            'data': [measurement_1, measurement_2],
+            'signature': '<base64 signature of the list>'
+        }
+        response = insert_batch_to_db(batch)
+        # {'inserted': 2, 'rejected': 0, 'items': [{'status': 'inserted'}, {'status': 'inserted'}]}
+    """
+    public_key = authorized_keys.get(batch.get('client_id'))
+    if not public_key:
+        raise HTTPException(status_code=401, detail="Unauthorized client")
+    if 'signature' in batch:
+        if not isinstance(batch.get('data'), list):
+            raise HTTPException(status_code=HTTP_406_NOT_ACCEPTABLE, detail="Invalid JSON Structure")
+        try:
+            verify_measurement_signature(public_key, batch['data'], base64.b64decode(batch['signature']))
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid signature")
+        items = [{'data': data} for data in batch['data']]
+    else:
+        items = batch.get('items')
+    if not isinstance(items, list):
+        raise HTTPException(status_code=HTTP_406_NOT_ACCEPTABLE, detail="Invalid JSON Structure")
+    if len(items) > config.getint('API', 'max_batch_size', fallback=1000):
+        raise HTTPException(status_code=413, detail="Batch too large")
+
+    statuses = []
+    valid = []
+    for i, item in enumerate(items):
+        if 'signature' not in batch:
+            try:
+                verify_measurement_signature(public_key, item['data'], base64.b64decode(item['signature']))
+            except Exception:
+                statuses.append({'status': 'invalid_signature'})
+                continue
+        try:
+            SensorData(**item['data'])
+        except (ValidationError, TypeError):
+            statuses.append({'status': 'invalid_data'})
+            continue
+        statuses.append({'status': 'inserted'})
+        valid.append((i, item['data']))
+
+    measurements = [m for _, m in valid]
+    qualities = [analytics.robust_estimate(m['values']) for m in measurements]
+    errors = dbu.insert_values(config['database'], measurements, qualities)
+    inserted = []
+    for (i, measurement), quality, error in zip(valid, qualities, errors):
+        if error is None:
+            inserted.append((measurement, quality))
+        else:
+            statuses[i] = {'status': 'error', 'detail': error}
+    for measurement, quality in inserted:
+        after_insert(measurement, quality)
+    if shared_store is not None and inserted:
+        shared_store.publish(inserted)
+    return {'inserted': len(inserted), 'rejected': len(items) - len(inserted), 'items': statuses}
+
+
+# Derived metrics worker
+pending_derived_files = set()
+# Inserts add to the set in the thread pool, the worker drains it in the event loop
+pending_derived_lock = threading.Lock()
+derived_metrics_event = asyncio.Event()
+event_loop = None
+# Whether forecast_loader loaded the recent levels, the forecasts of /get_latest/ change with it
+forecasts_loaded = False
+
+def schedule_derived_metrics_update(measurement):
+    """
+    Marks the SQLite file of an inserted measurement for the derived metrics worker.
+
+    **Args**:
+
+        - `measurement` (dict): The inserted measurement data (see `SensorData`).
+    """
+    if not config.getboolean('analytics', 'derived_metrics', fallback=True):
+        return
+    file_name = dbu.get_sqlite3_file_name_from_conf(datetime.fromisoformat(measurement['datetime']))
+    with pending_derived_lock:
+        pending_derived_files.add(file_name)
+    # Inserts run in the thread pool, the event is set in the event loop
+    if event_loop is not None:
+        event_loop.call_soon_threadsafe(derived_metrics_event.set)
+
+def publish_live_measurement(measurement, quality):
+    """
+    Pushes an inserted measurement to the subscribers of the live endpoints (see `live.publish`).
+
+    **Args**:
+
+        - `measurement` (dict): The inserted measurement data (see `SensorData`).
+        - `quality` (dict): The robust value and the quality of the measurement (see `analytics.robust_estimate`).
+    """
+    # Inserts run in the thread pool, the subscribers live in the event loop
+    if event_loop is not None and live.subscriber_count():
+        event_loop.call_soon_threadsafe(live.publish, measurement, quality)
+
+def after_insert(measurement, quality):
+    """
+    Applies an inserted measurement to the derived metrics worker, the in-memory state (forecasts, health, latest
+    measurements), the live subscribers and the metrics. It is called in the thread pool after each insert of
+    `/insert/` and `/insert_batch/`.
+
+    **Args**:
+
+        - `measurement` (dict): The inserted measurement data (see `SensorData`).
+        - `quality` (dict): The robust value and the quality of the measurement (see `analytics.robust_estimate`).
+    """
+    schedule_derived_metrics_update(measurement)
+    forecast.add_measurement(measurement, quality)
+    health.add_measurement(measurement, quality)
+    latest.add_measurement(measurement, quality)
+    publish_live_measurement(measurement, quality)
+    MEASUREMENTS_INSERTED.inc(measurement['meas_point'])
+
+# Worker processes
+def apply_shared_inserts():
+    """
+    Applies the measurements, which the other worker processes inserted, to the in-memory state of this worker
+    (latest measurements, forecasts, health and live subscribers, see `workers.SharedStore`). It is called before
+    the in-memory state is read and regularly by `shared_state_worker`.
+    """
+    if shared_store is None:
+        return
+    for measurement, quality in shared_store.fetch():
+        forecast.add_measurement(measurement, quality)
+        health.add_measurement(measurement, quality)
+        latest.add_measurement(measurement, quality)
+        publish_live_measurement(measurement, quality)
+
+async def shared_state_worker():
+    """
+    Background task of each worker process, which applies the inserts of the other workers every `sync_interval`
+    seconds and stores the metric snapshot of this worker every `metrics_interval` seconds (`workers` section of the
+    configuration), so the live subscribers get the measurements of all workers and `/metrics` adds them up.
+    """
+    sync_interval = config.getfloat('workers', 'sync_interval', fallback=0.25)
+    metrics_interval = config.getfloat('workers', 'metrics_interval', fallback=5)
+    stored = 0.0
+    while True:
+        try:
+            await run_blocking(apply_shared_inserts)
+            if time.monotonic() - stored >= metrics_interval:
+                await run_blocking(shared_store.store_metrics, metrics.snapshot())
+                stored = time.monotonic()
+        except Exception as e:
+            logger.error(f"workers: synchronisation failed: {e}")
+        await asyncio.sleep(sync_interval)
+
+async def run_once(worker):
+    """
+    Runs the background task `worker` only in one of the worker processes (see `workers.try_lock`). If the worker
+    process, which runs it, ends, another worker process takes it over within a minute.
+    """
+    if shared_store is not None:
+        while not workers.try_lock(os.path.join(workers_directory, 'background.lock')):
+            await asyncio.sleep(60)
+    await worker()
+
+async def derived_metrics_worker():
+    """
+    Background task, which keeps the `derived_metrics` tables up to date.
+
+    `STARTUP_DELAY` seconds after the startup all SQLite files are brought up to date. Afterwards the task
+    waits for inserts (see `schedule_derived_metrics_update`) and updates the affected SQLite files incrementally.
+    The database work runs in the thread pool, so the event loop is not blocked.
+    """
+    await asyncio.sleep(STARTUP_DELAY)
+    files = None
+    while True:
+        try:
+            written = await run_blocking(dbu.update_derived_metrics, config['database'], files)
+            logger.debug(f"derived metrics: {written} rows updated")
+        except Exception as e:
+            logger.error(f"derived metrics: update failed: {e}")
+        await derived_metrics_event.wait()
+        derived_metrics_event.clear()
+        with pending_derived_lock:
+            files = list(pending_derived_files)
+            pending_derived_files.clear()
+
+async def leak_detection_worker():
+    """
+    Background task, which runs the leak detection (see `leaks.run_leak_detection`) `STARTUP_DELAY` seconds after
+    the startup and afterwards daily at `leak_hour` (local time in `timezone`) of the `analytics` section of the
+    configuration.
+    """
+    tz = config.get('analytics', 'timezone', fallback='UTC')
+    await asyncio.sleep(STARTUP_DELAY)
+    while True:
+        try:
+            stored, leaking = await run_blocking(
+                leaks.run_leak_detection,
+                config['database'],
+                config.getfloat('analytics', 'leak_threshold', fallback=0.2),
+                config.getint('analytics', 'leak_min_nights', fallback=3),
+                config.getint('analytics', 'night_begin', fallback=1),
+                config.getint('analytics', 'night_end', fallback=5),
+                tz
+            )
+            logger.info(f"leak detection: {stored} nights stored, {leaking} leaking")
+        except Exception as e:
+            logger.error(f"leak detection: run failed: {e}")
+        await asyncio.sleep(leaks.seconds_until(config.getint('analytics', 'leak_hour', fallback=6), tz))
+
+def prewarm_caches(hours):
+    """
+    Imports the analytics stack (see `lazy`) and queries the measurements of the last `hours` hours like `/get/`,
+    so the first `/get/` request finds the modules imported and the recent pages of the SQLite files in the cache
+    of the operating system.
+
+    **Args**:
+
+        - `hours` (float): The queried hours before now.
+
+    **Returns**:
+
+        - `int`: The number of queried rows.
+    """
+    lazy.load(np, pd, analytics.signal)
+    dt_end = datetime.now(timezone.utc)
+    data = dbu.get_meas_data_from_sqlite_db(
+        config['database'],
+        dt_end - timedelta(hours=hours),
+        dt_end,
+        resample=config.getint('analytics', 'resample', fallback=0) or None,
+        min_quality=config.getint('analytics', 'min_quality', fallback=analytics.QUALITY_SUSPECT),
+    )
+    return len(data)
+
+async def forecast_loader():
+    """
+    Background task, which loads the recent levels for the forecasts (see `forecast.load_forecast_windows`)
+    `STARTUP_DELAY` seconds after the startup, when the server listens, because the forecasts import numpy. The work
+    runs in the thread pool, so requests are served meanwhile.
+    """
+    global forecasts_loaded
+    await asyncio.sleep(STARTUP_DELAY)
+    try:
+        await run_blocking(forecast.load_forecast_windows, config['database'])
+    except Exception as e:
+        logger.error(f"forecast: loading recent levels failed: {e}")
+    forecasts_loaded = True
+
+async def prewarm_worker():
+    """
+    Background task, which runs `prewarm_caches` `STARTUP_DELAY` seconds after the startup, when the server
+    listens, so the startup does not wait for it. The work runs in the thread pool, so requests are served meanwhile.
+    """
+    await asyncio.sleep(STARTUP_DELAY)
+    start = time.perf_counter()
+    try:
+        rows = await run_blocking(prewarm_caches, config.getfloat('API', 'prewarm_hours', fallback=24))
+        logger.info(f"prewarm: {rows} rows queried in {time.perf_counter() - start:.1f} s")
+    except Exception as e:
+        logger.error(f"prewarm: failed: {e}")
+
+
+# Responses
+API_V2_PREFIX = '/v2/'
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response serialized with orjson.
+
+    NumPy arrays and scalars are serialized directly, `NaN` becomes `null` and the output is not indented.
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+
+def _column_to_list(column):
+    values = column.to_numpy()
+    if values.dtype.kind == 'f':
+        output = values.astype(object)
+        output[np.isnan(values)] = None
+        return output.tolist()
+    return values.tolist()
+
+def json_response(request, data):
+    """
+    Serializes the response data of a read endpoint in the format of the requested API version.
+
+    Requests below `/v2/` get a plain JSON document (see `FastJSONResponse`). All other requests get the
+    pretty printed JSON document encoded as a JSON string, as the API returned it before, so old
+    clients keep working.
+
+    **Args**:
+
+        - `request` (Request): The request.
+        - `data` (dict): The response data.
+
+    **Returns**:
+
+        - `JSONResponse`: The response.
+    """
+    start = time.perf_counter()
+    try:
+        if request.url.path.startswith(API_V2_PREFIX):
+            return FastJSONResponse(content=data)
+        return JSONResponse(content=json.dumps(data, indent=4, default=_json_default))
+    finally:
+        profiling.record_phase('serialize', start)
+
+async def blocking_json_response(request, func, *args):
+    """
+    Calls the blocking request function `func` and serializes its result (see `json_response`) in the
+    bounded thread pool (see `run_blocking`).
+
+    **Example**::
+
+        return await blocking_json_response(request, request_events, json_obj)
+    """
+    return await run_blocking(lambda: json_response(request, func(*args)))
+
+async def respond_measurement_data(request, request_dict):
+    """
+    Answers a `/get/` request in the format negotiated by the `Accept` header (see `binary_formats.negotiate`).
+    """
+    media_type = binary_formats.negotiate(request.headers.get('accept'))
+    if media_type:
+        return await run_blocking(request_measurement_binary, request, request_dict, media_type)
+    return await run_blocking(request_measurement_json, request, request_dict)
+
+
+# Conditional requests
+def query_request_dict(request):
+    """
+    Validates the query parameters of a `GET` read request with the `request_json` model.
+
+    `sensors` can be given several times (`?sensors=left_tank&sensors=right_tank`).
+
+    **Args**:
+
+        - `request` (Request): The request.
+
+    **Returns**:
+
+        - `dict`: The request parameters like the JSON body of the `POST` request.
+
+    **Raises**:
+
+        - `HTTPException`: If the parameters do not match the `request_json` model (406).
+    """
+    params = dict(request.query_params)
+    if 'sensors' in params:
+        params['sensors'] = request.query_params.getlist('sensors')
+    try:
+        return request_json(**params).model_dump(mode='json', exclude_none=True)
+    except ValidationError:
+        raise HTTPException(
+            status_code=HTTP_406_NOT_ACCEPTABLE,
+            detail="Invalid Query Parameters",
+        )
+
+def _etag_matches(request, etag):
+    for tag in request.headers.get('if-none-match', '').split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') == etag.removeprefix('W/'):
+            return True
+    return False
+
+def cached_data_version():
+    """
+    Returns the version of the data of `/get_latest/` and `/get_available_meas_points` for their `ETag`. With the
+    in-memory state (`latest_cache`) it is the insert sequence of this process (see `latest.get_version`) after the
+    inserts of the other workers were applied, so no database file is opened. Otherwise it is the data version of
+    the database (see `database_utils.get_data_version`). It also changes, when `forecast_loader` loaded the
+    forecasts after the startup.
+
+    **Returns**:
+
+        - `tuple`: The version of the data.
+    """
+    apply_shared_inserts()
+    if latest.is_loaded():
+        return latest.get_version(), forecasts_loaded
+    return dbu.get_data_version(config['database']), forecasts_loaded
+
+async def conditional_response(request, respond, time_dependent=False, data_version=None):
+    """
+    Answers a `GET` read request with `304 Not Modified`, if the `If-None-Match` header of the request matches
+    the current `ETag`, otherwise with the response of `respond`.
+
+    The `ETag` is derived from the path, the query parameters, the `Accept` header and the data version (by default
+    the one of the database, see `database_utils.get_data_version`), so it changes with each insert and each update
+    of the background tasks. The `ETag` of responses, which also depend on the current time (e.g. the deprecated state
+    of `/get_latest/`), changes additionally every `cache_max_age` seconds.
+
+    **Args**:
+
+        - `request` (Request): The request.
+        - `respond` (callable): Returns an awaitable of the response, it is only called if the data changed.
+        - `time_dependent` (bool): Whether the response depends on the current time.
+        - `data_version` (callable): Returns the version of the data of the response (see `cached_data_version`).
+          Defaults to the data version of the database.
+
+    **Returns**:
+
+        - `Response`: The response with `ETag` and `Cache-Control` headers.
+
+    **Example**::
+
+        return await conditional_response(request, lambda: blocking_json_response(request, request_health), True)
+    """
+    max_age = config.getint('API', 'cache_max_age', fallback=10)
+    if data_version is None:
+        version = await run_blocking(dbu.get_data_version, config['database'])
+    else:
+        version = await run_blocking(data_version)
+    period = int(time.time() // max_age) if time_dependent and max_age > 0 else None
+    key = repr((
+        request.url.path, sorted(request.query_params.multi_items()), request.headers.get('accept'), version, period
+    ))
+    etag = f'W/"{hashlib.sha1(key.encode()).hexdigest()[:24]}"'
+    headers = {'ETag': etag, 'Cache-Control': f'public, max-age={max_age}', 'Vary': 'Accept'}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response = await respond()
+    response.headers.update(headers)
+    return response
+
+
+# Pagination
+def encode_cursor(positions):
+    """
+    Encodes the positions of the next page of a paginated `/get/` request (see
+    `database_utils.get_meas_data_page_from_sqlite_db`) as an opaque URL-safe cursor.
+
+    **Args**:
+
+        - `positions` (dict): `positions[(meas_point, sensor)]` is `(shard, dt, id)` of the last returned
+          measurement of the series or `None`, if the series is complete.
+
+    **Returns**:
+
+        - `str`: The cursor or `None`, if there is no next page.
+    """
+    if positions is None:
+        return None
+    items = [[mp, sensor] + list(position or ()) for (mp, sensor), position in sorted(positions.items())]
+    return base64.urlsafe_b64encode(orjson.dumps(items)).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor of `encode_cursor`.
+
+    **Returns**:
+
+        - `dict`: The positions of the series.
+
+    **Raises**:
+
+        - `HTTPException`: If the cursor is invalid (406).
+    """
+    try:
+        positions = {}
+        for item in orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))):
+            mp, sensor, *position = item
+            if position:
+                shard, dt, mid = position
+                if not (isinstance(shard, str) and len(shard) == 7 and isinstance(dt, str) and isinstance(mid, int)):
+                    raise ValueError(position)
+            positions[(str(mp), str(sensor))] = tuple(position) or None
+        return positions
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=HTTP_406_NOT_ACCEPTABLE,
+            detail="Invalid Cursor",
+        )
+
+def add_next_cursor(request, response, data):
+    """
+    Adds the cursor of the next page of a paginated `/get/` request to the response: the `Next-Cursor` header and,
+    for `GET` requests, the URL of the next page in the `Link` header. The last page has neither header.
+    """
+    cursor = data.attrs.get('next_cursor')
+    if cursor is None:
+        return response
+    response.headers['Next-Cursor'] = cursor
+    if request.method == 'GET':
+        response.headers['Link'] = f'<{request.url.include_query_params(cursor=cursor)}>; rel="next"'
+    return response
+
+
+def query_measurement_data(request_dict):
+    """
+    Fetches the measurement data of a `/get/` request (see `request_measurement_data`) from the database.
+
+    If `page_size` is given, only the page at `cursor` is fetched (see
+    `database_utils.get_meas_data_page_from_sqlite_db`) and the cursor of the next page is stored in
+    `data.attrs['next_cursor']` (`None` on the last page). The page size is limited by `max_page_size`
+    in the `API` section of the configuration.
+
+    **Args**:
+
+        - `request_dict` (dict): The request parameters (see `request_json`).
+
+    **Returns**:
+
+        - `pd.DataFrame`: The measurement data (see `database_utils.get_meas_data_from_sqlite_db`).
+    """
+    min_quality = request_dict.get('min_quality')
+    if min_quality is None:
+        min_quality = config.getint('analytics', 'min_quality', fallback=analytics.QUALITY_SUSPECT)
+    if request_dict.get('page_size'):
+        positions = decode_cursor(request_dict['cursor']) if request_dict.get('cursor') else None
+        data, positions = dbu.get_meas_data_page_from_sqlite_db(
+            config['database'],
+            datetime.fromisoformat(request_dict['dt_begin']),
+            datetime.fromisoformat(request_dict['dt_end']),
+            min(request_dict['page_size'], config.getint('API', 'max_page_size', fallback=10000)),
+            positions,
+            min_quality=min_quality,
+            meas_point=request_dict.get('meas_point'),
+            sensors=request_dict.get('sensors'),
+        )
+        data.attrs['next_cursor'] = encode_cursor(positions)
+        GET_ROWS.observe(len(data))
+        return data
+    resample = request_dict.get('resample') or config.getint('analytics', 'resample', fallback=0)
+    data = dbu.get_meas_data_from_sqlite_db(
+        config['database'],
+        datetime.fromisoformat(request_dict['dt_begin']),
+        datetime.fromisoformat(request_dict['dt_end']),
+        resample=resample or None,
+        min_quality=min_quality,
+        meas_point=request_dict.get('meas_point'),
+        sensors=request_dict.get('sensors'),
+        max_points=request_dict.get('max_points') or config.getint('analytics', 'max_points', fallback=0) or None
+    )
+    GET_ROWS.observe(len(data))
+    return data
 
-def request_measurement_data(request_dict):
+def request_measurement_binary(request, request_dict, media_type):
     """
-    Requests measurement data from the database and formats it into a JSON response.
+    Requests measurement data from the database and encodes it in a binary format (see `binary_formats`).
+
+    The arrays of the data are encoded directly, so the values are not converted one by one.
+
+    **Args**:
+
+        - `request` (Request): The request.
+        - `request_dict` (dict): The request parameters (see `request_measurement_data`). `format` is ignored.
+        - `media_type` (str): The media type of the format (see `binary_formats.negotiate`).
+
+    **Returns**:
+
+        - `Response`: The encoded data.
+
+    **Raises**:
+
+        - `HTTPException`: If the optional dependency of the format is not installed (406).
+    """
+    data = query_measurement_data(request_dict)
+    start = time.perf_counter()
+    try:
+        content = binary_formats.encode(media_type, data)
+    except ImportError as e:
+        raise HTTPException(status_code=HTTP_406_NOT_ACCEPTABLE, detail=f"{media_type} is not available: {e}")
+    finally:
+        profiling.record_phase('serialize', start)
+    return add_next_cursor(request, Response(content=content, media_type=media_type), data)
+
+def request_measurement_json(request, request_dict):
+    """
+    Requests measurement data from the database and returns it as JSON response (see `request_measurement_data`
+    and `json_response`).
+    """
+    data = query_measurement_data(request_dict)
+    return add_next_cursor(request, json_response(request, request_measurement_data(request_dict, data)), data)
+
+def request_measurement_data(request_dict, data=None):
+    """
+    Requests measurement data from the database and formats it for a JSON response.
 
     This function retrieves measurement data from a database based on the provided
     `dt_begin` and `dt_end` dates in the `request_dict`. It then processes and formats
@@ -342,10 +1191,33 @@ def request_measurement_data(request_dict):
       - `request_dict` (dict): A dictionary containing the request parameters, specifically:
       - 'dt_begin' (str): The start datetime for the requested period.
       - 'dt_end' (str): The end datetime for the requested period.
+      - 'resample' (int, optional): Width of a time grid in minutes. Defaults to `resample` in the
+        `analytics` section of the configuration (0: no resampling). If set, each sensor is resampled
+        onto the grid and every value gets a `gap` flag for bins without measurements.
+      - 'min_quality' (int, optional): Minimal quality flag of the used measurements. Defaults to
+        `min_quality` in the `analytics` section of the configuration.
+      - 'format' (str, optional): `rows` (default) returns a list of objects per sensor in `values`
+        and `deriv`. `columns` returns one array per field instead (`timestamp`, `value`, `gap` and
+        `deriv` with `value`, `value_10`, `peaks_pos` and `peaks_neg`), `tank_height`, `max_val`, `warn`
+        and `alarm` are sent once per sensor, if they are constant.
+      - 'meas_point' (str, optional): Only return the data of this measurement point.
+      - 'sensors' (list, optional): Only return the data of these sensors.
+        Both filters are applied in the database query, so the other sensors cost nothing.
+      - 'max_points' (int, optional): Point budget per sensor. Longer series are downsampled with
+        Largest-Triangle-Three-Buckets on the value and the derivation, the most prominent peaks and the
+        longest gaps are kept within the budget. Defaults to `max_points` in the `analytics` section of the
+        configuration (0: no limit).
+      - 'page_size' (int, optional): Return only the next page of at most this number of measurements
+        per sensor. The response of each page has the cursor of the next page in its `Next-Cursor` header,
+        which is passed as 'cursor' with the otherwise unchanged request. The last page has no
+        `Next-Cursor` header. Not available with 'resample' and 'max_points'.
+      - 'cursor' (str, optional): The cursor of the page (see 'page_size').
+    - `data` (pd.DataFrame, optional): The measurement data, if it was already fetched (see
+      `query_measurement_data`).
 
     **Returns**:
 
-        - `JSONResponse`: A JSON response containing the processed measurement data, structured by measurement point and sensor.
+        - `dict`: The processed measurement data, structured by measurement point and sensor.
 
     **Example**::
 
@@ -358,77 +1230,84 @@ def request_measurement_data(request_dict):
 
     """
 
-    data = dbu.get_meas_data_from_sqlite_db(
-        config['database'],
-        datetime.fromisoformat(request_dict['dt_begin']),
-        datetime.fromisoformat(request_dict['dt_end'])
-    )
-    data_json = {
-    }
-    if not data.empty:
-        for mp in data['mpName'].unique():
-            d_mp = data[data['mpName']==mp]
-            max_d = max(d_mp['derivation_10'])
-            min_d = min(d_mp['derivation_10'])
-            if d_mp.empty:
-                continue
-            data_json[mp] = []
-            for s in d_mp['sensorId'].unique():
-                d_s = d_mp[d_mp['sensorId'] == s]
-                if d_s.empty or not 'value' in list(d_s.keys()):
-                    continue
-
-                data_json[mp].append(
-                    {
-                        'sensorID': s,
-                        'values': [
-                            {
-                                'timestamp': d_s['dt'].iloc[x],
-                                'value': d_s['value'].iloc[x],
-                                'tank_height': d_s['tank_height'].iloc[x],
-                                'max_val':d_s['max_val'].iloc[x],
-                                'warn':d_s['warn'].iloc[x],
-                                'alarm':d_s['alarm'].iloc[x],
-                            }
-                        for x in range(len(d_s))],
-                        'deriv': [
-                            {
-                                'timestamp': d_s['dt'].iloc[x],
-                                'value': d_s['derivation'].iloc[x],
-                                'value_10': d_s['derivation_10'].iloc[x],
-                                'peaks_pos': d_s['peaks_pos'].iloc[x],
-                                'peaks_neg': d_s['peaks_neg'].iloc[x],
-                            }
-                        for x in range(len(d_s))],
-
-                        'y_max':max(d_s['max_val'].to_list())+10,
-                        'deriv_y_max': round(max_d,0) + 10,
-                        'deriv_y_min': round(min_d,0) - 10,
-                    }
-                )
-        return JSONResponse(content=json.dumps(data_json, indent=4))
-    else:
-        return JSONResponse(content=json.dumps({}, indent=4))
+    if data is None:
+        data = query_measurement_data(request_dict)
+    start = time.perf_counter()
+    data_json = {}
+    nan_to_none = dbu.convert_nan_to_none
+    columnar = request_dict.get('format') == 'columns'
+    for mp, d_mp in data.groupby('mpName', sort=False):
+        max_d = nan_to_none(d_mp['derivation_10'].max()) or 0.0
+        min_d = nan_to_none(d_mp['derivation_10'].min()) or 0.0
+        data_json[mp] = []
+        for s, d_s in d_mp.groupby('sensorId', sort=False):
+            columns = {
+                'timestamp': d_s['dt'].tolist(),
+                'value': _column_to_list(d_s['value']),
+                'tank_height': _column_to_list(d_s['tank_height']),
+                'max_val': _column_to_list(d_s['max_val']),
+                'warn': _column_to_list(d_s['warn']),
+                'alarm': _column_to_list(d_s['alarm']),
+            }
+            if 'gap' in d_s:
+                columns['gap'] = d_s['gap'].to_numpy(dtype=bool).tolist()
+            deriv = {
+                'timestamp': columns['timestamp'],
+                'value': _column_to_list(d_s['derivation']),
+                'value_10': _column_to_list(d_s['derivation_10']),
+                'peaks_pos': _column_to_list(d_s['peaks_pos']),
+                'peaks_neg': _column_to_list(d_s['peaks_neg']),
+            }
+            y_max = max(columns['max_val']) + 10
+            if columnar:
+                for key in ('tank_height', 'max_val', 'warn', 'alarm'):
+                    if len(set(columns[key])) == 1:
+                        columns[key] = columns[key][0]
+                del deriv['timestamp']
+                sensor_json = {'sensorID': s, **columns, 'deriv': deriv}
+            else:
+                sensor_json = {
+                    'sensorID': s,
+                    'values': [dict(zip(columns, row)) for row in zip(*columns.values())],
+                    'deriv': [dict(zip(deriv, row)) for row in zip(*deriv.values())],
+                }
+            data_json[mp].append({
+                **sensor_json,
+                'y_max': y_max,
+                'deriv_y_max': round(max_d, 0) + 10,
+                'deriv_y_min': round(min_d, 0) - 10,
+            })
+    profiling.record_phase('serialize', start)
+    return data_json
 
 def request_last_measurements():
     """
-    Requests the last measurement data from the database and formats it into a JSON response.
+    Requests the last measurement data from the database and formats it for a JSON response.
 
     This function retrieves the most recent measurement data from the database and processes
     it into a structured JSON format. The data is organized by measurement point and includes
     details such as sensor name, timestamp, value, color, warning, alarm, and maximum value.
     The timestamp is formatted according to the specified date-time format in the configuration.
+    For each sensor the forecast (see `forecast.get_forecast`) is added: the consumption rate in cm/h
+    and the hours until the level crosses the warning threshold, the alarm threshold and zero
+    (`None` if the level is not falling or there is not enough recent data). The `health` of each
+    sensor is its status of the sensor health monitor (see `health.get_health`). The measurements are taken
+    from the in-memory state of `latest`, if it is loaded, otherwise from the database.
 
     **Returns**:
-    - `JSONResponse`: A JSON response containing the most recent measurement data, structured by measurement point.
+    - `dict`: The most recent measurement data, structured by measurement point.
 
     **Example**::
 
         response = request_last_measurements()
     """
-    data = dbu.get_last_meas_data_from_sqlite_db(
-        config['database']
-    )
+    apply_shared_inserts()
+    if latest.is_loaded():
+        data = latest.get_last_meas_data()
+    else:
+        data = dbu.get_last_meas_data_from_sqlite_db(
+            config['database']
+        )
     data_json = {}
     #print (data)
     for mp in data:
@@ -442,14 +1321,120 @@ def request_last_measurements():
             "max_val": [data[mp][x]["max_val"] for x in data[mp]],
             "tank_height": [data[mp][x]["tank_height"] for x in data[mp]],
         }
+        forecasts = [forecast.get_forecast(mp, x) or {} for x in data[mp]]
+        data_json[mp]["rate"] = [f.get("rate") for f in forecasts]
+        data_json[mp]["time_to_warn"] = [f.get("warn") for f in forecasts]
+        data_json[mp]["time_to_alarm"] = [f.get("alarm") for f in forecasts]
+        data_json[mp]["time_to_empty"] = [f.get("empty") for f in forecasts]
+        data_json[mp]["health"] = [(health.get_health(mp, x) or {}).get("status") for x in data[mp]]
 
-    return JSONResponse(content=json.dumps(data_json, indent=4))
+    return data_json
 
 def request_measurement_points():
-    data = dbu.get_available_meas_points_from_sqlite_db(
+    apply_shared_inserts()
+    if latest.is_loaded():
+        return latest.get_available_meas_points()
+    return dbu.get_available_meas_points_from_sqlite_db(
         config['database']
     )
-    return JSONResponse(content=json.dumps(data, indent=4))
+
+def request_events(request_dict):
+    """
+    Requests the refill and consumption events from the database and formats them for a JSON response.
+
+    The events are detected by the derived metrics worker and stored per sensor, so this function
+    does not touch the raw measurement values.
+
+    **Args**:
+
+      - `request_dict` (dict): A dictionary containing the request parameters, specifically:
+      - 'dt_begin' (str): The start datetime for the requested period.
+      - 'dt_end' (str): The end datetime for the requested period.
+      - 'meas_point' (str, optional): Only return the events of this measurement point.
+
+    **Returns**:
+
+        - `dict`: The events, structured by measurement point and sensor.
+
+    **Example**::
+
+        request_dict = {
+            'dt_begin': '2024-12-01T08:00:00',
+            'dt_end': '2024-12-01T18:00:00',
+            'meas_point': 'raspi1'
+        }
+
+        response = request_events(request_dict)
+    """
+    return dbu.get_events_from_sqlite_db(
+        config['database'],
+        datetime.fromisoformat(request_dict['dt_begin']),
+        datetime.fromisoformat(request_dict['dt_end']),
+        request_dict.get('meas_point')
+    )
+
+def request_health():
+    """
+    Returns the health of all sensors from the sensor health monitor (see `health.get_all_health`).
+
+    **Returns**:
+
+        - `dict`: The health of each sensor, structured by measurement point and sensor.
+
+    **Example**::
+
+        response = request_health()
+    """
+    apply_shared_inserts()
+    return health.get_all_health()
+
+def request_metrics():
+    """
+    Returns the operational counters of the API.
+
+    **Returns**:
+
+        - `dict`: The counters of the response compression per encoding (see `compression.get_stats`) and the
+          number of subscribers of the live endpoints.
+
+    **Example**::
+
+        response = request_metrics()
+    """
+    return {'compression': compression.get_stats(), 'live': {'subscribers': live.subscriber_count()}}
+
+def request_leaks(request_dict):
+    """
+    Requests the night-time baseline consumption and the leak flags from the database and formats them for a JSON response.
+
+    The nights are calculated by the leak detection job (see `leak_detection_worker`).
+
+    **Args**:
+
+      - `request_dict` (dict): A dictionary containing the request parameters, specifically:
+      - 'dt_begin' (str): The start datetime for the requested period.
+      - 'dt_end' (str): The end datetime for the requested period.
+      - 'meas_point' (str, optional): Only return the nights of this measurement point.
+
+    **Returns**:
+
+        - `dict`: The nights, structured by measurement point and sensor.
+
+    **Example**::
+
+        request_dict = {
+            'dt_begin': '2024-12-01T00:00:00',
+            'dt_end': '2024-12-31T00:00:00'
+        }
+
+        response = request_leaks(request_dict)
+    """
+    return dbu.get_night_baselines_from_sqlite_db(
+        config['database'],
+        datetime.fromisoformat(request_dict['dt_begin']),
+        datetime.fromisoformat(request_dict['dt_end']),
+        request_dict.get('meas_point')
+    )
 
 
 origins = [
@@ -458,14 +1443,76 @@ origins = [
     "http://localhost:8012",
     "http://localhost:5173",
 ]
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    global event_loop, shared_store
+    event_loop = asyncio.get_running_loop()
+    tasks = []
+    if WORKERS > 1:
+        # Opened before the in-memory state is loaded, so no insert of another worker is missed
+        shared_store = workers.SharedStore(os.path.join(workers_directory, 'shared.sqlite'))
+        tasks.append(asyncio.create_task(shared_state_worker()))
+        logger.info(f"workers: worker process {os.getpid()} of {WORKERS} started")
+    pool_size = config.getint('analytics', 'pool_size', fallback=0)
+    if pool_size > 0:
+        analytics.start_pool(pool_size, config.getint('analytics', 'pool_min_rows', fallback=100000))
+        logger.info(f"analytics: process pool with {pool_size} workers started")
+    try:
+        await run_blocking(health.load_health_state, config['database'])
+    except Exception as e:
+        logger.error(f"health: loading recent levels failed: {e}")
+    if config.getboolean('API', 'latest_cache', fallback=True):
+        try:
+            await run_blocking(latest.load_latest_state, config['database'])
+        except Exception as e:
+            logger.error(f"latest: loading latest measurements failed: {e}")
+    tasks.append(asyncio.create_task(forecast_loader()))
+    if config.getboolean('analytics', 'derived_metrics', fallback=True):
+        tasks.append(asyncio.create_task(derived_metrics_worker()))
+    if config.getboolean('analytics', 'leak_detection', fallback=True):
+        tasks.append(asyncio.create_task(run_once(leak_detection_worker)))
+    if config.getboolean('API', 'prewarm', fallback=False):
+        tasks.append(asyncio.create_task(prewarm_worker()))
+    yield
+    for task in tasks:
+        task.cancel()
+    analytics.stop_pool()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials = True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Next-Cursor", "Link", "Server-Timing"],
 )
+if config.getboolean('compression', 'enable', fallback=True):
+    app.add_middleware(
+        compression.CompressionMiddleware,
+        minimum_size=config.getint('compression', 'minimum_size', fallback=1024),
+        levels={
+            compression.GZIP: config.getint('compression', 'gzip_level', fallback=6),
+            compression.BROTLI: config.getint('compression', 'brotli_level', fallback=4),
+            compression.ZSTD: config.getint('compression', 'zstd_level', fallback=3),
+        },
+        encodings=[
+            e for e in config.get('compression', 'encodings', fallback='zstd, br, gzip').replace(' ', '').split(',')
+            if e in compression.available_encodings()
+        ],
+    )
+
+app.add_middleware(
+    profiling.ProfilingMiddleware,
+    enable=config.getboolean('profiling', 'enable', fallback=False),
+    slow_threshold=config.getfloat('profiling', 'slow_threshold', fallback=1000),
+    directory=config.get('profiling', 'directory', fallback='../log/profiles'),
+    max_captures=config.getint('profiling', 'max_captures', fallback=20),
+    sample_interval=config.getfloat('profiling', 'sample_interval', fallback=5),
+    trace_memory=config.getboolean('profiling', 'trace_memory', fallback=True),
+)
+app.add_middleware(metrics.MetricsMiddleware)
 
 @app.post("/insert/")
 async def receive_data(request: Request, token: str = Depends(verify_token)):
@@ -481,26 +1528,187 @@ async def receive_data(request: Request, token: str = Depends(verify_token)):
         raise HTTPException(status_code=401, detail="Unauthorized client")
 
     try:
-        verify_signature(public_key, data, signature)
-        return insert_to_db(data)
+        await run_blocking(verify_measurement_signature, public_key, data, signature)
+        return await run_blocking(insert_to_db, data)
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid signature")
 
 
+@app.post("/insert_batch/")
+async def receive_batch(request: Request, token: str = Depends(verify_token)):
+    json_obj = await request.json()
+    batch = json.loads(json_obj) if isinstance(json_obj, str) else json_obj
+    if not isinstance(batch, dict):
+        raise HTTPException(status_code=HTTP_406_NOT_ACCEPTABLE, detail="Invalid JSON Structure")
+    return await run_blocking(insert_batch_to_db, batch)
+
+
 @app.post("/get/")
+@app.post("/v2/get/")
 async def post_data(request: Request):
     json_obj = await request.json()
     if validate_request_json(json_obj):
-        return request_measurement_data(json_obj)
+        return await respond_measurement_data(request, json_obj)
+
+@app.get("/get/")
+@app.get("/v2/get/")
+async def get_data(request: Request):
+    request_dict = query_request_dict(request)
+    return await conditional_response(request, lambda: respond_measurement_data(request, request_dict))
+
+@app.post("/get_events/")
+@app.post("/v2/get_events/")
+async def post_events(request: Request):
+    json_obj = await request.json()
+    if validate_request_json(json_obj):
+        return await blocking_json_response(request, request_events, json_obj)
+
+@app.get("/get_events/")
+@app.get("/v2/get_events/")
+async def get_events(request: Request):
+    request_dict = query_request_dict(request)
+    return await conditional_response(request, lambda: blocking_json_response(request, request_events, request_dict))
+
+@app.post("/get_leaks/")
+@app.post("/v2/get_leaks/")
+async def post_leaks(request: Request):
+    json_obj = await request.json()
+    if validate_request_json(json_obj):
+        return await blocking_json_response(request, request_leaks, json_obj)
+
+@app.get("/get_leaks/")
+@app.get("/v2/get_leaks/")
+async def get_leaks(request: Request):
+    request_dict = query_request_dict(request)
+    return await conditional_response(request, lambda: blocking_json_response(request, request_leaks, request_dict))
+
+@app.post("/get_health/")
+@app.post("/v2/get_health/")
+async def post_health(request: Request):
+    return json_response(request, request_health())
+
+@app.get("/get_health/")
+@app.get("/v2/get_health/")
+async def get_health(request: Request):
+    return await conditional_response(
+        request, lambda: blocking_json_response(request, request_health), time_dependent=True
+    )
+
+@app.post("/get_metrics/")
+@app.post("/v2/get_metrics/")
+async def post_metrics(request: Request):
+    return json_response(request, request_metrics())
 
 @app.post("/get_latest/")
-async def post_last_data():
-    return request_last_measurements()
+@app.post("/v2/get_latest/")
+async def post_last_data(request: Request):
+    return await blocking_json_response(request, request_last_measurements)
+
+@app.get("/get_latest/")
+@app.get("/v2/get_latest/")
+async def get_last_data(request: Request):
+    return await conditional_response(
+        request, lambda: blocking_json_response(request, request_last_measurements), time_dependent=True,
+        data_version=cached_data_version,
+    )
 
 @app.post("/get_available_meas_points")
-async def post_meas_points():
-    return request_measurement_points()
+@app.post("/v2/get_available_meas_points")
+async def post_meas_points(request: Request):
+    return await blocking_json_response(request, request_measurement_points)
+
+@app.get("/get_available_meas_points")
+@app.get("/v2/get_available_meas_points")
+async def get_meas_points(request: Request):
+    return await conditional_response(
+        request, lambda: blocking_json_response(request, request_measurement_points), time_dependent=True,
+        data_version=cached_data_version,
+    )
 
-if __name__ == '__main__':
+def live_meas_points(params):
+    return params.getlist('meas_point') or None
+
+def live_subscribe(meas_points):
+    if live.subscriber_count() >= config.getint('live', 'max_clients', fallback=100):
+        return None
+    return live.subscribe(meas_points, config.getint('live', 'buffer_size', fallback=live.DEFAULT_BUFFER_SIZE))
+
+@app.get("/live/")
+@app.get("/v2/live/")
+async def live_events(request: Request):
+    subscriber = live_subscribe(live_meas_points(request.query_params))
+    if subscriber is None:
+        raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="Too many live clients")
+    keepalive = config.getint('live', 'keepalive', fallback=15)
+
+    async def stream():
+        try:
+            # Sends the headers at once and sets the reconnection delay of EventSource clients
+            yield b'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), keepalive)
+                except asyncio.TimeoutError:
+                    # Comment line, which keeps proxies from closing the idle connection
+                    yield b': keepalive\n\n'
+                    continue
+                yield b'id: %d\nevent: %s\ndata: %s\n\n' % (event['id'], event['type'].encode(), orjson.dumps(event))
+        finally:
+            live.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.websocket("/ws/live/")
+@app.websocket("/v2/ws/live/")
+async def live_websocket(websocket: WebSocket):
+    subscriber = live_subscribe(live_meas_points(websocket.query_params))
+    if subscriber is None:
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    # Detects the disconnect of an idle client, which never sends anything
+    receiver = asyncio.ensure_future(websocket.receive())
+    getter = asyncio.ensure_future(subscriber.get())
+    try:
+        while True:
+            await asyncio.wait((getter, receiver), return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                if receiver.result()['type'] == 'websocket.disconnect':
+                    break
+                receiver = asyncio.ensure_future(websocket.receive())
+            # Both can be done at once, the event is sent in that case, too
+            if getter.done():
+                await websocket.send_text(orjson.dumps(getter.result()).decode())
+                getter = asyncio.ensure_future(subscriber.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        getter.cancel()
+        live.unsubscribe(subscriber)
+
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    snapshots = await run_blocking(shared_store.load_metrics) if shared_store is not None else ()
+    return Response(metrics.render(snapshots), media_type=metrics.CONTENT_TYPE)
+
+def run():
+    """
+    Serves the API on `port` of the `API` section of the configuration, in `count` worker processes of the
+    `workers` section. It is called by `python main.py`.
+
+    **Example**::
+
+        import main
+        main.run()
+    """
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
+    if WORKERS > 1:
+        # The worker processes import the application themselves
+        uvicorn.run("main:app", host="0.0.0.0", port=PORT, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT)
@@ -0,0 +1,298 @@
+"""
+Module Name: Wassermonitor2 API metrics
+
+Description:
+    This file collects the operational metrics of the API and renders them in the text format of
+    Prometheus for the `/metrics` endpoint (see `render`).
+
+    The metrics are updated on the hot path (each request, each SQLite statement, each insert), so
+    an update takes no lock: each thread counts into its own dictionary and `render` adds up the
+    dictionaries of all threads. Only the first update of a thread registers its dictionary with a
+    lock. Counters and histograms never decrease, so the dictionaries of finished threads are kept.
+
+    - `Counter`: A counter per label values, e.g. the inserted measurements per measurement point.
+    - `Gauge`: A value per label values, which can be increased and decreased from any thread.
+    - `GaugeCallback`: A value, which is calculated by a function when the metrics are rendered.
+    - `Histogram`: The distribution of observed values (e.g. durations) in cumulative buckets.
+
+    `MetricsMiddleware` counts the requests and their durations per route.
+
+    With several worker processes (see `workers`) each worker stores its `snapshot` regularly and
+    `render` adds up the samples of all workers. Metrics, which have the same value in all workers
+    (`shared`, e.g. the SQLite files), are taken from the rendering worker only.
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets of the durations in seconds
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+    # Whether all worker processes have the same value (see render)
+    shared = False
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        _registry.append(self)
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def _collect_shards(self):
+        with self._lock:
+            shards = list(self._shards)
+        # dict.items() is copied under the GIL, so the owning thread can keep counting
+        return [list(shard.items()) for shard in shards]
+
+    def samples(self):
+        """
+        Returns the samples of the metric as list of (suffix, label values, extra labels, value).
+        """
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A counter per label values.
+
+    **Example usage**::
+
+        INSERTED = Counter('wassermonitor_measurements_inserted_total', 'Inserted measurements.', ['meas_point'])
+        INSERTED.inc('raspi1')
+    """
+    type_name = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def samples(self):
+        totals = {}
+        for items in self._collect_shards():
+            for labels, value in items:
+                totals[labels] = totals.get(labels, 0) + value
+        return [('', labels, (), value) for labels, value in sorted(totals.items())]
+
+
+class Gauge(Counter):
+    """
+    A value per label values, which is increased and decreased (e.g. the open connections).
+    """
+    type_name = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class GaugeCallback(_Metric):
+    """
+    A value, which is calculated by `func` when the metrics are rendered. `func` returns a number or
+    a dictionary with the number of each tuple of label values. `shared` values are the same in all
+    worker processes (e.g. the files on disk), so they are not added up (see `render`).
+
+    **Example usage**::
+
+        GaugeCallback('wassermonitor_live_subscribers', 'Subscribers of the live endpoints.', live.subscriber_count)
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, func, labelnames=(), shared=False):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+        self.shared = shared
+
+    def samples(self):
+        value = self.func()
+        if isinstance(value, dict):
+            return [('', labels, (), v) for labels, v in sorted(value.items())]
+        return [('', (), (), value)]
+
+
+class CounterCallback(GaugeCallback):
+    """
+    A counter, which is kept by another module and read by `func` when the metrics are rendered.
+    """
+    type_name = 'counter'
+
+
+class Histogram(_Metric):
+    """
+    The distribution of observed values in cumulative buckets per label values.
+
+    **Example usage**::
+
+        SECONDS = Histogram('wassermonitor_sqlite_query_duration_seconds', 'SQLite statements.', ['function'])
+        SECONDS.observe(0.002, 'insert_value')
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # One count per bucket, the +Inf bucket, the sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        totals = {}
+        for items in self._collect_shards():
+            for labels, counts in items:
+                total = totals.setdefault(labels, [0] * len(counts))
+                for i, count in enumerate(list(counts)):
+                    total[i] += count
+        samples = []
+        for labels, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append(('_bucket', labels, (('le', _number(bound)),), cumulative))
+            samples.append(('_sum', labels, (), counts[-1]))
+            samples.append(('_count', labels, (), cumulative))
+        return samples
+
+
+def snapshot():
+    """
+    Returns the samples of the metrics of this process, which are added up over the worker processes
+    (see `render`), as JSON serializable dictionary.
+
+    :rtype: dict
+
+    **Example usage**::
+
+        snapshot()
+        # {'wassermonitor_measurements_inserted_total': {'type': 'counter', 'samples': [['', ['raspi1'], [], 3]]}}
+    """
+    return {
+        metric.name: {
+            'type': metric.type_name,
+            'samples': [[suffix, list(labels), [list(e) for e in extra], value]
+                        for suffix, labels, extra, value in metric.samples()],
+        }
+        for metric in _registry if not metric.shared
+    }
+
+
+def _sample_order(sample):
+    suffix, labels, extra, _ = sample
+    return [str(label) for label in labels], suffix, [float(value) for _, value in extra]
+
+
+def _merge_samples(metric, snapshots):
+    totals = {}
+    for suffix, labels, extra, value in metric.samples():
+        totals[(suffix, tuple(labels), tuple(extra))] = value
+    for other in snapshots:
+        for suffix, labels, extra, value in other.get(metric.name, {}).get('samples', ()):
+            key = (suffix, tuple(labels), tuple(tuple(e) for e in extra))
+            totals[key] = totals.get(key, 0) + value
+    return sorted(((suffix, labels, extra, value) for (suffix, labels, extra), value in totals.items()),
+                  key=_sample_order)
+
+
+def render(snapshots=()):
+    """
+    Renders all metrics in the text format of Prometheus.
+
+    :param snapshots: The snapshots of the other worker processes (see `snapshot`). Their samples are
+        added to the samples of this process, except for `shared` metrics.
+    :type snapshots: list
+
+    :rtype: bytes
+    """
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type_name}')
+        samples = _merge_samples(metric, snapshots) if snapshots and not metric.shared else metric.samples()
+        for suffix, labels, extra, value in samples:
+            lines.append(f'{metric.name}{suffix}{_labels(metric.labelnames, labels, extra)} {_number(value)}')
+    return ('\n'.join(lines) + '\n').encode()
+
+
+HTTP_REQUESTS = Counter(
+    'wassermonitor_http_requests_total', 'HTTP requests per route, method and status code.',
+    ['route', 'method', 'status'],
+)
+HTTP_DURATION = Histogram(
+    'wassermonitor_http_request_duration_seconds', 'Duration of the HTTP requests per route and method.',
+    ['route', 'method'],
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, which counts the requests and their durations per route (`HTTP_REQUESTS`,
+    `HTTP_DURATION`). The route is the path template of the endpoint, requests without an endpoint
+    are counted as `unmatched`, so the number of label values stays bounded.
+
+    **Example usage**::
+
+        app.add_middleware(MetricsMiddleware)
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            HTTP_REQUESTS.inc(route, scope['method'], status)
+            HTTP_DURATION.observe(time.perf_counter() - start, route, scope['method'])
@@ -0,0 +1,236 @@
+"""
+Module Name: Wassermonitor2 API profiling
+
+Description:
+    This file measures where the time of a request goes.
+
+    The request functions record the duration of their phases with `record_phase`, e.g. `query`
+    (SQLite), `analytics` (derivation, resampling, downsampling) and `serialize` (JSON or binary
+    encoding). `ProfilingMiddleware` sends them to the client in a `Server-Timing` header together with
+    the total duration of the application (`app`), so the browser shows them in its network panel:
+
+        Server-Timing: query;dur=812.4, analytics;dur=2210.7, serialize;dur=403.2, app;dur=3431.9
+
+    The phases are kept in a context variable, which the thread pool copies into its threads, so
+    the phases of the blocking work are recorded, too. Without a request (e.g. in the background
+    tasks) `record_phase` does nothing.
+
+    If profiling is enabled, `ProfilingMiddleware` additionally samples the stacks of all threads
+    every `sample_interval` milliseconds while a request runs, and traces the memory allocations
+    with `tracemalloc`. Requests, which take longer than `slow_threshold` milliseconds, are captured
+    in `directory`:
+
+    - `<capture>.json`: the request (method, path, query, body), the status, the durations of the
+      phases, the peak of the traced memory during the request and the largest allocations, which are
+      still alive at the end of the request.
+    - `<capture>.folded`: the sampled stacks in the folded format of flame graph tools (e.g.
+      `flamegraph.pl` or speedscope), one line `thread;outer;...;inner count` per stack.
+
+    Only the newest `max_captures` captures are kept. The sampler sees all threads and the memory
+    peak is process wide, so a capture also contains the work of concurrent requests (`concurrent`
+    in the capture). Tracing the allocations slows down the whole process, so profiling is meant to
+    be enabled while a problem is investigated.
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from fastapi.concurrency import run_in_threadpool
+
+# Stacks with one of these files on top wait for work and are not sampled
+IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py')
+MAX_BODY_BYTES = 64 * 1024
+TOP_ALLOCATIONS = 25
+
+_phases = contextvars.ContextVar('phases', default=None)
+
+
+def record_phase(name, start):
+    """
+    Adds the time since `start` to the phase `name` of the current request.
+
+    :param name: The name of the phase, e.g. `query`, `analytics` or `serialize`.
+    :type name: str
+    :param start: The start of the phase (`time.perf_counter()`).
+    :type start: float
+
+    **Example usage**::
+
+        start = time.perf_counter()
+        rows = cur.fetchall()
+        record_phase('query', start)
+    """
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def server_timing(phases, total):
+    """
+    Formats the durations of the phases and the total duration in seconds as `Server-Timing` header.
+
+    :rtype: str
+    """
+    metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in phases.items()]
+    metrics.append(f'app;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware, which adds the `Server-Timing` header and captures slow requests (see module
+    description).
+
+    :param app: The ASGI application.
+    :param enable: Whether requests are sampled and slow requests are captured.
+    :type enable: bool
+    :param slow_threshold: Requests, which take at least this number of milliseconds, are captured.
+    :type slow_threshold: float
+    :param directory: The directory of the captures.
+    :type directory: str
+    :param max_captures: The number of captures, which are kept.
+    :type max_captures: int
+    :param sample_interval: The interval of the stack samples in milliseconds.
+    :type sample_interval: float
+    :param trace_memory: Whether the memory allocations are traced.
+    :type trace_memory: bool
+
+    **Example usage**::
+
+        app.add_middleware(ProfilingMiddleware, enable=True, slow_threshold=1000, directory='../log/profiles')
+    """
+    def __init__(self, app, enable=False, slow_threshold=1000.0, directory='profiles', max_captures=20,
+                 sample_interval=5.0, trace_memory=True):
+        self.app = app
+        self.enable = enable
+        self.slow_threshold = slow_threshold / 1000
+        self.directory = directory
+        self.max_captures = max_captures
+        self.sample_interval = sample_interval / 1000
+        self.trace_memory = enable and trace_memory
+        self.running = 0
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        phases = {}
+        token = _phases.set(phases)
+        start = time.perf_counter()
+        status = 500
+        body = []
+
+        async def send_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', server_timing(phases, time.perf_counter() - start).encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        if not self.enable:
+            try:
+                await self.app(scope, receive, send_timing)
+            finally:
+                _phases.reset(token)
+            return
+
+        async def receive_body():
+            message = await receive()
+            if message['type'] == 'http.request' and sum(map(len, body)) < MAX_BODY_BYTES:
+                body.append(message.get('body', b''))
+            return message
+
+        self.running += 1
+        concurrent = self.running
+        sampler = _Sampler(self.sample_interval)
+        sampler.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        try:
+            await self.app(scope, receive_body, send_timing)
+        finally:
+            duration = time.perf_counter() - start
+            sampler.stop()
+            concurrent = max(concurrent, self.running)
+            self.running -= 1
+            _phases.reset(token)
+            if duration >= self.slow_threshold:
+                capture = {
+                    'time': datetime.now().isoformat(),
+                    'method': scope['method'],
+                    'path': scope['path'],
+                    'query': scope.get('query_string', b'').decode('latin-1'),
+                    'body': b''.join(body)[:MAX_BODY_BYTES].decode('utf-8', 'replace'),
+                    'status': status,
+                    'duration_ms': round(duration * 1000, 1),
+                    'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in phases.items()},
+                    'concurrent': concurrent,
+                    'samples': sampler.samples,
+                }
+                if self.trace_memory:
+                    capture['memory_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                    capture['allocations'] = [
+                        str(stat) for stat in tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]
+                    ]
+                await run_in_threadpool(self._write_capture, capture, sampler.stacks)
+
+    def _write_capture(self, capture, stacks):
+        os.makedirs(self.directory, exist_ok=True)
+        path = re.sub(r'[^A-Za-z0-9]+', '_', capture['path']).strip('_') or 'root'
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{capture['method']}-{path}"
+        with open(os.path.join(self.directory, name + '.json'), 'w') as f:
+            json.dump(capture, f, indent=4)
+        with open(os.path.join(self.directory, name + '.folded'), 'w') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+        captures = sorted(x[:-len('.json')] for x in os.listdir(self.directory) if x.endswith('.json'))
+        for old in captures[:-self.max_captures] if self.max_captures > 0 else []:
+            for suffix in ('.json', '.folded'):
+                try:
+                    os.remove(os.path.join(self.directory, old + suffix))
+                except FileNotFoundError:
+                    pass
@@ -2,7 +2,9 @@
 Module for handling SSH-style public key verification and loading authorized keys.
 
 This module provides functions to load authorized SSH public keys from a specified
-file and to verify signatures using RSA with PSS padding and SHA-256 hashing.
+file and to verify signatures using RSA with PSS padding and SHA-256 hashing or Ed25519.
+RSA and Ed25519 keys can be mixed in the same file, each measurement point is verified
+with the type of its own key.
 
 **Functions**:
     - :func:`load_authorized_keys`: Loads authorized SSH public keys from a file.
@@ -14,10 +16,14 @@ import os.path
 from cryptography.hazmat.primitives.serialization import load_ssh_public_key
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
 from cryptography.hazmat.primitives import hashes
 
 import json
 
+# Key types of the authorized keys file
+SUPPORTED_KEY_TYPES = ('ssh-rsa', 'ssh-ed25519')
+
 
 def load_authorized_keys(file_path):
     """
@@ -25,12 +31,13 @@ def load_authorized_keys(file_path):
 
     The function reads the given file, processes each line, and extracts the public keys.
     The public keys are stored in a dictionary, where the keys are the comments associated
-    with each key and the values are the actual RSA public key objects.
+    with each key and the values are the actual public key objects. Lines starting with
+    `ssh-rsa` and `ssh-ed25519` are supported.
 
     :param file_path: The path to the file containing the SSH public keys.
 
     :return: A dictionary where the keys are the comments (client IDs) and the values are
-             the RSA public keys corresponding to each client.
+             the RSA or Ed25519 public keys corresponding to each client.
 
     **Example usage**::
 
@@ -45,11 +52,15 @@ def load_authorized_keys(file_path):
                 if line.strip() and not line.startswith("#"):
                     parts = line.split()
                     if len(parts) >= 2:
+                        key_type = parts[0]
                         key_data = parts[1]
                         comment = parts[2] if len(parts) > 2 else None
+                        if key_type not in SUPPORTED_KEY_TYPES:
+                            print(f"Error loading key for {comment}: unsupported key type {key_type}")
+                            continue
                         try:
                             public_key = load_ssh_public_key(
-                                f"ssh-rsa {key_data}".encode(),
+                                f"{key_type} {key_data}".encode(),
                                 backend=default_backend()
                             )
                             authorized_keys[comment] = public_key
@@ -63,10 +74,11 @@ def verify_signature (public_key, data, signature):
     Verifies the signature of the given data using the provided public key.
 
     This function checks whether the provided signature matches the data when signed by
-    the corresponding private key. It uses RSA with PSS padding and SHA-256 hashing.
+    the corresponding private key. It uses Ed25519 for Ed25519 keys and RSA with PSS padding
+    and SHA-256 hashing for RSA keys.
 
     **Args**:
-        public_key (RSAPublicKey): The public key to verify the signature with.
+        public_key (RSAPublicKey or Ed25519PublicKey): The public key to verify the signature with.
         data (dict): The original data that was signed.
         signature (str): The base64 encoded signature to verify.
 
@@ -83,13 +95,17 @@ def verify_signature (public_key, data, signature):
         except ValueError:
             print("Invalid signature")
     """
+    message = json.dumps(data).encode("utf-8")
     try:
-        public_key.verify(
-            signature,
-            json.dumps(data).encode("utf-8"),
-            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
-            hashes.SHA256()
-        )
+        if isinstance(public_key, Ed25519PublicKey):
+            public_key.verify(signature, message)
+        else:
+            public_key.verify(
+                signature,
+                message,
+                padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+                hashes.SHA256()
+            )
         return True
     except Exception as e:
         raise ValueError("Invalid signature") from e
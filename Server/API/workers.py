@@ -0,0 +1,251 @@
+"""
+Module Name: Wassermonitor2 API worker processes
+
+Description:
+    This file lets several worker processes of the API serve the same database (`count` in the
+    `workers` section of the configuration), so the API can use more than one core. Each worker has
+    its own event loop, thread pool and in-memory state, so the workers share their state through
+    the files in `directory`:
+
+    - `SharedStore`: A small SQLite file with a journal of the inserted measurements and the metric
+      snapshots of the workers. Each worker applies the measurements, which the other workers
+      inserted, to its in-memory state (latest measurements, forecasts, health, live subscribers),
+      so each worker answers like a single process. `/metrics` adds up the snapshots of all workers.
+    - `ProcessLock`: A lock of the threads and processes. It is held by the SQLite write transactions
+      (see `database_utils.configure_sqlite`), so the workers queue for it instead of retrying
+      against the lock of SQLite until `database is locked`.
+    - `LockedFileHandler`: A log file handler, which locks the file while it writes a record, so the
+      records of the workers do not interleave.
+    - `try_lock`: Elects the worker, which runs the background tasks, which must only run once.
+
+    The locks use `fcntl.flock`. Without `fcntl` (e.g. on Windows) they only lock the threads of a
+    process, so only one worker can be used there.
+
+Author:
+    - Carl Philipp Koppen (admin@wassermonitor.de)
+
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Seconds the inserted measurements are kept in the journal of the SharedStore
+JOURNAL_RETENTION = 600
+
+
+class ProcessLock:
+    """
+    A reentrant lock of the threads of this process and of all processes, which lock the same file.
+
+    **Example usage**::
+
+        lock = ProcessLock('../run/sqlite-write.lock')
+        with lock:
+            conn.commit()
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+
+_held_lock = None
+
+
+def try_lock(path):
+    """
+    Takes the lock of `path` without waiting. The lock is held until the process ends, so the
+    first worker, which takes it, runs the tasks, which must only run once. If this worker ends,
+    another worker can take the lock.
+
+    :returns: Whether this process holds the lock.
+    :rtype: bool
+    """
+    global _held_lock
+    if _held_lock is not None:
+        return True
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+    _held_lock = fd
+    return True
+
+
+class LockedFileHandler(logging.FileHandler):
+    """
+    A `logging.FileHandler`, which locks the log file while it writes a record, so several processes
+    can write to the same log file.
+    """
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if fcntl is None:
+            return super().emit(record)
+        fcntl.flock(self.stream.fileno(), fcntl.LOCK_EX)
+        try:
+            super().emit(record)
+        finally:
+            fcntl.flock(self.stream.fileno(), fcntl.LOCK_UN)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedStore:
+    """
+    The state, which the worker processes share (see module description), in an SQLite file.
+
+    The journal position is taken when the store is opened, so the store has to be opened before
+    the in-memory state is loaded from the database. Measurements, which are inserted in between,
+    are then applied twice, which the in-memory states tolerate, instead of being lost.
+
+    :param path: The path of the SQLite file.
+    :type path: str
+    :param retention: The seconds the inserted measurements are kept in the journal.
+    :type retention: float
+
+    **Example usage**::
+
+        store = SharedStore('../run/shared.sqlite')
+        store.publish([(measurement, quality)])
+        for measurement, quality in store.fetch():  # in the other workers
+            latest.add_measurement(measurement, quality)
+    """
+    def __init__(self, path, retention=JOURNAL_RETENTION):
+        self.path = path
+        self.retention = retention
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._pruned = time.time()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS inserts (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                time REAL NOT NULL,
+                pid INTEGER NOT NULL,
+                measurement TEXT NOT NULL,
+                quality TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS metrics (
+                pid INTEGER PRIMARY KEY,
+                parent INTEGER NOT NULL,
+                time REAL NOT NULL,
+                snapshot TEXT NOT NULL
+            );
+        """)
+        # The snapshots of a former start of the API are outdated
+        self._conn.execute("DELETE FROM metrics WHERE parent != ?", [os.getppid()])
+        self._seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM inserts").fetchone()[0]
+
+    def publish(self, inserted):
+        """
+        Adds inserted measurements to the journal for the other workers.
+
+        :param inserted: The inserted measurements with their quality as list of `(measurement, quality)`
+            (see `analytics.robust_estimate`).
+        :type inserted: list
+        """
+        now = time.time()
+        rows = [(now, self.pid, json.dumps(m), json.dumps(q)) for m, q in inserted]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO inserts(time, pid, measurement, quality) VALUES (?, ?, ?, ?)", rows
+                )
+                if now - self._pruned > 60:
+                    self._conn.execute("DELETE FROM inserts WHERE time < ?", [now - self.retention])
+                    self._pruned = now
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def fetch(self):
+        """
+        Returns the measurements, which the other workers inserted since the last call.
+
+        An unchanged journal costs one `PRAGMA data_version`, so the workers can call it before each read
+        of their in-memory state.
+
+        :returns: The inserted measurements as list of `(measurement, quality)`.
+        :rtype: list
+        """
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return []
+            self._data_version = version
+            rows = self._conn.execute(
+                "SELECT seq, pid, measurement, quality FROM inserts WHERE seq > ? ORDER BY seq", [self._seq]
+            ).fetchall()
+            if rows:
+                self._seq = rows[-1][0]
+        return [(json.loads(m), json.loads(q)) for _, pid, m, q in rows if pid != self.pid]
+
+    def store_metrics(self, snapshot):
+        """
+        Stores the metric snapshot of this worker (see `metrics.snapshot`).
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metrics(pid, parent, time, snapshot) VALUES (?, ?, ?, ?)",
+                [self.pid, os.getppid(), time.time(), json.dumps(snapshot)]
+            )
+
+    def load_metrics(self):
+        """
+        Returns the metric snapshots of the other workers (see `metrics.render`). The counters and histograms
+        of ended workers are kept, so the sums do not decrease, their gauges are dropped.
+
+        :rtype: list
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT pid, snapshot FROM metrics WHERE pid != ?", [self.pid]).fetchall()
+        snapshots = []
+        for pid, snapshot in rows:
+            snapshot = json.loads(snapshot)
+            if not _alive(pid):
+                snapshot = {name: m for name, m in snapshot.items() if m['type'] != 'gauge'}
+            snapshots.append(snapshot)
+        return snapshots
@@ -4,7 +4,7 @@ import {formatDateForISO} from './utils';
 /**
  * Fetches the list of available measurement points from the API.
  *
- * This asynchronous function sends a POST request to the API to retrieve
+ * This asynchronous function sends a GET request to the API to retrieve
  * a list of available measurement points. The response data is parsed and returned.
  *
  * @async
@@ -16,17 +16,11 @@ import {formatDateForISO} from './utils';
  */
 export async function getAvailableMeasPointsFromApi(apiUrl) {
     try {
-        const response = await fetch(apiUrl.concat('get_available_meas_points/'), {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-        });
+        const response = await fetch(apiUrl.concat('v2/get_available_meas_points'));
         if (!response.ok) {
             throw new Error("Invalid Network response!");
         }
-        var mPs = await response.json();
-        mPs = JSON.parse(mPs);
+        const mPs = await response.json();
         //console.log('Available Meas Points fetched:', JSON.stringify(mPs,null,2));
         const output = Object.entries(mPs).map(([key, values]) => {
             return {'value':key, 'label':`${key} ${values.join(" ")}`};
@@ -40,7 +34,7 @@ export async function getAvailableMeasPointsFromApi(apiUrl) {
 /**
  * Fetches time-series data from the API within a specified date range.
  *
- * This asynchronous function sends a POST request to the API to retrieve
+ * This asynchronous function sends a GET request to the API to retrieve
  * time-series data for a specific measurement point within a defined time range.
  * The date range is passed as parameters, and the response data is processed and returned.
  *
@@ -57,23 +51,17 @@ export async function getAvailableMeasPointsFromApi(apiUrl) {
 
 export async function loadTimeDataFromAPI(apiUrl, dtFrom, dtUntil, mpName) {
     try {
-        const response = await fetch(apiUrl.concat('get/'), {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify (
-                {
-                    'dt_begin': formatDateForISO(dtFrom),
-                    'dt_end': formatDateForISO(dtUntil),
-                }
-            ),
+        const params = new URLSearchParams({
+            'dt_begin': formatDateForISO(dtFrom),
+            'dt_end': formatDateForISO(dtUntil),
+            'meas_point': mpName,
+            'max_points': 2000,
         });
+        const response = await fetch(apiUrl.concat('v2/get/?', params.toString()));
         if (!response.ok) {
             throw new Error("Invalid Network response!");
         }
-        var data_t = await response.json();
-        data_t = JSON.parse(data_t);
+        const data_t = await response.json();
         //console.log('Data fetched:', JSON.stringify(data_f,null,2));
         const data_time = data_t[mpName];
 
@@ -87,7 +75,7 @@ export async function loadTimeDataFromAPI(apiUrl, dtFrom, dtUntil, mpName) {
 /**
  * Fetches the latest fill data from the API.
  *
- * This asynchronous function sends a POST request to the API to retrieve
+ * This asynchronous function sends a GET request to the API to retrieve
  * the latest fill data. It also initializes dropdown options for measurement
  * point selection based on the response.
  *
@@ -100,17 +88,11 @@ export async function loadTimeDataFromAPI(apiUrl, dtFrom, dtUntil, mpName) {
  */
 export async function loadFillDataFromAPI (apiUrl, mpName) {
         try {
-            const response = await fetch(apiUrl.concat('get_latest/'), {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                }
-            });
+            const response = await fetch(apiUrl.concat('v2/get_latest/'));
             if (!response.ok) {
                 throw new Error("Invalid Network response!");
             }
-            var data_f = await response.json();
-            data_f = JSON.parse(data_f);
+            const data_f = await response.json();
             //console.log('Data fetched:', JSON.stringify(data_f,null,2));
             const mpNameOptions = Object.keys(data_f);
             const mPN = mpName || mpNameOptions[0];
@@ -120,4 +102,26 @@ export async function loadFillDataFromAPI (apiUrl, mpName) {
             console.error('Error while fetching data from API:',error);
         }
 
-    }
\ No newline at end of file
+    }
+
+/**
+ * Subscribes to the live measurements of the API.
+ *
+ * The API pushes each inserted measurement as Server-Sent Event. If the dashboard
+ * could not keep up, the API sends a resync event instead of the dropped measurements.
+ * In both cases the callback is called, so the caller can reload the fill data.
+ * EventSource reconnects on its own after connection errors.
+ *
+ * @function subscribeLiveData
+ * @param {string} apiUrl - The base URL of the API.
+ * @param {string} mpName - Name of the measurement point to receive the measurements of.
+ * @param {function} onUpdate - Called with the event of each measurement or resync.
+ * @returns {EventSource} - The event source, which has to be closed to unsubscribe.
+ */
+export function subscribeLiveData(apiUrl, mpName, onUpdate) {
+    const params = new URLSearchParams({'meas_point': mpName});
+    const source = new EventSource(apiUrl.concat('v2/live/?', params.toString()));
+    source.addEventListener('measurement', (event) => onUpdate(JSON.parse(event.data)));
+    source.addEventListener('resync', (event) => onUpdate(JSON.parse(event.data)));
+    return source;
+}
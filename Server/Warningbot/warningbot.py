@@ -75,7 +75,7 @@ import smtplib
 from http.client import HTTPException
 from time import sleep
 
-from requests import post
+from requests import get, post
 import logging
 import pytz
 from urllib3 import HTTPConnectionPool
@@ -211,7 +211,7 @@ def get_last_data_from_api():
     """
     Retrieves the latest data from the API.
 
-    Sends a POST request to the configured API endpoint with an authorization token.
+    Sends a GET request to the configured API endpoint with an authorization token.
     If the request is successful (HTTP status 200), the response is parsed and returned
     as a Python dictionary. Otherwise, an empty dictionary is returned.
 
@@ -233,10 +233,10 @@ def get_last_data_from_api():
         "Authorization": f"Bearer {config['API']['token']}"
     }
     try:
-        r = post(f"http://{config['API']['host']}:{config['API']['port']}/get_latest/", headers=headers)
+        r = get(f"http://{config['API']['host']}:{config['API']['port']}/v2/get_latest/", headers=headers)
         if r.status_code == 200:
             logger.info("Received data from API")
-            return json.loads(r.json())
+            return r.json()
         else:
             logger.warning(f"Didn't receive data from API. Status code was: {r.status_code}")
             return {}
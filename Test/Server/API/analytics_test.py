@@ -0,0 +1,220 @@
+import unittest
+from datetime import datetime, timedelta
+import os, sys
+import numpy as np
+import pandas as pd
+import pytz
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import analytics
+
+
+class TestRobustEstimate(unittest.TestCase):
+    def test_zero_is_rejected(self):
+        result = analytics.robust_estimate([31.3, 31.4, 0.0, 31.3, 31.4])
+        self.assertAlmostEqual(result['value'], 31.35)
+        self.assertEqual((result['rejected'], result['quality']), (1, analytics.QUALITY_SUSPECT))
+
+    def test_outlier_is_rejected(self):
+        result = analytics.robust_estimate([31.3, 31.4, 31.3, 31.4, 31.3, 60.0])
+        self.assertAlmostEqual(result['value'], 31.34)
+        self.assertEqual(result['rejected'], 1)
+
+    def test_clean_and_unusable_measurements(self):
+        result = analytics.robust_estimate_many([[31.3, 31.4, 31.3], [0.0, 0.0, 0.0], []])
+        np.testing.assert_array_equal(
+            result['quality'], [analytics.QUALITY_GOOD, analytics.QUALITY_BAD, analytics.QUALITY_BAD]
+        )
+        self.assertIsNone(analytics.robust_estimate([0.0, 0.0])['value'])
+
+
+class TestComputeDerivationMetrics(unittest.TestCase):
+    def test_short_series_is_not_smoothed(self):
+        hours = np.arange(10) / 60.0
+        metrics = analytics.compute_derivation_metrics(hours, np.linspace(30, 31, 10))
+        np.testing.assert_allclose(metrics['derivation'], -60.0 / 9.0)
+        np.testing.assert_array_equal(metrics['derivation_10'], 0.0)
+
+    def test_single_value(self):
+        metrics = analytics.compute_derivation_metrics(np.array([1.0]), np.array([30.0]))
+        np.testing.assert_array_equal(metrics['derivation'], 0.0)
+        self.assertTrue(np.isnan(metrics['peaks_pos']).all())
+
+
+class TestProcessPool(unittest.TestCase):
+    def tearDown(self):
+        analytics.stop_pool()
+
+    def test_pool_matches_in_process_calculation(self):
+        rng = np.random.default_rng(1)
+        series = [(np.arange(n) / 60.0, np.cumsum(rng.normal(size=n))) for n in (150, 90, 400)]
+        expected = analytics.compute_derivation_metrics_many(series)
+        analytics.start_pool(2, 0)
+        results = analytics.compute_derivation_metrics_many(series)
+        for e, r in zip(expected, results):
+            for k in analytics.DERIVATION_METRICS_KEYS:
+                np.testing.assert_array_equal(e[k], r[k])
+
+
+class TestResampleSeries(unittest.TestCase):
+    def test_grid_with_gap(self):
+        dt_start = datetime(2024, 12, 1, tzinfo=pytz.utc)
+        # 2 hours of irregular samples with a 30 minute outage
+        minutes = [m + (0.4 if m % 3 else 0) for m in range(120) if not 40 <= m < 70]
+        series = pd.DataFrame({
+            'mid': range(len(minutes)),
+            'dt': [(dt_start + timedelta(minutes=m)).isoformat() for m in minutes],
+            'mpName': 'raspi1',
+            'sensorId': 'left_tank',
+            'max_val': 135.0,
+            'warn': 90.0,
+            'alarm': 70.0,
+            'meas_val': [30.0 + 0.1 * m for m in minutes],
+            'tank_height': 155.0,
+        })
+        grid = analytics.resample_series(series, 5, dt_start, dt_start + timedelta(hours=3))
+        self.assertEqual(len(grid), 37)
+        self.assertEqual(grid['dt'].iloc[1], '2024-12-01 00:05:00+00:00')
+        self.assertEqual(list(np.flatnonzero(grid['gap'].to_numpy())), list(range(8, 14)) + list(range(24, 37)))
+        self.assertTrue((grid['tank_height'] == 155.0).all())
+        np.testing.assert_allclose(grid['derivation'].iloc[:8], -6.0, rtol=0.02)
+        self.assertTrue(np.isnan(grid['derivation'].iloc[10]))
+
+
+class TestDownsampling(unittest.TestCase):
+    def test_lttb_keeps_spike_and_ends(self):
+        x = np.arange(1000, dtype=float)
+        y = np.sin(x / 50)
+        y[500] = 10.0
+        idx = analytics.lttb_indices(x, y, 50)
+        self.assertEqual(len(idx), 50)
+        self.assertEqual((idx[0], idx[-1]), (0, 999))
+        self.assertIn(500, idx)
+        self.assertTrue((np.diff(idx) > 0).all())
+
+    def test_downsample_series_keeps_peaks_and_gaps(self):
+        n = 3000
+        series = pd.DataFrame({
+            'dt': [(datetime(2024, 12, 1, tzinfo=pytz.utc) + timedelta(minutes=i)).isoformat() for i in range(n)],
+            'meas_val': 30.0 + 0.01 * np.arange(n),
+            'derivation_10': np.zeros(n),
+            'peaks_pos': np.nan,
+            'peaks_neg': np.nan,
+        })
+        series.loc[1234, 'peaks_pos'] = 20.0
+        series.loc[2000:2100, 'meas_val'] = np.nan
+        small = analytics.downsample_series(series, 200)
+        self.assertLessEqual(len(small), 200)
+        self.assertIn(series['dt'][1234], list(small['dt']))
+        self.assertIn(series['dt'][2000], list(small['dt']))
+        self.assertIs(analytics.downsample_series(series, 5000), series)
+
+    def downsample_input(self, n):
+        return pd.DataFrame({
+            'dt': [(datetime(2024, 12, 1, tzinfo=pytz.utc) + timedelta(minutes=i)).isoformat() for i in range(n)],
+            'meas_val': 30.0 + 0.01 * np.arange(n),
+            'derivation_10': np.sin(np.arange(n) / 100),
+            'peaks_pos': np.nan,
+            'peaks_neg': np.nan,
+        })
+
+    def test_downsample_series_budget_with_gaps(self):
+        series = self.downsample_input(100000)
+        series.loc[1::2, 'meas_val'] = np.nan
+        series.loc[50001:51000, 'meas_val'] = np.nan
+        small = analytics.downsample_series(series, 2000)
+        self.assertLessEqual(len(small), 2000)
+        # The longest gap is marked first
+        self.assertIn(series['dt'][50001], list(small['dt']))
+
+    def test_downsample_series_budget_with_peaks(self):
+        series = self.downsample_input(100000)
+        series.loc[::20, 'peaks_pos'] = 1.0
+        series.loc[::20, 'peaks_neg'] = -2.0
+        series.loc[77777, 'peaks_neg'] = -50.0
+        small = analytics.downsample_series(series, 2000)
+        self.assertLessEqual(len(small), 2000)
+        # The most prominent peak is kept
+        self.assertIn(series['dt'][77777], list(small['dt']))
+        self.assertLessEqual(len(analytics.downsample_series(series, 5)), 5)
+
+
+class TestDetectEvents(unittest.TestCase):
+    def test_refill_and_consumption(self):
+        hours = np.arange(12, dtype=float)
+        level = np.array([100, 98, 96, 94, 92, 92, 110, 130, 150, 150, 150, 150], dtype=float)
+        rate = np.gradient(level, hours)
+        events = analytics.detect_events(hours, level, rate)
+        self.assertEqual([e['event_type'] for e in events], ['consumption', 'refill'])
+        self.assertEqual(events[0]['rate'], -1.6)
+        self.assertEqual((events[1]['begin'], events[1]['end']), (5, 9))
+        self.assertEqual(events[1]['volume'], 58.0)
+
+    def test_short_runs_are_ignored(self):
+        hours = np.arange(5, dtype=float)
+        rate = np.array([0, 20, 20, 0, 0], dtype=float)
+        self.assertEqual(analytics.detect_events(hours, np.zeros(5), rate), [])
+
+
+class TestForecastCrossings(unittest.TestCase):
+    def test_theil_sen_ignores_outliers(self):
+        slope, intercept = analytics.theil_sen(np.array([0., 1., 2., 3.]), np.array([10., 9., 100., 7.]))
+        self.assertEqual((slope, intercept), (-1.0, 10.0))
+
+    def test_forecast_crossings(self):
+        hours = np.arange(0, 6, 1 / 60)
+        level = 100 - 2.5 * hours
+        level[50] = 0.0
+        result = analytics.forecast_crossings(hours, level, {'warn': 90, 'alarm': 70, 'empty': 0})
+        self.assertEqual(result['rate'], -2.5)
+        self.assertEqual(result['warn'], 0.0)
+        self.assertAlmostEqual(result['alarm'], 6.0, places=1)
+        self.assertAlmostEqual(result['empty'], 34.0, places=1)
+
+    def test_forecast_starts_after_refill(self):
+        hours = np.arange(0, 3, 1 / 60)
+        level = np.where(hours < 1, 50 - 5 * hours, 120 - 1 * hours)
+        result = analytics.forecast_crossings(hours, level, {'empty': 0})
+        self.assertEqual(result['rate'], -1.0)
+
+    def test_no_forecast_while_refilling(self):
+        hours = np.arange(0, 2, 1 / 60)
+        self.assertIsNone(analytics.forecast_crossings(hours, 50 + hours, {'empty': 0}))
+
+    def test_constant_level_has_no_crossing(self):
+        hours = np.arange(0, 2, 1 / 60)
+        result = analytics.forecast_crossings(hours, np.full(len(hours), 80.0), {'warn': 90, 'alarm': 70})
+        self.assertEqual(result['warn'], 0.0)
+        self.assertIsNone(result['alarm'])
+
+
+class TestNightBaselines(unittest.TestCase):
+    def test_night_baselines(self):
+        # 3 days of hourly levels of 2 sensors (UTC), the second one leaks 0.5 cm/h
+        hours = np.arange(72) + int(analytics.to_hour(datetime(2024, 12, 1, tzinfo=pytz.utc)))
+        levels = np.vstack([np.full(72, 100.0), 100.0 - 0.5 * np.arange(72)])
+        levels[0, 26] = 80.0
+        nights, baseline, count = analytics.night_baselines(hours, levels, 'UTC', 1, 5)
+        self.assertEqual([str(n) for n in nights], ['2024-12-01', '2024-12-02', '2024-12-03'])
+        np.testing.assert_array_equal(count, 3)
+        np.testing.assert_array_equal(baseline[0], 0.0)
+        np.testing.assert_array_equal(baseline[1], 0.5)
+
+    def test_nights_over_midnight(self):
+        hours = np.arange(48) + int(analytics.to_hour(datetime(2024, 12, 1, tzinfo=pytz.utc)))
+        nights, baseline, count = analytics.night_baselines(hours, np.zeros((1, 48)), 'Europe/Berlin', 22, 4)
+        self.assertEqual([str(n) for n in nights], ['2024-12-01', '2024-12-02', '2024-12-03'])
+        self.assertEqual(list(count[0]), [2, 5, 2])
+
+    def test_detect_leaks(self):
+        baseline = np.array([[0.3, np.nan, 0.3, 0.4, 0.5, 0.1], [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]])
+        np.testing.assert_array_equal(
+            analytics.detect_leaks(baseline, 0.2, 3),
+            [[False, False, False, False, True, False], [False] * 6]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# Concurrency benchmark of the API: latency of /get_latest/ while heavy /get/ requests
+# and requests with a bad token run at the same time
+#
+# Start the API first, then run: python benchmark_concurrency.py [api_url] [dt_begin] [dt_end]
+
+import asyncio
+import sys
+import time
+
+import httpx
+import numpy as np
+
+api_url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8012"
+dt_begin = sys.argv[2] if len(sys.argv) > 2 else "2024-01-01T00:00:00"
+dt_end = sys.argv[3] if len(sys.argv) > 3 else "2024-03-01T00:00:00"
+
+DURATION = 20
+HEAVY_CLIENTS = 4
+BAD_TOKEN_CLIENTS = 20
+LATEST_INTERVAL = 0.05
+
+
+async def heavy_get(client, stop, counter):
+    while not stop.is_set():
+        r = await client.post(f"{api_url}/v2/get/", json={'dt_begin': dt_begin, 'dt_end': dt_end}, timeout=None)
+        counter['get'] += r.status_code == 200
+
+
+async def bad_token(client, stop, counter):
+    while not stop.is_set():
+        r = await client.post(f"{api_url}/insert/", json='{}', headers={'Authorization': 'Bearer wrong'}, timeout=None)
+        counter['bad_token'] += r.status_code == 401
+
+
+async def latest(client, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        r = await client.post(f"{api_url}/v2/get_latest/", timeout=None)
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(LATEST_INTERVAL)
+
+
+async def run(heavy_clients, bad_token_clients):
+    stop = asyncio.Event()
+    latencies = []
+    counter = {'get': 0, 'bad_token': 0}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits) as client:
+        tasks = [asyncio.create_task(latest(client, stop, latencies))]
+        tasks += [asyncio.create_task(heavy_get(client, stop, counter)) for _ in range(heavy_clients)]
+        tasks += [asyncio.create_task(bad_token(client, stop, counter)) for _ in range(bad_token_clients)]
+        await asyncio.sleep(DURATION)
+        stop.set()
+        await asyncio.gather(*tasks)
+    ms = np.array(latencies) * 1000
+    print(f"{heavy_clients} /get/ clients, {bad_token_clients} bad token clients: "
+          f"{len(ms)} /get_latest/ requests, p50 {np.percentile(ms, 50):.0f} ms, p99 {np.percentile(ms, 99):.0f} ms, "
+          f"max {ms.max():.0f} ms ({counter['get']} /get/, {counter['bad_token']} bad token requests done)")
+
+
+if __name__ == '__main__':
+    asyncio.run(run(0, 0))
+    asyncio.run(run(HEAVY_CLIENTS, BAD_TOKEN_CLIENTS))
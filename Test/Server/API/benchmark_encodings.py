@@ -0,0 +1,89 @@
+# Benchmark of the response encodings of /get/ (JSON against the binary formats)
+#
+# Usage: python benchmark_encodings.py [rows] [sensors]
+
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+import orjson
+import pandas as pd
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import binary_formats
+
+
+def synthetic_meas_data(rows, sensors):
+    """Measurement data like `database_utils.get_meas_data_from_sqlite_db` returns it."""
+    rng = np.random.default_rng(0)
+    per_sensor = rows // sensors
+    dt = pd.date_range('2024-01-01', periods=per_sensor, freq='min', tz='UTC')
+    parts = []
+    for s in range(sensors):
+        value = 30 + np.cumsum(rng.normal(0.01, 0.05, per_sensor))
+        derivation = np.gradient(value)
+        parts.append(pd.DataFrame({
+            'mpName': f'raspi{s // 2}',
+            'sensorId': f'tank{s % 2}',
+            'dt': dt.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+            'value': value.round(2),
+            'tank_height': 155.0, 'max_val': 135.0, 'warn': 90.0, 'alarm': 70.0,
+            'derivation': derivation, 'derivation_10': derivation,
+            'peaks_pos': np.where(rng.random(per_sensor) < 0.001, derivation, np.nan),
+            'peaks_neg': np.nan,
+        }))
+    return pd.concat(parts, ignore_index=True)
+
+
+def json_rows(data):
+    """Row format of `main.request_measurement_data`."""
+    output = {}
+    for (mp, sensor), d in data.groupby(['mpName', 'sensorId'], sort=False):
+        values = d[['dt', 'value']].rename(columns={'dt': 'timestamp'}).to_dict('records')
+        deriv = d[['dt', 'derivation', 'derivation_10', 'peaks_pos', 'peaks_neg']].astype(object)
+        deriv = deriv.where(deriv.notna(), None).to_dict('records')
+        output.setdefault(mp, []).append({'sensor': sensor, 'values': values, 'deriv': deriv})
+    return output
+
+
+def json_columns(data):
+    """Columnar format of `main.request_measurement_data`."""
+    output = {}
+    for (mp, sensor), d in data.groupby(['mpName', 'sensorId'], sort=False):
+        columns = {k: d[k].astype(object).where(d[k].notna(), None).tolist()
+                   for k in ('dt', 'value', 'derivation', 'derivation_10', 'peaks_pos', 'peaks_neg')}
+        output.setdefault(mp, []).append({'sensor': sensor, 'columns': columns})
+    return output
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    sensors = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    data = synthetic_meas_data(rows, sensors)
+    encoders = {
+        'json rows (legacy)': lambda: json.dumps(json.dumps(json_rows(data), indent=4)).encode(),
+        'json rows (orjson)': lambda: orjson.dumps(json_rows(data)),
+        'json columns (orjson)': lambda: orjson.dumps(json_columns(data)),
+    }
+    for media_type in binary_formats.ENCODERS:
+        encoders[media_type] = lambda media_type=media_type: binary_formats.encode(media_type, data)
+
+    print(f'{len(data)} rows, {sensors} sensors')
+    print(f'{"format":40} {"ms":>10} {"kB":>10}')
+    for name, encoder in encoders.items():
+        try:
+            size = len(encoder())
+        except ImportError as e:
+            print(f'{name:40} skipped ({e})')
+            continue
+        number = 3
+        seconds = min(timeit.repeat(encoder, number=number, repeat=3)) / number
+        print(f'{name:40} {seconds * 1000:10.1f} {size / 1000:10.0f}')
+
+
+if __name__ == '__main__':
+    main()
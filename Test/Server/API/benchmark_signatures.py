@@ -0,0 +1,72 @@
+# Benchmark of the signature types of the measurement points: RSA-PSS (2048 bit) against Ed25519
+#
+# Usage: python benchmark_signatures.py
+
+import base64
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Pi')))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
+
+import psk_auth
+import psk_sign
+
+PRIVATE_KEYS = {
+    'rsa': lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    'ed25519': ed25519.Ed25519PrivateKey.generate,
+}
+
+measurement = {
+    'datetime': '2024-12-15T10:00:00+00:00',
+    'meas_point': 'raspi1',
+    'sensor_name': 'left_tank',
+    'tank_height': 155,
+    'max_val': 135,
+    'warn': 90,
+    'alarm': 70,
+    'values': [31.3, 31.4, 31.3, 31.4, 31.3],
+}
+
+
+def main():
+    print(f'{"key type":10} {"load key ms":>12} {"sign/s":>10} {"verify/s":>10} {"signature bytes":>16}')
+    for key_type, generate in PRIVATE_KEYS.items():
+        with tempfile.TemporaryDirectory() as psk_path:
+            # Keys like Pi/generate_key_pair.py writes them
+            with open(f'{psk_path}/private_key.pem', 'wb') as f:
+                f.write(generate().private_bytes(
+                    encoding=serialization.Encoding.PEM, format=serialization.PrivateFormat.PKCS8,
+                    encryption_algorithm=serialization.NoEncryption()
+                ))
+            load = min(timeit.repeat(
+                lambda: psk_sign.get_priv_key_from_file.__wrapped__(f'{psk_path}/private_key.pem'), number=5, repeat=3
+            )) / 5
+            private_key = psk_sign.get_priv_key_from_file(f'{psk_path}/private_key.pem')
+            ssh_key = private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.OpenSSH, format=serialization.PublicFormat.OpenSSH
+            ).decode()
+            with open(f'{psk_path}/authorized_keys', 'w') as f:
+                f.write(f'{ssh_key} raspi1\n')
+            public_key = psk_auth.load_authorized_keys(f'{psk_path}/authorized_keys')['raspi1']
+
+            payload = psk_sign.sign_meas_data(f'{psk_path}/private_key.pem', measurement)
+            signature = base64.b64decode(payload['signature'])
+            message = json.dumps(measurement).encode('utf-8')
+
+            number = 200
+            sign = min(timeit.repeat(lambda: psk_sign.sign_message(private_key, message), number=number, repeat=3))
+            verify = min(timeit.repeat(
+                lambda: psk_auth.verify_signature(public_key, measurement, signature), number=number, repeat=3
+            ))
+            print(f'{key_type:10} {load * 1000:12.2f} {number / sign:10.0f} {number / verify:10.0f} {len(signature):16}')
+
+
+if __name__ == '__main__':
+    main()
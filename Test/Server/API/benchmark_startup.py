@@ -0,0 +1,73 @@
+# Startup benchmark of the API: import time of the modules, time from the start of the process to the
+# first /get_latest/ response, and duration of the first /get/ request GET_DELAY seconds after it (which
+# imports the analytics stack, unless prewarm is set in the API section of the configuration or a background task
+# imported it already)
+#
+# The API runs with the configuration as it is, the defaults keep the derived metrics and the leak detection on.
+#
+# Stop the API first, the benchmark starts it itself on the port of the configuration, then run:
+#     python benchmark_startup.py [api_url] [dt_begin] [dt_end]
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+api_url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8012"
+dt_begin = sys.argv[2] if len(sys.argv) > 2 else "2024-01-01T00:00:00"
+dt_end = sys.argv[3] if len(sys.argv) > 3 else "2024-01-02T00:00:00"
+
+api_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+
+RUNS = 5
+TIMEOUT = 60
+# Seconds between the first /get_latest/ and the first /get/, so the pre-warming can finish (see startup_delay)
+GET_DELAY = 5
+
+
+def import_time(module):
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=api_path, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def first_responses():
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, 'main.py'], cwd=api_path,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client() as client:
+            while True:
+                if time.perf_counter() - start > TIMEOUT:
+                    raise TimeoutError("the API did not answer /get_latest/")
+                try:
+                    if client.get(f"{api_url}/v2/get_latest/").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.02)
+            latest = time.perf_counter() - start
+            time.sleep(GET_DELAY)
+            get_start = time.perf_counter()
+            client.get(f"{api_url}/v2/get/", params={'dt_begin': dt_begin, 'dt_end': dt_end},
+                       headers={'Accept-Encoding': 'identity'}, timeout=None).raise_for_status()
+            get = time.perf_counter() - get_start
+    finally:
+        server.terminate()
+        server.wait()
+    return latest, get
+
+
+def report(name, seconds):
+    print(f"{name}: median {statistics.median(seconds) * 1000:.0f} ms, "
+          f"min {min(seconds) * 1000:.0f} ms, max {max(seconds) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    for module in ('database_utils', 'analytics', 'main'):
+        report(f"import {module}", [import_time(module) for _ in range(RUNS)])
+    runs = [first_responses() for _ in range(RUNS)]
+    report("start to first /get_latest/", [r[0] for r in runs])
+    report("first /get/ after it", [r[1] for r in runs])
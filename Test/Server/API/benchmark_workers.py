@@ -0,0 +1,55 @@
+# Throughput benchmark of the worker processes of the API: requests per second of concurrent
+# clients on /get/ (analytics and serialization, CPU bound) and /get_latest/ (in-memory state)
+#
+# Start the API with count = 1 in the workers section of the configuration and run:
+#     python benchmark_workers.py [api_url] [dt_begin] [dt_end]
+# then restart it with count = N (e.g. the number of cores) and run the benchmark again.
+
+import asyncio
+import sys
+import time
+
+import httpx
+import numpy as np
+
+api_url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8012"
+dt_begin = sys.argv[2] if len(sys.argv) > 2 else "2024-01-01T00:00:00"
+dt_end = sys.argv[3] if len(sys.argv) > 3 else "2024-01-02T00:00:00"
+
+DURATION = 10
+CLIENTS = (1, 4, 16)
+
+
+async def client_loop(client, stop, path, params, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        r = await client.get(f"{api_url}{path}", params=params, timeout=None)
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(path, params, clients):
+    stop = asyncio.Event()
+    latencies = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits) as client:
+        tasks = [asyncio.create_task(client_loop(client, stop, path, params, latencies)) for _ in range(clients)]
+        start = time.perf_counter()
+        await asyncio.sleep(DURATION)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    print(f"{path} with {clients} clients: {len(ms) / elapsed:.1f} requests/s, "
+          f"p50 {np.percentile(ms, 50):.0f} ms, p99 {np.percentile(ms, 99):.0f} ms")
+
+
+async def main():
+    for clients in CLIENTS:
+        await run('/v2/get/', {'dt_begin': dt_begin, 'dt_end': dt_end}, clients)
+    for clients in CLIENTS:
+        await run('/v2/get_latest/', None, clients)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+import unittest
+import json
+import os, sys
+import numpy as np
+import pandas as pd
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import binary_formats
+
+
+class TestBinaryFormats(unittest.TestCase):
+    def setUp(self):
+        self.data = pd.DataFrame({
+            'mpName': ['raspi2', 'raspi1', 'raspi1', 'raspi2'],
+            'sensorId': ['tank', 'right', 'left', 'tank'],
+            'dt': ['2024-12-01T10:00:00+00:00', '2024-12-01T10:00:00+00:00',
+                   '2024-12-01T10:00:00+00:00', '2024-12-01T10:01:00+00:00'],
+            **{k: [1.5, 2.5, np.nan, 3.5] for k in binary_formats.FLOAT_COLUMNS},
+        })
+
+    def test_negotiate(self):
+        self.assertIsNone(binary_formats.negotiate(None))
+        self.assertIsNone(binary_formats.negotiate('application/json, application/msgpack'))
+        self.assertIsNone(binary_formats.negotiate('*/*'))
+        self.assertEqual(binary_formats.negotiate('application/x-msgpack'), binary_formats.MSGPACK)
+        self.assertEqual(
+            binary_formats.negotiate('application/msgpack;q=0, application/octet-stream, */*'), binary_formats.RAW
+        )
+
+    def test_columns_are_sorted_by_sensor(self):
+        sensors, columns = binary_formats.columns_from_meas_data(self.data)
+        self.assertEqual([(s['meas_point'], s['sensor'], s['offset'], s['count']) for s in sensors],
+                         [('raspi1', 'left', 0, 1), ('raspi1', 'right', 1, 1), ('raspi2', 'tank', 2, 2)])
+        np.testing.assert_array_equal(columns['value'], [np.nan, 2.5, 1.5, 3.5])
+        self.assertEqual(columns['dt'][3] - columns['dt'][2], 60000)
+
+    def test_raw_round_trip(self):
+        content = binary_formats.encode(binary_formats.RAW, self.data)
+        length = int.from_bytes(content[:4], 'little')
+        self.assertEqual((4 + length) % 8, 0)
+        header = json.loads(content[4:4 + length])
+        body = content[4 + length:]
+        self.assertEqual(header['rows'], 4)
+        for c in header['columns']:
+            self.assertEqual(c['offset'] % 8, 0)
+            array = np.frombuffer(body, dtype=c['dtype'], count=c['count'], offset=c['offset'])
+            if c['name'] == 'value':
+                np.testing.assert_array_equal(array, [np.nan, 2.5, 1.5, 3.5])
+
+    def test_msgpack_round_trip(self):
+        try:
+            import msgpack
+        except ImportError:
+            self.skipTest('msgpack is not installed')
+        decoded = msgpack.unpackb(binary_formats.encode(binary_formats.MSGPACK, self.data))
+        column = decoded['columns']['peaks_neg']
+        np.testing.assert_array_equal(np.frombuffer(column['data'], column['dtype']), [np.nan, 2.5, 1.5, 3.5])
+        self.assertEqual(decoded['sensors'][2]['count'], 2)
+
+    def test_arrow_round_trip(self):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        table = pa.ipc.open_stream(binary_formats.encode(binary_formats.ARROW_STREAM, self.data)).read_all()
+        self.assertEqual(table.column('sensor').to_pylist(), ['left', 'right', 'tank', 'tank'])
+        self.assertEqual(table.column('meas_point').to_pylist(), ['raspi1', 'raspi1', 'raspi2', 'raspi2'])
+        self.assertEqual(str(table.column('dt')[3]), '2024-12-01 10:01:00+00:00')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import asyncio
+import gzip
+import os, sys
+import zlib
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import compression
+
+
+class TestCompression(unittest.TestCase):
+    def run_app(self, chunks, accept_encoding, minimum_size=100):
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-length', str(sum(map(len, chunks))).encode())]})
+            for i, chunk in enumerate(chunks):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': i < len(chunks) - 1})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = compression.CompressionMiddleware(app, minimum_size=minimum_size, encodings=[compression.GZIP])
+        scope = {'type': 'http', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+        asyncio.run(middleware(scope, None, send))
+        return dict(messages[0]['headers']), [m['body'] for m in messages[1:]]
+
+    def test_negotiate(self):
+        encodings = [compression.ZSTD, compression.BROTLI, compression.GZIP]
+        self.assertEqual(compression.negotiate('gzip, deflate, br', encodings), compression.BROTLI)
+        self.assertEqual(compression.negotiate('gzip, br;q=0.5', encodings), compression.GZIP)
+        self.assertEqual(compression.negotiate('*, zstd;q=0', encodings), compression.BROTLI)
+        self.assertIsNone(compression.negotiate('identity', encodings))
+        self.assertIsNone(compression.negotiate(None, encodings))
+
+    def test_streamed_chunks_are_flushed(self):
+        chunks = [b'{"level": 95.3}\n' * 20, b'{"level": 95.2}\n' * 20, b'']
+        headers, bodies = self.run_app(chunks, 'gzip')
+        self.assertEqual(headers[b'content-encoding'], b'gzip')
+        self.assertNotIn(b'content-length', headers)
+        # Each chunk can be decompressed without the following chunks
+        self.assertEqual(zlib.decompressobj(31).decompress(bodies[0]), chunks[0])
+        self.assertEqual(gzip.decompress(b''.join(bodies)), b''.join(chunks))
+        self.assertGreaterEqual(compression.get_stats()[compression.GZIP]['bytes_in'], 640)
+
+    def test_small_response_is_not_compressed(self):
+        headers, bodies = self.run_app([b'{}'], 'gzip')
+        self.assertNotIn(b'content-encoding', headers)
+        self.assertEqual(bodies, [b'{}'])
+        headers, bodies = self.run_app([b'x' * 1000], 'identity')
+        self.assertNotIn(b'content-encoding', headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
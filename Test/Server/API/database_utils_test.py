@@ -0,0 +1,278 @@
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+import contextlib
+import io
+import os, sys
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+import pytz
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import analytics
+import database_utils as dbu
+
+
+def insert_test_series(db_conf, dt_start, count, sensor_name='left_tank', meas_point='raspi1'):
+    for i in range(count):
+        dbu.insert_value(db_conf, {
+            'datetime': (dt_start + timedelta(minutes=i)).isoformat(),
+            'meas_point': meas_point,
+            'sensor_name': sensor_name,
+            'tank_height': 155,
+            'max_val': 135,
+            'warn': 90,
+            'alarm': 70,
+            # Slow consumption with a refill in the middle
+            'values': [30.0 + 0.05 * i - (20.0 if i > count // 2 else 0.0) + 0.01 * np.sin(i)] * 3,
+        })
+
+
+class SqliteTestCase(unittest.TestCase):
+    """
+    Runs each test with its own SQLite files in a temporary directory.
+    """
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_conf = {'engine': 'sqlite', 'sqlite_path': self.tmp.name + '/'}
+        self.dt_start = datetime(2024, 12, 1, tzinfo=pytz.utc)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+class TestSqliteConnection(SqliteTestCase):
+    def test_tables_are_created_once_per_file(self):
+        path = self.db_conf['sqlite_path'] + '12-2024.sqlite'
+        with patch.object(dbu, 'create_sqlite_database', wraps=dbu.create_sqlite_database) as create:
+            for _ in range(3):
+                conn, cur = dbu.get_sqlite3_connection(path)
+                cur.execute("SELECT COUNT(*) FROM measurement")
+                conn.close()
+            self.assertEqual(create.call_count, 1)
+            # A removed file is created again
+            os.remove(path)
+            conn, cur = dbu.get_sqlite3_connection(path)
+            cur.execute("SELECT COUNT(*) FROM measurement")
+            conn.close()
+            self.assertEqual(create.call_count, 2)
+
+
+class TestUpdateDerivedMetrics(SqliteTestCase):
+    def read_derived(self):
+        conn = sqlite3.connect(self.db_conf['sqlite_path'] + '12-2024.sqlite')
+        rows = conn.execute(
+            "SELECT derivation, derivation_10, peaks_pos FROM derived_metrics ORDER BY dt"
+        ).fetchall()
+        conn.close()
+        return np.array(rows, dtype=float)
+
+    def full_metrics(self):
+        conn = sqlite3.connect(self.db_conf['sqlite_path'] + '12-2024.sqlite')
+        rows = dbu._sqlite_series_rows(conn.cursor(), 'raspi1', 'left_tank')
+        conn.close()
+        _, dts, vals = zip(*rows)
+        return analytics.compute_derivation_metrics(analytics.to_hours(dts), np.asarray(vals))
+
+    def test_incremental_update_matches_full_calculation(self):
+        insert_test_series(self.db_conf, self.dt_start, 150)
+        self.assertEqual(dbu.update_derived_metrics(self.db_conf), 150)
+        self.assertEqual(dbu.update_derived_metrics(self.db_conf), 0)
+
+        insert_test_series(self.db_conf, self.dt_start + timedelta(minutes=150), 5)
+        written = dbu.update_derived_metrics(self.db_conf, ['12-2024.sqlite'])
+        self.assertLess(written, 150)
+
+        stored = self.read_derived()
+        full = self.full_metrics()
+        self.assertEqual(len(stored), 155)
+        np.testing.assert_allclose(stored[:, 0], full['derivation'])
+        np.testing.assert_allclose(stored[:, 1], full['derivation_10'])
+        np.testing.assert_allclose(stored[:, 2], full['peaks_pos'])
+
+    def test_metrics_are_continuous_across_month_files(self):
+        dt_start = datetime(2024, 11, 30, 22, 0, tzinfo=pytz.utc)
+        insert_test_series(self.db_conf, dt_start, 130)
+        dbu.update_derived_metrics(self.db_conf)
+        insert_test_series(self.db_conf, dt_start + timedelta(minutes=130), 40)
+        dbu.update_derived_metrics(self.db_conf, ['12-2024.sqlite'])
+
+        stored, rows = [], []
+        for file_name in ('11-2024.sqlite', '12-2024.sqlite'):
+            conn = sqlite3.connect(self.db_conf['sqlite_path'] + file_name)
+            stored += conn.execute("SELECT derivation, derivation_10 FROM derived_metrics ORDER BY dt").fetchall()
+            rows += dbu._sqlite_series_rows(conn.cursor(), 'raspi1', 'left_tank')
+            conn.close()
+        _, dts, vals = zip(*rows)
+        full = analytics.compute_derivation_metrics(analytics.to_hours(dts), np.asarray(vals))
+        stored = np.array(stored, dtype=float)
+        self.assertEqual(len(stored), 170)
+        np.testing.assert_allclose(stored[:, 0], full['derivation'])
+        np.testing.assert_allclose(stored[:, 1], full['derivation_10'])
+
+    def test_short_series_are_skipped(self):
+        insert_test_series(self.db_conf, self.dt_start, 1)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(dbu.update_derived_metrics(self.db_conf), 0)
+        self.assertEqual(output.getvalue(), '')
+        insert_test_series(self.db_conf, self.dt_start + timedelta(minutes=1), analytics.SAVGOL_WINDOW)
+        self.assertEqual(dbu.update_derived_metrics(self.db_conf), analytics.SAVGOL_WINDOW + 1)
+
+    def test_events_are_updated_incrementally(self):
+        insert_test_series(self.db_conf, self.dt_start, 150)
+        dbu.update_derived_metrics(self.db_conf)
+        insert_test_series(self.db_conf, self.dt_start + timedelta(minutes=150), 30)
+        dbu.update_derived_metrics(self.db_conf)
+        incremental = dbu.get_events_from_sqlite_db(
+            self.db_conf, self.dt_start, self.dt_start + timedelta(days=1)
+        )['raspi1']['left_tank']
+
+        conn = sqlite3.connect(self.db_conf['sqlite_path'] + '12-2024.sqlite')
+        conn.execute("DELETE FROM derived_metrics")
+        conn.execute("DELETE FROM events")
+        conn.commit()
+        conn.close()
+        dbu.update_derived_metrics(self.db_conf)
+        full = dbu.get_events_from_sqlite_db(
+            self.db_conf, self.dt_start, self.dt_start + timedelta(days=1)
+        )['raspi1']['left_tank']
+
+        self.assertEqual(incremental, full)
+        refills = [e for e in full if e['event_type'] == 'refill']
+        self.assertGreater(refills[0]['volume'], 15)
+
+
+class TestGetMeasData(SqliteTestCase):
+    def test_get_meas_data_uses_stored_metrics(self):
+        insert_test_series(self.db_conf, self.dt_start, 120)
+        computed = dbu.get_meas_data_from_sqlite_db(
+            self.db_conf, self.dt_start - timedelta(minutes=1), self.dt_start + timedelta(days=1)
+        )
+        dbu.update_derived_metrics(self.db_conf)
+        stored = dbu.get_meas_data_from_sqlite_db(
+            self.db_conf, self.dt_start - timedelta(minutes=1), self.dt_start + timedelta(days=1)
+        )
+        self.assertEqual(list(stored.columns), list(computed.columns))
+        np.testing.assert_allclose(
+            stored['derivation_10'].to_numpy(dtype=float), computed['derivation_10'].to_numpy(dtype=float)
+        )
+
+    def test_get_meas_data_skips_bad_measurements(self):
+        insert_test_series(self.db_conf, self.dt_start, 10)
+        dbu.insert_value(self.db_conf, {
+            'datetime': (self.dt_start + timedelta(minutes=10)).isoformat(),
+            'meas_point': 'raspi1',
+            'sensor_name': 'left_tank',
+            'tank_height': 155,
+            'max_val': 135,
+            'warn': 90,
+            'alarm': 70,
+            'values': [0.0, 0.0, 0.0],
+        })
+        dt_end = self.dt_start + timedelta(days=1)
+        data = dbu.get_meas_data_from_sqlite_db(self.db_conf, self.dt_start - timedelta(minutes=1), dt_end)
+        self.assertEqual(len(data), 10)
+        data = dbu.get_meas_data_from_sqlite_db(
+            self.db_conf, self.dt_start - timedelta(minutes=1), dt_end, min_quality=analytics.QUALITY_BAD
+        )
+        self.assertEqual(len(data), 11)
+
+    def test_get_meas_data_filters(self):
+        insert_test_series(self.db_conf, self.dt_start, 10)
+        insert_test_series(self.db_conf, self.dt_start, 10, sensor_name='right_tank')
+        insert_test_series(self.db_conf, self.dt_start, 10, meas_point='raspi2')
+        dt_begin, dt_end = self.dt_start - timedelta(minutes=1), self.dt_start + timedelta(days=1)
+        data = dbu.get_meas_data_from_sqlite_db(self.db_conf, dt_begin, dt_end)
+        self.assertEqual(len(data), 30)
+        data = dbu.get_meas_data_from_sqlite_db(self.db_conf, dt_begin, dt_end, meas_point='raspi1')
+        self.assertEqual(sorted(data['sensorId'].unique()), ['left_tank', 'right_tank'])
+        data = dbu.get_meas_data_from_sqlite_db(
+            self.db_conf, dt_begin, dt_end, meas_point='raspi1', sensors=['right_tank']
+        )
+        self.assertEqual(list(data['sensorId'].unique()), ['right_tank'])
+        self.assertEqual(len(data), 10)
+
+
+class TestInsertValues(SqliteTestCase):
+    def test_insert_values_matches_insert_value(self):
+        dt_start = datetime(2024, 11, 30, 23, 55, tzinfo=pytz.utc)
+        insert_test_series(self.db_conf, dt_start, 10)
+        batch = []
+        for i in range(10):
+            batch.append({
+                'datetime': (dt_start + timedelta(minutes=i)).isoformat(), 'meas_point': 'raspi1',
+                'sensor_name': 'batch_tank', 'tank_height': 155, 'max_val': 135, 'warn': 90, 'alarm': 70,
+                'values': [30.0 + 0.05 * i - (20.0 if i > 5 else 0.0) + 0.01 * np.sin(i)] * 3,
+            })
+        qualities = [analytics.robust_estimate(m['values']) for m in batch]
+        # Values, which SQLite cannot store, fail this measurement only
+        batch[3] = {**batch[3], 'values': [object()]}
+        errors = dbu.insert_values(self.db_conf, batch, qualities)
+        self.assertEqual([e is None for e in errors], [True] * 3 + [False] + [True] * 6)
+        data = dbu.get_meas_data_from_sqlite_db(
+            self.db_conf, dt_start - timedelta(minutes=1), dt_start + timedelta(days=1)
+        )
+        single = data[data['sensorId'] == 'left_tank'].drop(index=3).reset_index(drop=True)
+        batched = data[data['sensorId'] == 'batch_tank'].reset_index(drop=True)
+        self.assertEqual(len(batched), 9)
+        pd.testing.assert_series_equal(single['value'], batched['value'])
+        pd.testing.assert_series_equal(single['dt'], batched['dt'])
+
+
+class TestMeasDataPages(SqliteTestCase):
+    def test_pages_match_full_query(self):
+        # The series crosses the month boundary, right_tank only exists in the second SQLite file
+        dt_start = datetime(2024, 12, 31, 23, 50, tzinfo=pytz.utc)
+        insert_test_series(self.db_conf, dt_start, 25)
+        insert_test_series(self.db_conf, dt_start + timedelta(minutes=15), 5, sensor_name='right_tank')
+        dt_begin, dt_end = dt_start - timedelta(minutes=1), dt_start + timedelta(days=1)
+        full = dbu.get_meas_data_from_sqlite_db(self.db_conf, dt_begin, dt_end)
+
+        pages = []
+        data, positions = dbu.get_meas_data_page_from_sqlite_db(self.db_conf, dt_begin, dt_end, 7)
+        pages.append(data)
+        self.assertEqual(positions[('raspi1', 'left_tank')][0], '12-2024')
+        while positions is not None:
+            data, positions = dbu.get_meas_data_page_from_sqlite_db(self.db_conf, dt_begin, dt_end, 7, positions)
+            self.assertLessEqual(data.groupby('sensorId').size().max(), 7)
+            pages.append(data)
+        self.assertEqual(len(pages), 4)
+        paged = pd.concat(pages, ignore_index=True).sort_values(['sensorId', 'dt'], ignore_index=True)
+        full = full.sort_values(['sensorId', 'dt'], ignore_index=True)
+        self.assertEqual(paged['dt'].tolist(), full['dt'].tolist())
+        self.assertEqual(paged['value'].tolist(), full['value'].tolist())
+
+
+class TestUpdateHourlyLevels(SqliteTestCase):
+    def test_hours_with_mixed_utc_offsets(self):
+        dt = datetime(2024, 12, 10, 14, 0, tzinfo=pytz.utc)
+        # Stored as 09:00-05:00, which sorts before the UTC bound of the hour as text
+        insert_test_series(self.db_conf, dt.astimezone(pytz.FixedOffset(-300)), 20)
+        dbu.update_hourly_levels(self.db_conf)
+        insert_test_series(self.db_conf, dt + timedelta(minutes=20), 10)
+        dbu.update_hourly_levels(self.db_conf, ['12-2024.sqlite'])
+        conn = sqlite3.connect(self.db_conf['sqlite_path'] + '12-2024.sqlite')
+        rows = conn.execute("SELECT hour, count FROM hourly_levels").fetchall()
+        conn.close()
+        self.assertEqual(rows, [(int(dt.timestamp()) // 3600, 30)])
+
+
+class TestDataVersion(SqliteTestCase):
+    def test_data_version_changes_with_writes(self):
+        insert_test_series(self.db_conf, self.dt_start, 10)
+        version = dbu.get_data_version(self.db_conf)
+        self.assertEqual(version, dbu.get_data_version(self.db_conf))
+        insert_test_series(self.db_conf, self.dt_start + timedelta(minutes=10), 1)
+        inserted = dbu.get_data_version(self.db_conf)
+        self.assertEqual(inserted[0][1], version[0][1] + 1)
+        dbu.update_derived_metrics(self.db_conf)
+        self.assertNotEqual(dbu.get_data_version(self.db_conf), inserted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from datetime import datetime, timedelta
+import os, sys
+import tempfile
+import pytz
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import analytics
+import forecast
+from database_utils_test import insert_test_series
+
+
+class TestForecast(unittest.TestCase):
+    def test_add_sample_updates_forecast(self):
+        dt_start = datetime(2024, 12, 1, tzinfo=pytz.utc)
+        for i in range(60):
+            forecast.add_sample('test_mp', 'test_sensor', dt_start + timedelta(minutes=i), 100 - i / 60, 90, 70)
+        self.assertEqual(forecast.get_forecast('test_mp', 'test_sensor')['rate'], -1.0)
+        self.assertIsNone(forecast.get_forecast('test_mp', 'unknown_sensor'))
+
+    def test_load_keeps_samples_of_inserts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_conf = {'engine': 'sqlite', 'sqlite_path': tmp + '/'}
+            dt_start = datetime.now(pytz.utc).replace(second=0, microsecond=0) - timedelta(minutes=90)
+            insert_test_series(db_conf, dt_start, 30, meas_point='forecast_load')
+            # An insert, which arrives before the windows are loaded after the startup
+            forecast.add_sample('forecast_load', 'left_tank', dt_start + timedelta(minutes=60), 100.0, 90, 70)
+            forecast.load_forecast_windows(db_conf)
+        window = forecast._windows[('forecast_load', 'left_tank')]
+        self.assertEqual(len(window), 31)
+        self.assertEqual(window[-1], (analytics.to_hour(dt_start + timedelta(minutes=60)), 100.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from datetime import datetime, timedelta
+import os, sys
+import pytz
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import health
+
+
+class TestHealth(unittest.TestCase):
+    def feed(self, sensor, levels, spread=0.05):
+        dt_start = datetime(2024, 12, 1, tzinfo=pytz.utc)
+        for i, level in enumerate(levels):
+            health.add_sample('health_mp', sensor, dt_start + timedelta(minutes=i), level, spread)
+        return dt_start + timedelta(minutes=len(levels))
+
+    def test_consuming_sensor_is_ok(self):
+        now = self.feed('ok_sensor', [100 - 0.02 * i for i in range(240)])
+        self.assertEqual(health.get_health('health_mp', 'ok_sensor', now)['status'], health.STATUS_OK)
+
+    def test_stuck_and_silent_sensor(self):
+        now = self.feed('stuck_sensor', [80.0] * 180)
+        self.assertEqual(health.get_health('health_mp', 'stuck_sensor', now)['issues'], ['stuck'])
+        later = health.get_health('health_mp', 'stuck_sensor', now + timedelta(hours=2))
+        self.assertEqual(later['issues'], ['stuck', 'silent'])
+
+    def test_noisy_sensor(self):
+        now = self.feed('noisy_sensor', [80 + 5 * (-1) ** i - 0.02 * i for i in range(120)])
+        self.assertEqual(health.get_health('health_mp', 'noisy_sensor', now)['status'], 'noisy')
+
+    def test_drifting_sensor_and_refills(self):
+        now = self.feed('drift_sensor', [50 + 0.01 * i for i in range(600)])
+        self.assertEqual(health.get_health('health_mp', 'drift_sensor', now)['status'], 'drifting')
+        levels = [100 - 0.02 * i for i in range(300)] + [100 + 20 * i for i in range(5)] + [200 - 0.02 * i for i in range(60)]
+        now = self.feed('refill_sensor', levels)
+        self.assertEqual(health.get_health('health_mp', 'refill_sensor', now)['status'], health.STATUS_OK)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from datetime import datetime, timedelta
+import os, sys
+import pytz
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import analytics
+import database_utils as dbu
+import latest
+from database_utils_test import SqliteTestCase, insert_test_series
+
+
+class TestLatestState(SqliteTestCase):
+    def test_latest_state_matches_database(self):
+        insert_test_series(self.db_conf, self.dt_start, 20, meas_point='latest_mp')
+        insert_test_series(self.db_conf, self.dt_start, 10, sensor_name='right_tank', meas_point='latest_mp')
+        latest.load_latest_state(self.db_conf)
+        self.assertEqual(
+            latest.get_last_meas_data()['latest_mp'],
+            dbu.get_last_meas_data_from_sqlite_db(self.db_conf)['latest_mp']
+        )
+        self.assertEqual(
+            latest.get_available_meas_points()['latest_mp'],
+            dbu.get_available_meas_points_from_sqlite_db(self.db_conf)['latest_mp']
+        )
+
+        measurement = {
+            'datetime': datetime.now(pytz.utc).isoformat(), 'meas_point': 'latest_mp', 'sensor_name': 'left_tank',
+            'tank_height': 155, 'max_val': 135, 'warn': 90, 'alarm': 70, 'values': [75.0] * 3,
+        }
+        latest.add_measurement(measurement, analytics.robust_estimate(measurement['values']))
+        older = {**measurement, 'datetime': self.dt_start.isoformat(), 'values': [10.0] * 3}
+        latest.add_measurement(older, analytics.robust_estimate(older['values']))
+        state = latest.get_last_meas_data()['latest_mp']['left_tank']
+        self.assertEqual((state['value'], state['color']), (80.0, 'warning'))
+
+    def test_version_changes_with_each_insert(self):
+        version = latest.get_version()
+        measurement = {
+            'datetime': (self.dt_start + timedelta(minutes=1)).isoformat(), 'meas_point': 'version_mp',
+            'sensor_name': 'left_tank', 'tank_height': 155, 'max_val': 135, 'warn': 90, 'alarm': 70,
+            'values': [75.0] * 3,
+        }
+        latest.add_measurement(measurement, analytics.robust_estimate(measurement['values']))
+        self.assertEqual(latest.get_version(), (version[0], version[1] + 1))
+        # A bad measurement adds its measurement point to the list of the measurement points
+        bad = {**measurement, 'meas_point': 'version_bad_mp', 'values': [0.0] * 3}
+        latest.add_measurement(bad, analytics.robust_estimate(bad['values']))
+        self.assertEqual(latest.get_version(), (version[0], version[1] + 2))
+        self.assertIn('version_bad_mp', latest.get_available_meas_points())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+import os, sys
+import subprocess
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import lazy
+
+
+class TestLazy(unittest.TestCase):
+    def test_module_is_imported_on_first_access(self):
+        module = lazy.LazyModule('colorsys')
+        self.assertFalse(lazy.loaded(module))
+        self.assertEqual(module.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertTrue(lazy.loaded(module))
+        self.assertIn('rgb_to_hsv', vars(module))
+
+    def test_api_modules_do_not_import_analytics_stack(self):
+        code = (
+            "import sys, database_utils, analytics, binary_formats, forecast, health, latest, leaks, live; "
+            "print(sorted(m for m in ('numpy', 'pandas', 'scipy', 'pymysql') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, '-c', code], cwd=module_path, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
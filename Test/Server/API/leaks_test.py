@@ -0,0 +1,42 @@
+import unittest
+from datetime import datetime, timedelta
+import os, sys
+import tempfile
+import pytz
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import database_utils as dbu
+import leaks
+
+
+class TestLeakDetection(unittest.TestCase):
+    def test_run_leak_detection(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_conf = {'engine': 'sqlite', 'sqlite_path': tmp + '/'}
+            dt_start = datetime(2024, 12, 1, tzinfo=pytz.utc)
+            for i in range(5 * 24 * 3):
+                dbu.insert_value(db_conf, {
+                    'datetime': (dt_start + timedelta(minutes=20 * i)).isoformat(),
+                    'meas_point': 'raspi1',
+                    'sensor_name': 'left_tank',
+                    'tank_height': 155,
+                    'max_val': 135,
+                    'warn': 90,
+                    'alarm': 70,
+                    'values': [30.0 + i / 3 * 0.3] * 3,
+                })
+            now = dt_start + timedelta(days=2, hours=12)
+            self.assertEqual(leaks.run_leak_detection(db_conf, 0.2, 3, 1, 5, 'UTC', now), (3, 1))
+            self.assertEqual(leaks.run_leak_detection(db_conf, 0.2, 3, 1, 5, 'UTC', now), (0, 0))
+            self.assertEqual(leaks.run_leak_detection(db_conf, 0.2, 3, 1, 5, 'UTC', now + timedelta(days=2)), (2, 2))
+            nights = dbu.get_night_baselines_from_sqlite_db(
+                db_conf, dt_start, dt_start + timedelta(days=10)
+            )['raspi1']['left_tank']
+            self.assertEqual([n['leak'] for n in nights], [False, False, True, True, True])
+            self.assertAlmostEqual(nights[0]['baseline'], 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
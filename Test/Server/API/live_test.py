@@ -0,0 +1,61 @@
+import unittest
+from datetime import datetime
+import asyncio
+import os, sys
+import pytz
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import analytics
+import live
+
+
+class TestLive(unittest.TestCase):
+    def measurement(self, meas_point, value):
+        return {
+            'datetime': datetime.now(pytz.utc).isoformat(), 'meas_point': meas_point, 'sensor_name': 'left_tank',
+            'tank_height': 155, 'max_val': 135, 'warn': 90, 'alarm': 70, 'values': [value] * 3,
+        }
+
+    def publish(self, meas_point, value):
+        measurement = self.measurement(meas_point, value)
+        live.publish(measurement, analytics.robust_estimate(measurement['values']))
+
+    def test_publish_to_subscribed_meas_points(self):
+        async def run():
+            everything = live.subscribe()
+            raspi2 = live.subscribe(['raspi2'])
+            try:
+                self.publish('raspi1', 75.0)
+                self.publish('raspi2', 30.0)
+                first = await everything.get()
+                self.assertEqual((first['meas_point'], first['value'], first['color']), ('raspi1', 80.0, 'warning'))
+                self.assertEqual((await everything.get())['meas_point'], 'raspi2')
+                event = await raspi2.get()
+                self.assertEqual((event['meas_point'], event['color']), ('raspi2', 'normal'))
+            finally:
+                live.unsubscribe(everything)
+                live.unsubscribe(raspi2)
+            self.assertEqual(live.subscriber_count(), 0)
+
+        asyncio.run(run())
+
+    def test_slow_subscriber_resyncs(self):
+        async def run():
+            subscriber = live.subscribe(buffer_size=3)
+            try:
+                for i in range(5):
+                    self.publish('raspi1', 30.0 + i)
+                event = await subscriber.get()
+                self.assertEqual((event['type'], event['dropped']), (live.RESYNC, 3))
+                values = [(await subscriber.get())['value'] for _ in range(2)]
+                self.assertEqual(values, [122.0, 121.0])
+            finally:
+                live.unsubscribe(subscriber)
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
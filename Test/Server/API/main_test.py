@@ -1,11 +1,30 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import asyncio
+import base64
+import configparser
+import json
 import os, sys
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import anyio
+from starlette.datastructures import QueryParams
 
 # Füge das Verzeichnis hinzu, in dem dein Modul liegt
 module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
 sys.path.insert(0, module_path)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Pi')))
+
+from database_utils_test import insert_test_series
 
 class TestSqliteGetMeasPointId(unittest.TestCase):
 
@@ -67,5 +86,440 @@ class TestSqliteGetMeasPointId(unittest.TestCase):
         mock_conn.commit.assert_called_once()
 
 
+
+class TestPskAuth(unittest.TestCase):
+    def write_key(self, directory, private_key, name):
+        from cryptography.hazmat.primitives import serialization
+        with open(f"{directory}/{name}.pem", "wb") as f:
+            f.write(private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            ))
+        return private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.OpenSSH,
+            format=serialization.PublicFormat.OpenSSH
+        ).decode("utf-8")
+
+    def test_mixed_rsa_and_ed25519_keys(self):
+        import base64
+        import tempfile
+        from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
+        from psk_auth import load_authorized_keys, verify_signature
+        from psk_sign import sign_meas_data
+
+        data = {'datetime': '2024-12-15T10:00:00', 'meas_point': 'raspi1', 'values': [31.3, 31.4]}
+        with tempfile.TemporaryDirectory() as tmp:
+            rsa_key = self.write_key(tmp, rsa.generate_private_key(public_exponent=65537, key_size=2048), 'raspi1')
+            ed_key = self.write_key(tmp, ed25519.Ed25519PrivateKey.generate(), 'raspi2')
+            with open(f"{tmp}/authorized_keys", "w") as f:
+                f.write(f"{rsa_key} raspi1\n{ed_key} raspi2\nssh-dss AAAAB3NzaC1kc3M raspi3\n")
+            authorized_keys = load_authorized_keys(f"{tmp}/authorized_keys")
+            self.assertEqual(sorted(authorized_keys), ['raspi1', 'raspi2'])
+
+            for client_id in ('raspi1', 'raspi2'):
+                payload = sign_meas_data(f"{tmp}/{client_id}.pem", data)
+                signature = base64.b64decode(payload['signature'])
+                self.assertTrue(verify_signature(authorized_keys[client_id], data, signature))
+                with self.assertRaises(ValueError):
+                    verify_signature(authorized_keys[client_id], {**data, 'values': [0.0]}, signature)
+            # A signature of one key type is rejected by the other
+            with self.assertRaises(ValueError):
+                verify_signature(authorized_keys['raspi1'], data, signature)
+
+
+api = None
+
+
+def api_directory(settings=None):
+    """
+    Creates a temporary directory with the configuration of the API (SQLite files, authorized key of
+    `raspi1`, log), like `Server`, and returns the directory, the configuration and the private key
+    of `raspi1`. `settings` overrides options of the configuration (`{section: {option: value}}`).
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+
+    directory = tempfile.mkdtemp()
+    server_path = os.path.join(module_path, '..')
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    public_key = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.OpenSSH, format=serialization.PublicFormat.OpenSSH
+    ).decode("utf-8")
+    with open(os.path.join(directory, 'authorized_keys'), 'w') as f:
+        f.write(f"{public_key} raspi1\n")
+    config = configparser.RawConfigParser()
+    config.read(os.path.join(server_path, 'config.cfg'))
+    config['database']['sqlite_path'] = os.path.join(directory, 'data') + '/'
+    config['API']['authorized_keys_file'] = os.path.join(directory, 'authorized_keys')
+    config['analytics']['derived_metrics'] = 'off'
+    config['analytics']['leak_detection'] = 'off'
+    for section, options in (settings or {}).items():
+        config[section].update(options)
+    with open(os.path.join(directory, 'config.cfg'), 'w') as f:
+        config.write(f)
+    shutil.copy(os.path.join(server_path, 'messages.json'), directory)
+    for name in ('API', 'data', 'log'):
+        os.makedirs(os.path.join(directory, name))
+    return directory, config, private_key
+
+
+def load_api():
+    """
+    Imports `main` once with a configuration in a temporary directory (see `api_directory`), like it is
+    started from `Server/API`, and returns the module, the directory and the private key of `raspi1`.
+    """
+    global api
+    if api is None:
+        directory, _, private_key = api_directory()
+        cwd = os.getcwd()
+        os.chdir(os.path.join(directory, 'API'))
+        try:
+            import main
+        finally:
+            os.chdir(cwd)
+        api = main, directory, private_key
+    return api
+
+
+
+def tearDownModule():
+    if api is not None:
+        shutil.rmtree(api[1], ignore_errors=True)
+
+class ApiTestCase(unittest.TestCase):
+    """
+    Runs the API with `fastapi.testclient.TestClient` (see `load_api`). Each test uses its own measurement
+    point, because the API keeps its state in memory between the tests.
+    """
+    @classmethod
+    def setUpClass(cls):
+        from fastapi.testclient import TestClient
+
+        cls.main, cls.directory, cls.private_key = load_api()
+        cls.client = TestClient(cls.main.app)
+        cls.client.__enter__()
+        cls.token = {'Authorization': f"Bearer {cls.main.config['API']['token']}"}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def sign(self, data):
+        return base64.b64encode(self.private_key.sign(json.dumps(data).encode("utf-8"))).decode()
+
+    def measurement(self, meas_point, dt, value=40.0, sensor_name='left_tank'):
+        return {
+            'datetime': dt.isoformat(), 'meas_point': meas_point, 'sensor_name': sensor_name,
+            'tank_height': 155, 'max_val': 135, 'warn': 90, 'alarm': 70, 'values': [value] * 3,
+        }
+
+    def insert_batch(self, measurements):
+        batch = {'client_id': 'raspi1', 'data': measurements, 'signature': self.sign(measurements)}
+        response = self.client.post('/insert_batch/', json=batch, headers=self.token)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def insert_series(self, meas_point, dt_start, count, sensors=('left_tank',)):
+        self.insert_batch([
+            self.measurement(meas_point, dt_start + timedelta(minutes=i), 40.0 + 0.1 * i, sensor)
+            for sensor in sensors for i in range(count)
+        ])
+
+
+class TestInsertBatch(ApiTestCase):
+    def test_batch_without_data_list_is_invalid_json(self):
+        for batch in ({'client_id': 'raspi1', 'signature': self.sign([])},
+                      {'client_id': 'raspi1', 'data': {'meas_point': 'batch'}, 'signature': self.sign([])}):
+            response = self.client.post('/insert_batch/', json=batch, headers=self.token)
+            self.assertEqual((response.status_code, response.json()['detail']), (406, "Invalid JSON Structure"))
+
+    def test_batch_updates_state_like_single_insert(self):
+        dt = datetime.now(timezone.utc).replace(microsecond=0)
+        single = self.measurement('batch_single', dt - timedelta(minutes=1))
+        payload = {'client_id': 'raspi1', 'data': single, 'signature': self.sign(single)}
+        response = self.client.post('/insert/', json=json.dumps(payload), headers=self.token)
+        self.assertEqual(response.status_code, 200, response.text)
+        result = self.insert_batch([self.measurement('batch_many', dt - timedelta(minutes=1)),
+                                    self.measurement('batch_many', dt, value=50.0)])
+        self.assertEqual((result['inserted'], result['rejected']), (2, 0))
+
+        latest = self.client.get('/v2/get_latest/').json()
+        self.assertEqual(latest['batch_single']['value'], [115.0])
+        self.assertEqual(latest['batch_many']['value'], [105.0])
+        inserted = self.main.MEASUREMENTS_INSERTED.samples()
+        self.assertIn(('', ('batch_many',), (), 2), inserted)
+        self.assertIn(('', ('batch_single',), (), 1), inserted)
+
+
+class TestResponseVersions(ApiTestCase):
+    def test_v2_is_plain_json_of_legacy_response(self):
+        self.insert_series('versions', datetime(2024, 11, 3, tzinfo=timezone.utc), 5)
+        request = {'dt_begin': '2024-11-03T00:00:00', 'dt_end': '2024-11-04T00:00:00', 'meas_point': 'versions'}
+        for path in ('get/', 'get_latest/', 'get_available_meas_points'):
+            legacy = self.client.post(f'/{path}', json=request)
+            plain = self.client.post(f'/v2/{path}', json=request)
+            self.assertEqual((legacy.status_code, plain.status_code), (200, 200))
+            # The legacy response is the pretty printed document encoded as a JSON string
+            self.assertIsInstance(legacy.json(), str)
+            self.assertIn('\n    ', legacy.json())
+            self.assertEqual(json.loads(legacy.json()), plain.json())
+            self.assertNotIn(b'\n', plain.content)
+        data = self.client.post('/v2/get/', json=request).json()
+        self.assertEqual([v['value'] for v in data['versions'][0]['values']], [115.0, 114.9, 114.8, 114.7, 114.6])
+
+
+class TestColumnsFormat(ApiTestCase):
+    def test_columns_match_rows(self):
+        self.insert_series('columns', datetime(2024, 11, 4, tzinfo=timezone.utc), 5, ('left_tank', 'right_tank'))
+        params = {'dt_begin': '2024-11-04T00:00:00', 'dt_end': '2024-11-05T00:00:00', 'meas_point': 'columns'}
+        rows = self.client.get('/v2/get/', params=params).json()['columns']
+        columns = self.client.get('/v2/get/', params={**params, 'format': 'columns'}).json()['columns']
+        self.assertEqual([s['sensorID'] for s in columns], [s['sensorID'] for s in rows])
+        for row_sensor, column_sensor in zip(rows, columns):
+            # Constant fields are sent once per sensor
+            self.assertEqual((column_sensor['tank_height'], column_sensor['warn'], column_sensor['alarm']), (155, 90, 70))
+            self.assertEqual(len(column_sensor['timestamp']), 5)
+            for i, row in enumerate(row_sensor['values']):
+                self.assertEqual(row, {key: column_sensor[key] if key in ('tank_height', 'max_val', 'warn', 'alarm')
+                                       else column_sensor[key][i] for key in row})
+            for i, row in enumerate(row_sensor['deriv']):
+                self.assertEqual(row, {'timestamp': column_sensor['timestamp'][i],
+                                       **{key: values[i] for key, values in column_sensor['deriv'].items()}})
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.post('/v2/get/', json={
+            'dt_begin': '2024-11-04T00:00:00', 'dt_end': '2024-11-05T00:00:00', 'format': 'cells'
+        })
+        self.assertEqual(response.status_code, 406)
+
+
+class TestNonBlocking(ApiTestCase):
+    def test_auth_failure_delay_does_not_block_other_requests(self):
+        result = {}
+
+        def bad_token_request():
+            start = time.perf_counter()
+            response = self.client.post('/insert_batch/', json={}, headers={'Authorization': 'Bearer wrong'})
+            result['status'], result['seconds'] = response.status_code, time.perf_counter() - start
+
+        with patch.object(self.main, 'AUTH_FAILURE_DELAY', 1.0):
+            thread = threading.Thread(target=bad_token_request)
+            thread.start()
+            time.sleep(0.1)
+            start = time.perf_counter()
+            self.assertEqual(self.client.get('/v2/get_latest/').status_code, 200)
+            latest_seconds = time.perf_counter() - start
+            self.assertTrue(thread.is_alive())
+            thread.join()
+        self.assertEqual(result['status'], 401)
+        self.assertGreaterEqual(result['seconds'], 1.0)
+        self.assertLess(latest_seconds, 0.5)
+
+    def test_blocking_work_is_limited_to_worker_threads(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def work():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        async def run_all():
+            await asyncio.gather(*(self.main.run_blocking(work) for _ in range(6)))
+
+        with patch.object(self.main, 'blocking_limiter', anyio.CapacityLimiter(2)):
+            self.client.portal.call(run_all)
+        self.assertEqual(running[1], 2)
+
+
+class TestConditionalRequests(ApiTestCase):
+    def test_get_etag_and_not_modified(self):
+        dt_start = datetime(2024, 11, 5, tzinfo=timezone.utc)
+        self.insert_series('conditional', dt_start, 5)
+        params = {'dt_begin': '2024-11-05T00:00:00', 'dt_end': '2024-11-06T00:00:00', 'meas_point': 'conditional'}
+        response = self.client.get('/v2/get/', params=params)
+        etag = response.headers['ETag']
+        max_age = self.main.config.getint('API', 'cache_max_age')
+        self.assertEqual(response.headers['Cache-Control'], f'public, max-age={max_age}')
+        self.assertTrue(etag.startswith('W/"'))
+
+        for if_none_match in (etag, etag.removeprefix('W/'), f'"other", {etag}', '*'):
+            response = self.client.get('/v2/get/', params=params, headers={'If-None-Match': if_none_match})
+            self.assertEqual((response.status_code, response.content), (304, b''))
+            self.assertEqual(response.headers['ETag'], etag)
+        # Other parameters or another representation have another ETag
+        self.assertNotEqual(self.client.get('/v2/get/', params={**params, 'format': 'columns'}).headers['ETag'], etag)
+        self.assertNotEqual(self.client.get('/get/', params=params).headers['ETag'], etag)
+        self.assertNotIn('ETag', self.client.post('/v2/get/', json=params).headers)
+
+        self.insert_series('conditional', dt_start + timedelta(minutes=5), 1)
+        response = self.client.get('/v2/get/', params=params, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(len(response.json()['conditional'][0]['values']), 6)
+
+    def test_invalid_query_parameters(self):
+        response = self.client.get('/v2/get/', params={'dt_begin': 'yesterday', 'dt_end': '2024-11-06T00:00:00'})
+        self.assertEqual((response.status_code, response.json()['detail']), (406, "Invalid Query Parameters"))
+
+    def test_etag_follows_insert_sequence_without_database(self):
+        dt = datetime.now(timezone.utc).replace(microsecond=0)
+        self.insert_batch([self.measurement('etag_sequence', dt - timedelta(minutes=1))])
+        # The ETag of the time dependent responses also changes every cache_max_age seconds
+        with patch.object(self.main.dbu, 'get_data_version') as get_data_version, \
+                patch.object(self.main.time, 'time', return_value=1735689600.0):
+            etags = {}
+            for path in ('/v2/get_latest/', '/v2/get_available_meas_points'):
+                response = self.client.get(path)
+                etags[path] = response.headers['ETag']
+                response = self.client.get(path, headers={'If-None-Match': etags[path]})
+                self.assertEqual(response.status_code, 304)
+            self.insert_batch([self.measurement('etag_sequence', dt)])
+            for path, etag in etags.items():
+                response = self.client.get(path, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response.headers['ETag'], etag)
+            get_data_version.assert_not_called()
+
+
+class TestPagination(ApiTestCase):
+    def insert_pages(self, meas_point):
+        self.insert_series(meas_point, datetime(2024, 11, 6, tzinfo=timezone.utc), 25, ('left_tank', 'right_tank'))
+        return {'dt_begin': '2024-11-06T00:00:00', 'dt_end': '2024-11-07T00:00:00', 'meas_point': meas_point}
+
+    def values(self, response):
+        self.assertEqual(response.status_code, 200, response.text)
+        return {s['sensorID']: s['values'] for s in next(iter(response.json().values()))}
+
+    def test_get_pages_follow_link_header(self):
+        params = self.insert_pages('pages_get')
+        full = self.values(self.client.get('/v2/get/', params=params))
+        pages, sizes = {}, []
+        url, params = '/v2/get/', {**params, 'page_size': 10}
+        while url:
+            response = self.client.get(url, params=params)
+            page = self.values(response)
+            for sensor, values in page.items():
+                pages.setdefault(sensor, []).extend(values)
+            sizes.append([len(values) for values in page.values()])
+            link = response.headers.get('Link')
+            self.assertEqual(link is None, 'Next-Cursor' not in response.headers)
+            url, params = (link[1:link.index('>')], None) if link else (None, None)
+        self.assertEqual(sizes, [[10, 10], [10, 10], [5, 5]])
+        self.assertEqual(pages, full)
+
+    def test_post_pages_with_next_cursor(self):
+        request = self.insert_pages('pages_post')
+        full = self.values(self.client.post('/v2/get/', json=request))
+        pages = {}
+        request['page_size'] = 7
+        while True:
+            response = self.client.post('/v2/get/', json=request)
+            for sensor, values in self.values(response).items():
+                pages.setdefault(sensor, []).extend(values)
+            if 'Next-Cursor' not in response.headers:
+                break
+            self.assertNotIn('Link', response.headers)
+            request['cursor'] = response.headers['Next-Cursor']
+        self.assertEqual(pages, full)
+
+    def test_invalid_cursor_and_combinations(self):
+        params = {'dt_begin': '2024-11-06T00:00:00', 'dt_end': '2024-11-07T00:00:00'}
+        for extra in ({'page_size': 10, 'cursor': 'not-a-cursor'}, {'cursor': 'abc'}, {'page_size': 10, 'resample': 5}):
+            response = self.client.get('/v2/get/', params={**params, **extra})
+            self.assertEqual(response.status_code, 406, extra)
+
+
+class TestLiveWebsocket(ApiTestCase):
+    class FakeWebSocket:
+        """
+        Stands in for the `WebSocket` of the endpoint, so the test decides when client frames arrive.
+        """
+        def __init__(self, query_string):
+            self.query_params = QueryParams(query_string)
+            self.frames = asyncio.Queue()
+            self.sent = []
+
+        async def accept(self):
+            pass
+
+        async def receive(self):
+            return await self.frames.get()
+
+        async def send_text(self, text):
+            self.sent.append(json.loads(text))
+
+    def test_event_is_sent_when_a_client_frame_arrives_at_once(self):
+        live = self.main.live
+        measurement = self.measurement('ws_race', datetime.now(timezone.utc), 50.0)
+
+        async def run():
+            websocket = self.FakeWebSocket('meas_point=ws_race')
+            handler = asyncio.ensure_future(self.main.live_websocket(websocket))
+            await asyncio.sleep(0.05)
+            # The frame and the event wake the endpoint in the same iteration of the event loop
+            websocket.frames.put_nowait({'type': 'websocket.receive', 'text': 'ping'})
+            live.publish(measurement, self.main.analytics.robust_estimate(measurement['values']))
+            await asyncio.sleep(0.05)
+            websocket.frames.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+            await asyncio.wait_for(handler, 5)
+            return websocket.sent
+
+        sent = self.client.portal.call(run)
+        self.assertEqual([event['meas_point'] for event in sent], ['ws_race'])
+        self.assertEqual(live.subscriber_count(), 0)
+
+
+class TestScriptStart(unittest.TestCase):
+    def test_pool_workers_do_not_import_main(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        directory, config, _ = api_directory({
+            'API': {'port': str(port)}, 'analytics': {'pool_size': '1', 'pool_min_rows': '1'},
+        })
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # Two sensors without stored metrics, so /v2/get/ calculates the metrics in the process pool
+        dt_start = datetime(2024, 12, 1, tzinfo=timezone.utc)
+        for sensor_name in ('left_tank', 'right_tank'):
+            insert_test_series(config['database'], dt_start, 50, sensor_name)
+
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(module_path, 'main.py')], cwd=os.path.join(directory, 'API'),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}/v2/get/", method='POST',
+                data=json.dumps({'dt_begin': '2024-12-01T00:00:00', 'dt_end': '2024-12-02T00:00:00'}).encode(),
+                headers={'Content-Type': 'application/json'},
+            )
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        data = json.loads(response.read())
+                    break
+                except (ConnectionError, urllib.error.URLError):
+                    if time.monotonic() > deadline or process.poll() is not None:
+                        raise
+                    time.sleep(0.2)
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.assertEqual([len(sensor['deriv']) for sensor in data['raspi1']], [50, 50])
+        # main logs its start when it is imported, the spawned pool worker must not import it again
+        with open(os.path.join(directory, 'log', 'API.log')) as f:
+            self.assertEqual(f.read().count('Wassermonitor2 starting'), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import patch
+import os, sys
+import tempfile
+import threading
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import database_utils as dbu
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        # Only the metrics of the test are rendered, not the ones of the API modules imported by other test modules
+        registry = patch.object(metrics, '_registry', [])
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def test_counts_of_all_threads_are_added_up(self):
+        counter = metrics.Counter('test_requests_total', 'Test counter.', ['route'])
+        histogram = metrics.Histogram('test_duration_seconds', 'Test histogram.', ['route'], buckets=(0.1, 1.0))
+
+        def count():
+            for value in (0.05, 0.5, 5.0):
+                counter.inc('/get/')
+                histogram.observe(value, '/get/')
+
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        count()
+
+        text = metrics.render().decode()
+        self.assertIn('test_requests_total{route="/get/"} 15', text)
+        self.assertIn('test_duration_seconds_bucket{route="/get/",le="0.1"} 5', text)
+        self.assertIn('test_duration_seconds_bucket{route="/get/",le="1.0"} 10', text)
+        self.assertIn('test_duration_seconds_bucket{route="/get/",le="+Inf"} 15', text)
+        self.assertIn('test_duration_seconds_count{route="/get/"} 15', text)
+        self.assertIn('# TYPE test_duration_seconds histogram', text)
+
+    def test_sqlite_statements_are_timed_per_function(self):
+        with tempfile.TemporaryDirectory() as path:
+            conn, cur = dbu.get_sqlite3_connection(path + '/test.sqlite')
+            cur.execute("SELECT COUNT(*) FROM measurement")
+            cur.fetchall()
+            conn.close()
+        samples = {(labels, suffix): value for suffix, labels, _, value in dbu.SQLITE_SECONDS.samples()}
+        function = 'test_sqlite_statements_are_timed_per_function'
+        self.assertGreater(samples[((function, 'execute'), '_count')], 1)
+        self.assertEqual(samples[((function, 'fetch'), '_count')], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
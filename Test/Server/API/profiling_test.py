@@ -0,0 +1,61 @@
+import unittest
+import asyncio
+import json
+import os, sys
+import tempfile
+import time
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    def run_app(self, middleware_args):
+        async def app(scope, receive, send):
+            await receive()
+            start = time.perf_counter()
+            time.sleep(0.01)
+            profiling.record_phase('query', start)
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'{}'})
+
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'{"dt_begin": "2024-12-01T00:00:00"}', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = profiling.ProfilingMiddleware(app, **middleware_args)
+        scope = {'type': 'http', 'method': 'POST', 'path': '/v2/get/', 'query_string': b'', 'headers': []}
+        asyncio.run(middleware(scope, receive, send))
+        return dict(messages[0]['headers'])[b'server-timing'].decode()
+
+    def test_server_timing_header(self):
+        timing = self.run_app({})
+        self.assertRegex(timing, r'^query;dur=\d+\.\d, app;dur=\d+\.\d$')
+        # Outside of a request the phases are not recorded
+        profiling.record_phase('query', time.perf_counter())
+
+    def test_slow_requests_are_captured(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for _ in range(3):
+                self.run_app({
+                    'enable': True, 'slow_threshold': 0, 'directory': directory, 'max_captures': 2,
+                    'sample_interval': 1, 'trace_memory': False,
+                })
+            captures = sorted(x for x in os.listdir(directory) if x.endswith('.json'))
+            self.assertEqual(len(captures), 2)
+            self.assertEqual(len(os.listdir(directory)), 4)
+            with open(os.path.join(directory, captures[-1])) as f:
+                capture = json.load(f)
+        self.assertEqual(capture['path'], '/v2/get/')
+        self.assertIn('dt_begin', capture['body'])
+        self.assertGreaterEqual(capture['phases_ms']['query'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
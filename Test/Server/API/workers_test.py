@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import patch
+import json
+import multiprocessing
+import os, sys
+import tempfile
+import threading
+
+module_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../Server/API'))
+sys.path.insert(0, module_path)
+
+import metrics
+import workers
+
+
+def publish_from_other_worker(path, measurements):
+    workers.SharedStore(path).publish([(m, {'value': 1.0, 'quality': 2}) for m in measurements])
+
+
+class TestWorkers(unittest.TestCase):
+    def test_inserts_of_other_workers_are_fetched_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shared.sqlite')
+            store = workers.SharedStore(path)
+            store.publish([({'meas_point': 'own'}, {'value': 1.0, 'quality': 2})])
+            process = multiprocessing.get_context('spawn').Process(
+                target=publish_from_other_worker, args=(path, [{'meas_point': 'raspi1'}, {'meas_point': 'raspi2'}])
+            )
+            process.start()
+            process.join()
+            fetched = store.fetch()
+            self.assertEqual([m['meas_point'] for m, _ in fetched], ['raspi1', 'raspi2'])
+            self.assertEqual(store.fetch(), [])
+
+    def test_metrics_of_other_workers_are_added_up(self):
+        # Only the metrics of the test, not the ones of the API modules imported by other test modules
+        with patch.object(metrics, '_registry', []):
+            counter = metrics.Counter('test_workers_total', 'Test counter.', ['route'])
+            histogram = metrics.Histogram('test_workers_seconds', 'Test histogram.', buckets=(0.1, 1.0))
+            metrics.GaugeCallback('test_workers_files', 'Test shared gauge.', lambda: 3, shared=True)
+            counter.inc('/get/', amount=2)
+            histogram.observe(0.5)
+            other = json.loads(json.dumps(metrics.snapshot()))
+            other['test_workers_total']['samples'].append(['', ['/insert/'], [], 1])
+
+            text = metrics.render([other]).decode()
+            self.assertIn('test_workers_total{route="/get/"} 4', text)
+            self.assertIn('test_workers_total{route="/insert/"} 1', text)
+            self.assertIn('test_workers_files 3\n', text)
+            buckets = [line for line in text.splitlines() if line.startswith('test_workers_seconds_bucket')]
+            self.assertEqual(buckets, [
+                'test_workers_seconds_bucket{le="0.1"} 0',
+                'test_workers_seconds_bucket{le="1.0"} 2',
+                'test_workers_seconds_bucket{le="+Inf"} 2',
+            ])
+
+    def test_process_lock_is_reentrant(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lock = workers.ProcessLock(os.path.join(directory, 'write.lock'))
+            acquired = []
+            with lock:
+                with lock:
+                    thread = threading.Thread(target=lambda: acquired.append(lock._lock.acquire(timeout=0.1)))
+                    thread.start()
+                    thread.join()
+            self.assertEqual(acquired, [False])
+            self.assertTrue(workers.try_lock(os.path.join(directory, 'background.lock')))
+            os.close(workers._held_lock)
+            workers._held_lock = None
+
+
+if __name__ == '__main__':
+    unittest.main()